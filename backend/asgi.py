@@ -0,0 +1,306 @@
+# backend/asgi.py
+import asyncio
+import contextlib
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import func, select
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_accept_header
+from changes import FEED_COLUMNS, MAX_CHANGES, change_feed, feed_row
+from database import async_engine
+from export import EXPORT_FORMATS, EXPORTS, encode_rows, export_headers, gzip_compressor, YIELD_PER
+from hierarchy import build_tree
+from init import create_app
+from match_index import open_aliases
+from models import CacheVersion, PayerGroup
+from pagination import ESTIMATE_COUNT, cache_count, cached_count, page_args, page_meta, parse_cursor, slice_sorted, \
+    wants_exact_total
+from payer_cache import ALIASES, PAYERS, load_snapshot
+from resolver import MAX_RESOLVE_ITEMS, Resolver, best_matches, check_reference, reference_key
+
+FUZZY_CHUNK = 64  # Names per process pool task
+
+flask_app = create_app()
+
+
+class Serving:
+    """Per-process state of the async app: the asyncpg engine, fuzzy scoring workers and work in flight.
+
+    Work is shared by key while it runs, so concurrent requests for the same
+    payers version, listing page or fuzzy name wait on one computation.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.engine = None
+        self.pool = None
+        self.resolver = None
+        self.inflight = {}
+        self.tasks = set()
+        self.fuzzy_cache = OrderedDict()
+
+    def start(self):
+        self.engine = async_engine(self.config)
+        self.workers = self.config.get('FUZZY_WORKERS') or os.cpu_count()
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def stop(self):
+        self.pool.shutdown(cancel_futures=True)
+        await self.engine.dispose()
+
+    async def share(self, key, compute):
+        """Await compute(), or the call already running under key"""
+        future = self.inflight.get(key)
+        if future is None:
+            future = self.inflight[key] = asyncio.ensure_future(compute())
+            future.add_done_callback(lambda done: self._settled(key, done))
+        return await asyncio.shield(future)
+
+    def _settled(self, key, future):
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+
+    async def current(self):
+        """Resolver over the current payer snapshot and aliases, see payer_cache.payer_snapshot"""
+        versions = await self.share('versions', self._read_versions)
+        current = self.resolver
+        if current is None or (current.snapshot.version, current.aliases.version) != versions:
+            await self.share(('snapshot', versions), lambda: self._load(*versions))
+        return self.resolver
+
+    async def _read_versions(self):
+        async with self.engine.connect() as conn:
+            found = dict((await conn.execute(
+                select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_((PAYERS, ALIASES)))
+            )).all())
+        return found.get(PAYERS) or 0, found.get(ALIASES) or 0
+
+    async def _load(self, version, aliases_version):
+        # A new mapping only moves the aliases, the payer snapshot, fuzzy cache and workers' files stay as they are
+        previous = self.resolver
+        snapshot, aliases = (previous.snapshot, previous.aliases) if previous is not None else (None, None)
+        if aliases is None or aliases.version != aliases_version:
+            aliases = await asyncio.to_thread(self._open, open_aliases, aliases_version)
+        if snapshot is None or snapshot.version != version:
+            snapshot = await asyncio.to_thread(self._open, load_snapshot, version)
+            self.fuzzy_cache.clear()
+            for _ in range(self.workers):
+                self.pool.submit(best_matches, snapshot.by_id.path, version, [])  # Map the new file in the workers ahead of use
+        self.resolver = Resolver(snapshot, aliases, self.config.get('RESOLVE_CACHE_SIZE', 65536))
+
+    def _open(self, load, version):
+        # Maps the shared index or alias file, writing it through the sync pool when missing or stale
+        with flask_app.app_context():
+            return load(version)
+
+    async def resolve(self, references):
+        """Resolver.resolve for each checked reference, fuzzy misses scored in the process pool"""
+        current = await self.current()
+        keys = [reference_key(item.get('payer_id'), item.get('payer_name')) for item in references]
+        found = {key: current.exact(*key) for key in dict.fromkeys(keys)}
+        scored = await self.fuzzy(current, [name for (_, name), hit in found.items() if hit is None])
+        return [current.result(*(found[key] or scored[key[1]])) for key in keys]
+
+    async def fuzzy(self, current, names):
+        """{name: (position, confidence, match)}, from the cache, a chunk already in flight or new pool tasks"""
+        version = current.snapshot.version
+        scored, waits, todo = {}, {}, []
+        for name in dict.fromkeys(names):
+            cached = self.fuzzy_cache.get(name) if current is self.resolver else None
+            if not name:
+                scored[name] = None, 0, None
+            elif cached is not None:
+                self.fuzzy_cache.move_to_end(name)
+                scored[name] = cached
+            elif ('fuzzy', version, name) in self.inflight:
+                waits[name] = self.inflight[('fuzzy', version, name)]
+            else:
+                todo.append(name)
+
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(todo), FUZZY_CHUNK):
+            chunk = todo[start:start + FUZZY_CHUNK]
+            futures = [loop.create_future() for _ in chunk]
+            for name, future in zip(chunk, futures):
+                self.inflight[('fuzzy', version, name)] = waits[name] = future
+            task = asyncio.ensure_future(self._score(current, chunk, futures))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        results = await asyncio.gather(*map(asyncio.shield, waits.values()))
+        scored.update(zip(waits, results))
+        return scored
+
+    async def _score(self, current, names, futures):
+        version = current.snapshot.version
+        try:
+            file_version, matches = await asyncio.get_running_loop().run_in_executor(
+                self.pool, best_matches, current.snapshot.by_id.path, version, names
+            )
+            if file_version == version:
+                results = [current.fuzzy_found(*match) for match in matches]
+            else:
+                # The index file moved on since this snapshot mapped it, score against the snapshot itself
+                results = await asyncio.to_thread(lambda: [current.fuzzy(name) for name in names])
+        except Exception as e:
+            results = None
+            for future in futures:
+                future.set_exception(e)
+        for i, (name, future) in enumerate(zip(names, futures)):
+            self._settled(('fuzzy', version, name), future)
+            if results is not None:
+                future.set_result(results[i])
+                if self.resolver is current:
+                    self.fuzzy_cache[name] = results[i]
+        while len(self.fuzzy_cache) > self.config.get('RESOLVE_CACHE_SIZE', 65536):
+            self.fuzzy_cache.popitem(last=False)
+
+
+serving = Serving(flask_app.config)
+
+
+def _page(args, default_per_page, kind):
+    try:
+        per_page, cursor, page = page_args(args, default_per_page)
+        return per_page, parse_cursor(cursor, kind) if cursor else None, page
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+async def _json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400, "Request body must be JSON")
+
+async def _total(conn, args, name, table, count):
+    """pagination.total_count over an async connection, sharing its cache with the Flask routes"""
+    if wants_exact_total(args):
+        return await conn.scalar(count)
+    total = cached_count(name)
+    if total is not None:
+        return total
+    total = await conn.scalar(ESTIMATE_COUNT, {"table": table})
+    if total is None or total <= 0:
+        total = await conn.scalar(count)
+    return cache_count(name, total)
+
+def _stream(request, name, statement, columns, transform=None):
+    """export.stream_export off an asyncpg server-side cursor, YIELD_PER rows per chunk"""
+    export_format = request.query_params.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    compress = parse_accept_header(request.headers.get('accept-encoding')).quality('gzip') > 0
+
+    async def generate():
+        compressor = gzip_compressor() if compress else None
+        encode = (lambda chunk: compressor.compress(chunk.encode())) if compress else str.encode
+        yield encode(encode_rows((), columns, export_format, header=True))
+        async with serving.engine.connect() as conn:
+            result = await conn.stream(statement.execution_options(yield_per=YIELD_PER))
+            async for rows in result.partitions():
+                yield encode(encode_rows(map(transform, rows) if transform else rows, columns, export_format))
+        if compress:
+            yield compressor.flush()
+
+    return StreamingResponse(generate(), media_type=EXPORT_FORMATS[export_format],
+                             headers=export_headers(name, export_format, compress))
+
+
+async def get_payers(request):
+    # Same payload as routes.get_payers, the version check is shared by concurrent requests
+    per_page, cursor, page = _page(request.query_params, 10, str)
+    snapshot = (await serving.current()).snapshot
+    payer_ids, meta = slice_sorted(snapshot.ids, per_page, cursor, page)
+    return JSONResponse({
+        "payers": [{
+            "payer_id": p.payer_id,
+            "payer_name": p.payer_name,
+            "pretty_name": p.pretty_name,
+            "group_id": p.group_id
+        } for p in map(snapshot.by_id.__getitem__, payer_ids)],
+        "total": len(snapshot.ids),
+        **meta
+    })
+
+async def get_groups(request):
+    # Identical concurrent requests share one query
+    args = request.query_params
+    per_page, cursor, page = _page(args, 1000, str)
+
+    async def compute():
+        statement = select(PayerGroup.group_id, PayerGroup.group_name, PayerGroup.parent_group_id) \
+            .order_by(PayerGroup.group_id).limit(per_page)
+        if cursor is not None:
+            statement = statement.where(PayerGroup.group_id > cursor)
+        else:
+            statement = statement.offset((page - 1) * per_page)
+        async with serving.engine.connect() as conn:
+            rows = (await conn.execute(statement)).all()
+            total = await _total(conn, args, 'groups', 'payer_groups', select(func.count()).select_from(PayerGroup))
+        return {"groups": build_tree(rows), "total": total, **page_meta(rows, lambda row: row[0], page, per_page)}
+
+    return JSONResponse(await serving.share(('GET', str(request.url)), compute))
+
+async def export_payers(request):
+    return _stream(request, 'payers', *EXPORTS['payers'])
+
+async def export_details(request):
+    return _stream(request, 'details', *EXPORTS['details'])
+
+async def get_changes(request):
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = int(request.query_params.get('limit', MAX_CHANGES))
+    except ValueError:
+        raise HTTPException(400, "since and limit must be integers")
+    if since < 0 or not 0 < limit <= MAX_CHANGES:
+        raise HTTPException(400, f"since must be >= 0 and limit between 1 and {MAX_CHANGES}")
+    return _stream(request, 'changes', change_feed(since, limit), FEED_COLUMNS, feed_row)
+
+async def resolve(request):
+    data = await _json(request)
+    error = check_reference(data)
+    if error:
+        raise HTTPException(400, error)
+    (result,) = await serving.resolve([data])
+    return JSONResponse(result)
+
+async def resolve_batch(request):
+    # Distinct fuzzy names are scored FUZZY_CHUNK at a time across the worker processes
+    data = await _json(request)
+    references = data.get('references') if isinstance(data, dict) else None
+    if not isinstance(references, list):
+        raise HTTPException(400, "references must be a list")
+    if len(references) > MAX_RESOLVE_ITEMS:
+        raise HTTPException(400, f"At most {MAX_RESOLVE_ITEMS} references per request")
+    errors = [check_reference(item) for item in references]
+    resolved = iter(await serving.resolve([item for item, error in zip(references, errors) if not error]))
+    return JSONResponse({"results": [{"error": error} if error else next(resolved) for error in errors]})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    serving.start()
+    yield
+    await serving.stop()
+
+app = Starlette(routes=[
+    Route('/api/payers', get_payers, methods=['GET']),
+    Route('/api/groups', get_groups, methods=['GET']),
+    Route('/api/export/payers', export_payers, methods=['GET']),
+    Route('/api/export/details', export_details, methods=['GET']),
+    Route('/api/changes', get_changes, methods=['GET']),
+    Route('/api/resolve', resolve, methods=['POST']),
+    Route('/api/resolve/batch', resolve_batch, methods=['POST']),
+    Mount('/', WSGIMiddleware(flask_app)),  # Everything else, writes included, stays on the Flask routes
+], middleware=[
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])  # As flask_cors does
+], lifespan=lifespan)
\ No newline at end of file
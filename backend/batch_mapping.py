@@ -0,0 +1,186 @@
+# backend/batch_mapping.py
+from sqlalchemy import Integer, String, bindparam, column, select, update, values
+from candidates import mark_manual_many
+from changes import CHANGE_DETAIL, lock_changes, record_changes
+from models import db, PayerDetail
+from payer_cache import ALIASES, bump_version, payer_snapshot
+
+MAX_BATCH_ITEMS = 50000
+CHUNK_SIZE = 1000
+
+STATUS_MAPPED = 'mapped'
+STATUS_INVALID = 'invalid'
+STATUS_UNKNOWN_PAYER = 'unknown_payer'
+STATUS_UNKNOWN_DETAIL = 'unknown_detail'
+STATUS_SUPERSEDED = 'superseded'
+STATUS_NO_MATCH = 'no_match'
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _check_pair(item):
+    """Result stub for one {detail_id, payer_id} pair, status None while it is still valid"""
+    result = {'detail_id': None, 'payer_id': None, 'status': STATUS_INVALID}
+    if not isinstance(item, dict):
+        return result
+    result['detail_id'], result['payer_id'] = item.get('detail_id'), item.get('payer_id')
+    try:
+        detail_id = int(result['detail_id'])
+    except (TypeError, ValueError):
+        return result
+    if not isinstance(result['payer_id'], str) or not result['payer_id']:
+        return result
+    result['detail_id'], result['status'] = detail_id, None
+    return result
+
+def _check_rule(rule):
+    """Result stub for one {payer_name, source, payer_id} rule, source may be omitted to match any"""
+    result = {'payer_name': None, 'source': None, 'payer_id': None, 'status': STATUS_INVALID, 'mapped': 0}
+    if not isinstance(rule, dict):
+        return result
+    for key in ('payer_name', 'source', 'payer_id'):
+        result[key] = rule.get(key)
+    if not isinstance(result['payer_name'], str) or not result['payer_name']:
+        return result
+    if not isinstance(result['payer_id'], str) or not result['payer_id']:
+        return result
+    if result['source'] is not None and not isinstance(result['source'], str):
+        return result
+    result['status'] = None
+    return result
+
+def _load_payer_names(payer_ids):
+    by_id = payer_snapshot().by_id
+    return {payer_id: by_id[payer_id].payer_name for payer_id in payer_ids if payer_id in by_id}
+
+def _latest_wins(results, key_of):
+    """Keep the last valid result per key, marking earlier ones superseded, and return them by key"""
+    latest = {}
+    for result in results:
+        if result['status'] is None:
+            key = key_of(result)
+            if key in latest:
+                latest[key]['status'] = STATUS_SUPERSEDED
+            latest[key] = result
+    return latest
+
+def _set_payer_ids(rows):
+    """executemany UPDATE of (detail_id, payer_id) rows keyed on detail_id, for dialects without UPDATE ... FROM (VALUES ...)"""
+    details = PayerDetail.__table__
+    if rows:
+        db.session.execute(
+            update(details).where(details.c.detail_id == bindparam('b_detail_id')).values(payer_id=bindparam('b_payer_id')),
+            [{'b_detail_id': detail_id, 'b_payer_id': payer_id} for detail_id, payer_id in rows]
+        )
+
+def _select_rule_matches(chunk, with_source):
+    """(detail_id, payer_name, rule, payer_id) of the details a chunk of rules matches, found with a SELECT"""
+    details = PayerDetail.__table__
+    rules = {(r['payer_name'], r['source'] if with_source else None): (index, r['payer_id']) for index, r in chunk}
+    found = db.session.execute(select(details.c.detail_id, details.c.payer_name, details.c.source).where(
+        details.c.payer_name.in_({r['payer_name'] for _, r in chunk})
+    ))
+    return [(detail_id, payer_name, *rules[key]) for detail_id, payer_name, source in found
+            if (key := (payer_name, source if with_source else None)) in rules]
+
+def _update_from_rules(rules, with_source):
+    """One UPDATE ... FROM (VALUES ...) per chunk of rules on PostgreSQL, returning (detail_id, payer_name, rule, payer_id)"""
+    details = PayerDetail.__table__
+    from_values = db.session.connection().dialect.name == 'postgresql'
+    rows = []
+    for chunk in _chunks(rules):
+        if not from_values:
+            # SQLite: find the matches, then update them by detail_id
+            matches = _select_rule_matches(chunk, with_source)
+            _set_payer_ids([(detail_id, payer_id) for detail_id, _, _, payer_id in matches])
+            rows.extend(matches)
+            continue
+        if with_source:
+            batch = values(
+                column('rule', Integer), column('payer_name', String), column('source', String),
+                column('payer_id', String), name='batch_rules'
+            ).data([(index, r['payer_name'], r['source'], r['payer_id']) for index, r in chunk])
+            matches = (details.c.payer_name == batch.c.payer_name) & (details.c.source == batch.c.source)
+        else:
+            batch = values(
+                column('rule', Integer), column('payer_name', String), column('payer_id', String), name='batch_rules'
+            ).data([(index, r['payer_name'], r['payer_id']) for index, r in chunk])
+            matches = details.c.payer_name == batch.c.payer_name
+        rows.extend(db.session.execute(
+            update(details).where(matches).values(payer_id=batch.c.payer_id).returning(
+                details.c.detail_id, details.c.payer_name, batch.c.rule, batch.c.payer_id
+            )
+        ))
+    return rows
+
+def _update_from_pairs(pairs):
+    """One UPDATE ... FROM (VALUES ...) per chunk of pairs on PostgreSQL, returning (detail_id, payer_name, payer_id)"""
+    details = PayerDetail.__table__
+    from_values = db.session.connection().dialect.name == 'postgresql'
+    rows = []
+    for chunk in _chunks(pairs):
+        if not from_values:
+            # SQLite: read the names of the details that exist, then update them by detail_id
+            payer_ids = {p['detail_id']: p['payer_id'] for p in chunk}
+            found = db.session.execute(select(details.c.detail_id, details.c.payer_name).where(
+                details.c.detail_id.in_(payer_ids)
+            )).all()
+            _set_payer_ids([(detail_id, payer_ids[detail_id]) for detail_id, _ in found])
+            rows.extend((detail_id, payer_name, payer_ids[detail_id]) for detail_id, payer_name in found)
+            continue
+        batch = values(
+            column('detail_id', Integer), column('payer_id', String), name='batch_pairs'
+        ).data([(p['detail_id'], p['payer_id']) for p in chunk])
+        rows.extend(db.session.execute(
+            update(details).where(details.c.detail_id == batch.c.detail_id).values(
+                payer_id=batch.c.payer_id
+            ).returning(details.c.detail_id, details.c.payer_name, batch.c.payer_id)
+        ))
+    return rows
+
+def apply_batch(pairs, rules):
+    """Map details from explicit pairs and name/source rules in set-based UPDATEs; the caller commits.
+
+    Rules run first (any-source rules, then source-specific ones) and pairs
+    last, so the most specific instruction decides a detail's payer. Returns
+    (pair_results, rule_results, mapped) in request order.
+    """
+    pair_results = [_check_pair(item) for item in pairs]
+    rule_results = [_check_rule(rule) for rule in rules]
+    payer_names = _load_payer_names({
+        r['payer_id'] for r in pair_results + rule_results if r['status'] is None
+    })
+    for result in pair_results + rule_results:
+        if result['status'] is None and result['payer_id'] not in payer_names:
+            result['status'] = STATUS_UNKNOWN_PAYER
+
+    valid_pairs = list(_latest_wins(pair_results, lambda r: r['detail_id']).values())
+    valid_rules = _latest_wins(rule_results, lambda r: (r['payer_name'], r['source']))
+    indexed = {id(rule): index for index, rule in enumerate(rule_results)}
+    any_source = [(indexed[id(r)], r) for key, r in valid_rules.items() if key[1] is None]
+    by_source = [(indexed[id(r)], r) for key, r in valid_rules.items() if key[1] is not None]
+
+    lock_changes()
+    mapped = {}
+    for with_source, chunk in ((False, any_source), (True, by_source)):
+        for detail_id, payer_name, rule, payer_id in _update_from_rules(chunk, with_source):
+            rule_results[rule]['mapped'] += 1
+            mapped[detail_id] = (payer_name, payer_id)
+    for result in rule_results:
+        if result['status'] is None:
+            result['status'] = STATUS_MAPPED if result['mapped'] else STATUS_NO_MATCH
+
+    for detail_id, payer_name, payer_id in _update_from_pairs(valid_pairs):
+        mapped[detail_id] = (payer_name, payer_id)
+    for result in valid_pairs:
+        result['status'] = STATUS_MAPPED if result['detail_id'] in mapped else STATUS_UNKNOWN_DETAIL
+
+    mark_manual_many(
+        [(detail_id, payer_name, payer_id) for detail_id, (payer_name, payer_id) in mapped.items()], payer_names
+    )
+    record_changes(CHANGE_DETAIL, sorted(mapped))
+    if mapped:
+        bump_version(ALIASES)  # Resolves read the names of mapped details from the alias index
+    return pair_results, rule_results, len(mapped)
\ No newline at end of file
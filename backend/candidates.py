@@ -0,0 +1,147 @@
+# backend/candidates.py
+from itertools import islice
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+from matching import AUTO_MATCH_THRESHOLD, REVIEW_THRESHOLD, MatchEngine, get_similarity_score
+from models import db, has_pg_trgm, PayerDetail, Payer, ReviewCandidate
+from payer_cache import payer_snapshot
+from review_counts import adjust_counts, count_keys
+from trigram import MATCH_BACKEND_TRIGRAM, TrigramMatcher
+
+BAND_AUTO_MATCH = 'auto_match'
+BAND_REVIEW = 'review'
+BAND_UNMAPPED = 'unmapped'
+BAND_MANUAL = 'manual'
+REVIEW_BANDS = (BAND_REVIEW, BAND_UNMAPPED)
+
+BATCH_SIZE = 1000
+
+
+def classify(score, mapped):
+    """Band for a detail given its best score and whether its payer_id is a canonical payer"""
+    if REVIEW_THRESHOLD < score <= AUTO_MATCH_THRESHOLD:
+        return BAND_REVIEW
+    if not mapped:
+        return BAND_REVIEW if score > AUTO_MATCH_THRESHOLD else BAND_UNMAPPED
+    return BAND_AUTO_MATCH
+
+def load_payer_names():
+    return {payer_id: payer_name for payer_id, payer_name in db.session.query(Payer.payer_id, Payer.payer_name)}
+
+def make_matcher(payer_names=None, restrict=False):
+    """Scorer for the configured MATCH_BACKEND over payer_names, or every canonical payer when None.
+
+    restrict limits pg_trgm to the given payers too. The engine over every
+    payer is the memory-mapped one from payer_snapshot, so it is not rebuilt.
+    """
+    if current_app.config.get('MATCH_BACKEND') == MATCH_BACKEND_TRIGRAM:
+        if not has_pg_trgm(db.session.connection()):
+            raise RuntimeError("MATCH_BACKEND=pg_trgm needs the pg_trgm extension installed in the database")
+        return TrigramMatcher(
+            payer_ids=payer_names if restrict and payer_names is not None else None,
+            threshold=current_app.config['TRIGRAM_THRESHOLD']
+        )
+    if payer_names is None:
+        return payer_snapshot().engine
+    return MatchEngine(payer_names.items())
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _refresh_batch(details, payer_names, matcher):
+    existing = {
+        c.detail_id: c for c in db.session.query(ReviewCandidate).filter(
+            ReviewCandidate.detail_id.in_([d.detail_id for d in details])
+        )
+    }
+    # Reviewer decisions are never overwritten
+    details = [d for d in details if getattr(existing.get(d.detail_id), 'band', None) != BAND_MANUAL]
+    for detail, (payer_id, score) in zip(details, matcher.best_matches([d.payer_name for d in details])):
+        candidate = existing.get(detail.detail_id)
+        band = classify(score, detail.payer_id in payer_names)
+        if candidate is None:
+            db.session.add(ReviewCandidate(detail_id=detail.detail_id, best_payer_id=payer_id, score=score, band=band))
+        else:
+            candidate.best_payer_id, candidate.score, candidate.band = payer_id, score, band
+
+def refresh_candidates(detail_ids=None, payer_names=None, after_id=0):
+    """Recompute review candidates for the given details, or for every detail past after_id when detail_ids is None"""
+    matcher = make_matcher(payer_names)
+    if payer_names is None:
+        payer_names = payer_snapshot().by_id
+    refreshed = 0
+    if detail_ids is None:
+        last_id = after_id
+        while True:
+            details = db.session.query(PayerDetail).filter(
+                PayerDetail.detail_id > last_id
+            ).order_by(PayerDetail.detail_id).limit(BATCH_SIZE).all()
+            if not details:
+                break
+            _refresh_batch(details, payer_names, matcher)
+            db.session.commit()
+            refreshed += len(details)
+            last_id = details[-1].detail_id
+    else:
+        for chunk in _chunks(detail_ids):
+            details = db.session.query(PayerDetail).filter(PayerDetail.detail_id.in_(chunk)).all()
+            _refresh_batch(details, payer_names, matcher)
+            db.session.commit()
+            refreshed += len(details)
+    return refreshed
+
+def refresh_for_payers(payer_ids, payer_names=None):
+    """Re-score existing candidates against newly added canonical payers only"""
+    if payer_names is None:
+        payer_names = load_payer_names()
+    new_names = {pid: payer_names[pid] for pid in payer_ids if pid in payer_names}
+    if not new_names:
+        return 0
+    matcher = make_matcher(new_names, restrict=True)
+    updated = 0
+    rows = iter(db.session.query(ReviewCandidate, PayerDetail).join(
+        PayerDetail, PayerDetail.detail_id == ReviewCandidate.detail_id
+    ).filter(ReviewCandidate.band != BAND_MANUAL).order_by(ReviewCandidate.detail_id).yield_per(BATCH_SIZE))
+    while batch := list(islice(rows, BATCH_SIZE)):
+        matches = matcher.best_matches([detail.payer_name for _, detail in batch])
+        for (candidate, detail), (payer_id, score) in zip(batch, matches):
+            became_mapped = detail.payer_id in new_names
+            if score > candidate.score or became_mapped:
+                if score > candidate.score:
+                    candidate.best_payer_id, candidate.score = payer_id, score
+                candidate.band = classify(candidate.score, detail.payer_id in payer_names)
+                updated += 1
+    db.session.commit()
+    return updated
+
+def mark_manual(detail, payer_id):
+    """Record a reviewer's mapping so the detail leaves the review queue"""
+    payer = payer_snapshot().by_id.get(payer_id)
+    score = get_similarity_score(detail.payer_name, payer.payer_name) if payer else 0
+    candidate = db.session.get(ReviewCandidate, detail.detail_id)
+    if candidate is None:
+        candidate = ReviewCandidate(detail_id=detail.detail_id)
+        db.session.add(candidate)
+    candidate.best_payer_id, candidate.score, candidate.band = payer_id, score, BAND_MANUAL
+
+
+def mark_manual_many(mappings, payer_names):
+    """mark_manual for many (detail_id, detail payer_name, payer_id) rows as chunked upserts"""
+    dialect = postgresql if db.session.connection().dialect.name == 'postgresql' else sqlite
+    for chunk in _chunks(mappings):
+        rows = [{
+            'detail_id': detail_id,
+            'best_payer_id': payer_id,
+            'score': get_similarity_score(detail_name, payer_names[payer_id]) if payer_id in payer_names else 0,
+            'band': BAND_MANUAL
+        } for detail_id, detail_name, payer_id in chunk]
+        detail_ids = [row['detail_id'] for row in rows]
+        before = count_keys(detail_ids)
+        statement = dialect.insert(ReviewCandidate.__table__).values(rows)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['detail_id'],
+            set_={key: statement.excluded[key] for key in ('best_payer_id', 'score', 'band')}
+        ))
+        adjust_counts(before, count_keys(detail_ids))
\ No newline at end of file
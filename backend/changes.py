@@ -0,0 +1,127 @@
+# backend/changes.py
+from datetime import datetime
+from sqlalchemy import event, func, insert, inspect, literal, select, text
+from models import db, ChangeLog, Payer, PayerDetail, PayerGroup
+from normalization import generate_pretty_name
+
+CHANGE_DETAIL = 'detail'
+CHANGE_PAYER = 'payer'
+CHANGE_GROUP = 'group'
+CHANGE_LOCK_KEY = 720_002  # pg_advisory_xact_lock key serializing change_log writers until they commit
+MAX_CHANGES = 100_000
+
+# model -> (entity, key column, columns the feed serves); a write to any of them is a change
+TRACKED = {
+    PayerDetail: (CHANGE_DETAIL, 'detail_id', ('payer_id', 'payer_name', 'state', 'source')),
+    Payer: (CHANGE_PAYER, 'payer_id', ('payer_name', 'pretty_name', 'group_id')),
+    PayerGroup: (CHANGE_GROUP, 'group_id', ('group_name', 'parent_group_id')),
+}
+KEY_COLUMNS = {entity: key for entity, key, _ in TRACKED.values()}
+
+FEED_COLUMNS = ['seq', 'entity', 'deleted', 'detail_id', 'payer_id', 'payer_name', 'pretty_name',
+                'group_id', 'group_name', 'parent_group_id', 'source', 'state']
+
+
+def lock_changes(connection=None):
+    """Hold the change lock until commit, so sequence numbers become visible in order.
+
+    Without it a reader could see seq 11 committed while seq 10 is still in
+    flight, move past 10 and never see it. Set-based writers take it before
+    their first write, as the ORM does before a flush, so it never waits behind
+    row locks of their own. SQLite serializes writers already.
+    """
+    connection = connection or db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CHANGE_LOCK_KEY})
+
+def _row(entity, key, changed_at):
+    row = {'entity': entity, 'detail_id': None, 'payer_id': None, 'group_id': None, 'changed_at': changed_at}
+    row[KEY_COLUMNS[entity]] = key
+    return row
+
+def record_changes(entity, keys):
+    """Log changes to rows written outside the ORM (set-based UPDATEs, bulk merges) in the caller's transaction"""
+    keys = list(keys)
+    if not keys:
+        return
+    connection = db.session.connection()
+    lock_changes(connection)
+    now = datetime.utcnow()
+    connection.execute(insert(ChangeLog), [_row(entity, key, now) for key in keys])
+
+def record_changes_from(entity, keys):
+    """record_changes for a one-column select of keys, copied into change_log in key order without leaving the database"""
+    connection = db.session.connection()
+    lock_changes(connection)
+    keys = keys.subquery()
+    key = keys.c[0]
+    connection.execute(insert(ChangeLog).from_select(
+        ['entity', KEY_COLUMNS[entity], 'changed_at'],
+        select(literal(entity, ChangeLog.entity.type), key, literal(datetime.utcnow(), ChangeLog.changed_at.type)).order_by(key)
+    ))
+
+def _tracked(session):
+    dirty = session.dirty
+    for obj in list(session.new) + list(dirty) + list(session.deleted):
+        tracked = TRACKED.get(type(obj))
+        if tracked is None:
+            continue
+        if obj in dirty and not any(inspect(obj).attrs[name].history.has_changes() for name in tracked[2]):
+            continue
+        yield obj, tracked
+
+def _lock_before_flush(session, flush_context, instances):
+    # Taken before the flush writes, so the lock never waits behind this transaction's own row locks
+    if any(_tracked(session)):
+        lock_changes(session.connection())
+
+def _log_flush(session, flush_context):
+    now = datetime.utcnow()
+    rows = [_row(entity, getattr(obj, key), now) for obj, (entity, key, _) in _tracked(session)]
+    if rows:
+        session.connection().execute(insert(ChangeLog), rows)
+
+def track_changes():
+    """Log every ORM write to payer_details, payers and payer_groups; idempotent"""
+    if not event.contains(db.session, 'after_flush', _log_flush):
+        event.listen(db.session, 'before_flush', _lock_before_flush)
+        event.listen(db.session, 'after_flush', _log_flush)
+
+
+def change_feed(since, limit=MAX_CHANGES):
+    """Select of changes after since in seq order, each joined to its row's current state"""
+    return select(
+        ChangeLog.seq, ChangeLog.entity, ChangeLog.detail_id, ChangeLog.payer_id, ChangeLog.group_id,
+        PayerDetail.detail_id.label('detail_found'), PayerDetail.payer_id.label('detail_payer_id'),
+        PayerDetail.payer_name.label('detail_payer_name'), PayerDetail.source, PayerDetail.state,
+        Payer.payer_id.label('payer_found'), Payer.payer_name, Payer.pretty_name, Payer.group_id.label('payer_group_id'),
+        PayerGroup.group_id.label('group_found'), PayerGroup.group_name, PayerGroup.parent_group_id
+    ).outerjoin(PayerDetail, PayerDetail.detail_id == ChangeLog.detail_id).outerjoin(
+        Payer, Payer.payer_id == ChangeLog.payer_id
+    ).outerjoin(
+        PayerGroup, PayerGroup.group_id == ChangeLog.group_id
+    ).where(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit)
+
+def feed_row(row):
+    """FEED_COLUMNS for a change_feed row; deleted rows carry only their key"""
+    if row.entity == CHANGE_DETAIL:
+        deleted = row.detail_found is None
+        return (row.seq, row.entity, deleted, row.detail_id, row.detail_payer_id, row.detail_payer_name,
+                None, None, None, None, row.source, row.state)
+    if row.entity == CHANGE_PAYER:
+        deleted = row.payer_found is None
+        pretty_name = row.pretty_name or (None if deleted else generate_pretty_name(row.payer_name))
+        return (row.seq, row.entity, deleted, None, row.payer_id, row.payer_name,
+                pretty_name, row.payer_group_id, None, None, None, None)
+    return (row.seq, row.entity, row.group_found is None, None, None, None,
+            None, row.group_id, row.group_name, row.parent_group_id, None, None)
+
+def compact_changes():
+    """Delete changes superseded by a later change to the same row, returning how many went.
+
+    The feed serves each row's current state, so a consumer past any seq still
+    reaches the same state with the superseded entries gone.
+    """
+    keys = (ChangeLog.entity, ChangeLog.detail_id, ChangeLog.payer_id, ChangeLog.group_id)
+    latest = select(func.max(ChangeLog.seq)).group_by(*keys)
+    return db.session.query(ChangeLog).filter(ChangeLog.seq.not_in(latest)).delete(synchronize_session=False)
\ No newline at end of file
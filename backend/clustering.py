@@ -0,0 +1,239 @@
+# backend/clustering.py
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from sqlalchemy import func, or_, select
+from changes import CHANGE_DETAIL
+from matching import AUTO_MATCH_THRESHOLD, MatchEngine
+from models import db, ChangeLog, ClusterMember, PayerDetail
+
+CLUSTER_MODES = ('cluster_full', 'cluster_incremental')
+CHUNK_SIZE = 1000
+
+
+class UnionFind:
+    """Disjoint sets over 0..size-1 with union by size and path halving"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+    def groups(self):
+        """Member lists in order of their smallest member"""
+        members = defaultdict(list)
+        for x in range(len(self.parent)):
+            members[self.find(x)].append(x)
+        return list(members.values())
+
+
+def link_details(details, source_ids, threshold=AUTO_MATCH_THRESHOLD, intact=None):
+    """Union details sharing a source payer_id, or named alike (score above threshold) in the same state.
+
+    Exact duplicate (name, state) pairs are unioned outright, so only distinct
+    names are scored, each against the earlier distinct names of its state.
+    MatchEngine's character-count bound blocks out most pairs, and pairs that
+    are already in one set are never scored.
+
+    intact, when given, holds for each detail the cluster it is in when that
+    cluster has not changed since it was linked, else None. Those clusters are
+    unioned as they are; no pair of their names can link two of them, so only
+    the names of the other details are scored, against every name of their state.
+    """
+    intact = intact or [None] * len(details)
+    union_find = UnionFind(len(details))
+    first_for_id, first_for_name, first_for_cluster = {}, {}, {}
+    settled = set()
+    for idx, (detail, source_id, cluster_id) in enumerate(zip(details, source_ids, intact)):
+        if source_id:
+            union_find.union(first_for_id.setdefault(source_id, idx), idx)
+        key = ((detail.payer_name or '').lower(), detail.state or None)
+        union_find.union(first_for_name.setdefault(key, idx), idx)
+        if cluster_id is not None:
+            union_find.union(first_for_cluster.setdefault(cluster_id, idx), idx)
+            settled.add(key)
+
+    blocks = defaultdict(lambda: ([], []))
+    for key, idx in first_for_name.items():
+        blocks[key[1]][key not in settled].append(idx)
+    for settled_members, members in blocks.values():
+        engine = MatchEngine((idx, details[idx].payer_name) for idx in settled_members)
+        for idx in members:
+            name = details[idx].payer_name
+            for position in np.flatnonzero(engine.bounds(name) > threshold):
+                other = engine.keys[position]
+                if union_find.find(other) != union_find.find(idx) and engine.score(name, position) > threshold:
+                    union_find.union(other, idx)
+            engine.add(idx, name)
+    return union_find
+
+def representative(details, source_ids, members, canonical_names):
+    """(payer_id, payer_name) for a cluster, independent of member order.
+
+    A canonical payer's ID wins over IDs only seen on details, then the most
+    common ID, then the smallest. The name is the canonical payer's, else the
+    most common name the chosen ID was loaded with.
+    """
+    ids = Counter(source_ids[i] for i in members if source_ids[i])
+    if not ids:
+        return source_ids[members[0]], details[members[0]].payer_name
+    payer_id = min(ids, key=lambda candidate: (candidate not in canonical_names, -ids[candidate], candidate))
+    if payer_id in canonical_names:
+        return payer_id, canonical_names[payer_id]
+    names = Counter(details[i].payer_name for i in members if source_ids[i] == payer_id)
+    return payer_id, min(names, key=lambda name: (-names[name], name))
+
+def cluster_details(details, source_ids, canonical_names=None, threshold=AUTO_MATCH_THRESHOLD, intact=None):
+    """Group details into clusters keyed by their representative (payer_id, payer_name).
+
+    Unlike greedy_group the result does not depend on detail order, and
+    duplicates linked through a chain of IDs and names land in one cluster.
+    intact is as for link_details.
+    """
+    canonical_names = canonical_names or {}
+    union_find = link_details(details, source_ids, threshold, intact)
+    payer_groups = {}
+    for members in union_find.groups():
+        key = representative(details, source_ids, members, canonical_names)
+        payer_groups.setdefault(key, []).extend(details[i] for i in members)
+    return payer_groups
+
+
+def _in_chunks(column, values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield column.in_(values[start:start + CHUNK_SIZE])
+
+def load_source_ids(details, full=False):
+    """payer_id each detail was loaded with: its cluster_members row if it has one, else its current payer_id"""
+    if full:
+        known = dict(db.session.query(ClusterMember.detail_id, ClusterMember.source_payer_id))
+    else:
+        known = {}
+        for condition in _in_chunks(ClusterMember.detail_id, [d.detail_id for d in details]):
+            known.update(db.session.query(ClusterMember.detail_id, ClusterMember.source_payer_id).filter(condition))
+    return [known.get(d.detail_id, d.payer_id) for d in details]
+
+class DetailNames:
+    """MatchEngines over the distinct detail names of each state, kept by the process between runs.
+
+    Each run catches them up with the details past the detail_id high-water
+    mark and those change_log shows were written since. A name a detail was
+    edited away from stays indexed, which can only pull an extra cluster into
+    a rebuild, never leave one out.
+    """
+
+    def __init__(self, database, threshold=AUTO_MATCH_THRESHOLD):
+        self.database = database
+        self.threshold = threshold
+        self.states = defaultdict(MatchEngine)
+        self.last_detail_id = None
+        self.last_change_seq = 0
+        self._names = set()
+
+    def catch_up(self):
+        # The change_log position is read first, so a write racing the reads is caught up again next time
+        change_seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+        rows = db.session.query(PayerDetail.detail_id, PayerDetail.state, PayerDetail.payer_name)
+        if self.last_detail_id is not None:
+            edited = select(ChangeLog.detail_id).where(
+                ChangeLog.entity == CHANGE_DETAIL, ChangeLog.seq > self.last_change_seq
+            )
+            rows = rows.filter(or_(PayerDetail.detail_id > self.last_detail_id, PayerDetail.detail_id.in_(edited)))
+        last_detail_id = self.last_detail_id or 0
+        for detail_id, state, payer_name in rows:
+            last_detail_id = max(last_detail_id, detail_id)
+            if (state or None, payer_name) not in self._names:
+                self._names.add((state or None, payer_name))
+                self.states[state or None].add(payer_name, payer_name)
+        self.last_detail_id, self.last_change_seq = last_detail_id, change_seq
+
+    def matching(self, state, name):
+        """Indexed names of the state scoring above threshold against name"""
+        engine = self.states.get(state)
+        if engine is None:
+            return []
+        return [engine.keys[position] for position, _ in engine.scan(name, self.threshold)]
+
+_detail_names = None
+_detail_names_lock = threading.Lock()
+
+def detail_names(threshold=AUTO_MATCH_THRESHOLD):
+    """This process's DetailNames for the current database, caught up"""
+    global _detail_names
+    database = db.engine.url.render_as_string(hide_password=True)
+    with _detail_names_lock:
+        if _detail_names is None or (_detail_names.database, _detail_names.threshold) != (database, threshold):
+            _detail_names = DetailNames(database, threshold)
+        _detail_names.catch_up()
+        return _detail_names
+
+def affected_details(detail_ids, threshold=AUTO_MATCH_THRESHOLD):
+    """The given details plus every member of a cluster they are in or now link into, in detail_id order.
+
+    Links between members of untouched clusters cannot have changed, so
+    re-clustering this set gives the same result as re-clustering everything.
+    Returns (details, intact), intact holding for each detail its cluster
+    when that cluster contains none of the given details, as link_details takes it.
+    """
+    changed = []
+    for condition in _in_chunks(PayerDetail.detail_id, detail_ids):
+        changed += db.session.query(PayerDetail).filter(condition).all()
+    source_ids = {source_id for source_id in load_source_ids(changed) if source_id}
+    own_ids, cluster_ids = set(), set()
+    for condition in _in_chunks(ClusterMember.detail_id, [d.detail_id for d in changed]):
+        own_ids.update(cluster_id for (cluster_id,) in db.session.query(ClusterMember.cluster_id).filter(condition))
+    for condition in _in_chunks(ClusterMember.source_payer_id, source_ids):
+        cluster_ids.update(cluster_id for (cluster_id,) in db.session.query(ClusterMember.cluster_id).filter(condition))
+
+    # Only the clusters holding a name that scores above threshold are looked up, not every name of the state
+    names = detail_names(threshold)
+    linked = defaultdict(set)
+    for detail in changed:
+        linked[detail.state or None].update(names.matching(detail.state or None, detail.payer_name))
+    for state, payer_names in linked.items():
+        same_state = func.coalesce(PayerDetail.state, '') == (state or '')
+        for condition in _in_chunks(PayerDetail.payer_name, payer_names):
+            cluster_ids.update(cluster_id for (cluster_id,) in db.session.query(ClusterMember.cluster_id).join(
+                PayerDetail, PayerDetail.detail_id == ClusterMember.detail_id
+            ).filter(same_state, condition).distinct())
+
+    members = {detail.detail_id: detail for detail in changed}
+    intact = {}
+    for condition in _in_chunks(ClusterMember.cluster_id, own_ids | cluster_ids):
+        for detail, cluster_id in db.session.query(PayerDetail, ClusterMember.cluster_id).join(
+            ClusterMember, ClusterMember.detail_id == PayerDetail.detail_id
+        ).filter(condition):
+            members[detail.detail_id] = detail
+            if cluster_id not in own_ids:
+                intact[detail.detail_id] = cluster_id
+    details = [members[detail_id] for detail_id in sorted(members)]
+    return details, [intact.get(detail.detail_id) for detail in details]
+
+def save_members(payer_groups, source_ids, full=False):
+    """Record each detail's cluster and original payer_id, replacing earlier rows for the same details"""
+    if full:
+        db.session.query(ClusterMember).delete()
+    else:
+        for condition in _in_chunks(ClusterMember.detail_id, list(source_ids)):
+            db.session.query(ClusterMember).filter(condition).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(ClusterMember, [
+        {'detail_id': detail.detail_id, 'cluster_id': payer_id, 'source_payer_id': source_ids[detail.detail_id]}
+        for (payer_id, _), group in payer_groups.items() for detail in group
+    ])
\ No newline at end of file
@@ -5,8 +5,28 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    SQLALCHEMY_DATABASE_URI = (
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or (
         f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
         f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
     )
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))  # Connections kept open per process
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))  # Extra connections allowed under bursts
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # Reopen connections older than this many seconds
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')  # Test connections on checkout
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0'))  # PostgreSQL statement_timeout, 0 leaves it unset
+    DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')  # Behind PgBouncer transaction pooling
+    MATCH_BACKEND = os.getenv('MATCH_BACKEND', 'engine')  # "engine" (in-process) or "pg_trgm" (SQL candidate search)
+    TRIGRAM_THRESHOLD = float(os.getenv('TRIGRAM_THRESHOLD', '0.3'))  # pg_trgm.similarity_threshold for the % operator
+    RESOLVE_CACHE_SIZE = int(os.getenv('RESOLVE_CACHE_SIZE', '65536'))  # Recent /api/resolve lookups kept per process
+    FUZZY_WORKERS = int(os.getenv('FUZZY_WORKERS', '0'))  # Processes scoring fuzzy resolves for asgi.py, 0 uses every core
+    MATCH_INDEX_DIR = os.getenv('MATCH_INDEX_DIR', '')  # Where the memory-mapped payer index is written, the temp directory when empty
+    INSTRUMENTATION = os.getenv('INSTRUMENTATION', 'false').lower() in ('1', 'true', 'yes')  # /metrics, Server-Timing, SQL and similarity timers
+    PROFILE_SAMPLING = os.getenv('PROFILE_SAMPLING', 'false').lower() in ('1', 'true', 'yes')  # Start the sampling profiler with the app
+    PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))  # Seconds between profiler samples
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')  # Bearer token POST /metrics/profile needs, the API cannot start it when empty
+    PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))  # A profile started from the API stops after this long
+    JOB_RUNNER = os.getenv('JOB_RUNNER', 'false').lower() in ('1', 'true', 'yes')  # Start queued jobs from this process, on one process only (or run scripts/run_jobs.py)
+    JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '5'))  # How often to look for queued jobs
+    INGEST_DIR = os.getenv('INGEST_DIR', 'GoLassie DB')  # Workbooks /api/jobs load_data runs may read
\ No newline at end of file
@@ -0,0 +1,81 @@
+# backend/database.py
+import os
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from changes import track_changes
+from config import Config
+from models import db
+from review_counts import track_review_counts
+
+_script_app = None
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database from the DB_* pool settings.
+
+    With DB_PGBOUNCER the pooling is left to PgBouncer: every checkout opens a
+    fresh client connection to it, and nothing is set at connection level
+    since the server connection changes between transactions.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'postgresql':
+        return {}
+    if config.get('DB_PGBOUNCER'):
+        return {'poolclass': NullPool}
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+    }
+    if config.get('DB_STATEMENT_TIMEOUT_MS'):
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+def async_engine(config):
+    """AsyncEngine over asyncpg for asgi.py, from the same URL and DB_* pool settings as engine_options"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'postgresql':
+        raise RuntimeError("The async serving path needs a PostgreSQL database")
+    options = engine_options(config)
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if config.get('DB_PGBOUNCER'):
+        # Prepared statements would outlive the server connection PgBouncer hands out
+        options['connect_args'] = {'statement_cache_size': 0}
+        url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+    elif timeout:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    engine = create_async_engine(url.set(drivername='postgresql+asyncpg'), **options)
+    if config.get('DB_PGBOUNCER') and timeout:
+        event.listen(engine.sync_engine, 'begin', lambda conn: conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}"))
+    return engine
+
+def init_db(app):
+    """Bind db to app with the pool settings, shared by the web app and script_app"""
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+    track_changes()  # Every ORM write to details, payers and groups goes to the change log
+    track_review_counts()  # And every move in or out of the review queue to its summary counts
+    with app.app_context():
+        engines = list(db.engines.values())
+    timeout = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+    if app.config.get('DB_PGBOUNCER') and timeout:
+        for engine in engines:
+            if engine.dialect.name == 'postgresql':
+                # Transaction-scoped, so it never leaks to another client of the same server connection
+                event.listen(engine, 'begin', lambda conn: conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}"))
+    # Under gunicorn --preload a forked worker must not reuse the parent's pooled connections
+    os.register_at_fork(after_in_child=lambda: [engine.dispose(close=False) for engine in engines])
+
+def script_app():
+    """Minimal app for batch scripts: config and the database only, no CORS, routes or instrumentation"""
+    global _script_app
+    if _script_app is None:
+        _script_app = Flask(__name__)
+        _script_app.config.from_object(Config)
+        init_db(_script_app)
+    return _script_app
\ No newline at end of file
@@ -0,0 +1,91 @@
+# backend/export.py
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+from flask import Response, abort, request, stream_with_context
+from sqlalchemy import select
+from normalization import generate_pretty_name
+from models import db, Payer, PayerDetail, ReviewCandidate
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+YIELD_PER = 1000
+
+# name -> (statement, columns, row transform), served by the Flask routes and the async app alike
+EXPORTS = {
+    'payers': (
+        select(Payer.payer_id, Payer.payer_name, Payer.pretty_name, Payer.group_id).order_by(Payer.payer_id),
+        ['payer_id', 'payer_name', 'pretty_name', 'group_id'],
+        lambda row: (row.payer_id, row.payer_name, row.pretty_name or generate_pretty_name(row.payer_name), row.group_id)
+    ),
+    'details': (
+        select(
+            PayerDetail.detail_id, PayerDetail.payer_id, PayerDetail.payer_name, PayerDetail.source,
+            PayerDetail.state, ReviewCandidate.best_payer_id, ReviewCandidate.score, ReviewCandidate.band
+        ).outerjoin(ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id).order_by(PayerDetail.detail_id),
+        ['detail_id', 'payer_id', 'payer_name', 'source', 'state', 'suggested_payer_id', 'score', 'band'],
+        None
+    ),
+}
+
+
+def encode_rows(rows, columns, export_format, header=False):
+    """Rows as one text chunk, CSV (after a header line when header) or one JSON object per line"""
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(columns, row))))
+            buffer.write('\n')
+    return buffer.getvalue()
+
+def _encode(rows, columns, export_format):
+    """Text chunks of YIELD_PER rows each"""
+    yield encode_rows((), columns, export_format, header=True)
+    rows = iter(rows)
+    while batch := list(islice(rows, YIELD_PER)):
+        yield encode_rows(batch, columns, export_format)
+
+def gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+def _gzip(chunks):
+    compressor = gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_export(name, statement, columns, transform=None):
+    """Stream a select's rows as ?format=ndjson (default) or csv, gzipped when the client accepts it.
+
+    Rows come off a server-side cursor YIELD_PER at a time and are written out
+    as they arrive, so memory stays flat however large the table is.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        abort(400, description=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    compress = request.accept_encodings.quality('gzip') > 0
+
+    def generate():
+        rows = db.session.execute(statement.execution_options(yield_per=YIELD_PER))
+        chunks = _encode(map(transform, rows) if transform else rows, columns, export_format)
+        yield from _gzip(chunks) if compress else (chunk.encode() for chunk in chunks)
+
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[export_format],
+                    headers=export_headers(name, export_format, compress))
+
+def export_headers(name, export_format, compress):
+    headers = {
+        'Content-Disposition': f'attachment; filename="{name}.{export_format}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return headers
\ No newline at end of file
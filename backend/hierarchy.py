@@ -0,0 +1,48 @@
+# backend/hierarchy.py
+from matching import get_similarity_score
+from models import db, PayerGroup
+
+HIERARCHY_THRESHOLD = 80
+
+
+def infer_parents(groups):
+    """Map each group_id to its nearest parent group_id (or None).
+
+    A parent's name is a prefix of the child's name scoring above
+    HIERARCHY_THRESHOLD. Walking the names in sorted order with a stack keeps
+    exactly the prefixes of the current name on the stack, like the path down a
+    prefix trie, so only those few candidates are ever scored.
+    """
+    parents = {}
+    stack = []
+    for group_name, group_id in sorted((name, gid) for gid, name in groups):
+        while stack and not group_name.startswith(stack[-1][0]):
+            stack.pop()
+        parents[group_id] = None
+        for prefix_name, prefix_id in reversed(stack):
+            if get_similarity_score(group_name, prefix_name) > HIERARCHY_THRESHOLD:
+                parents[group_id] = prefix_id
+                break
+        stack.append((group_name, group_id))
+    return parents
+
+def rebuild_group_hierarchy():
+    """Recompute parent_group_id for every group; call when the set of groups changes"""
+    groups = db.session.query(PayerGroup).all()
+    parents = infer_parents((g.group_id, g.group_name) for g in groups)
+    changed = 0
+    for group in groups:
+        if group.parent_group_id != parents[group.group_id]:
+            group.parent_group_id = parents[group.group_id]
+            changed += 1
+    return changed
+
+def build_tree(groups):
+    """Nest (group_id, group_name, parent_group_id) rows; parents outside the rows make roots"""
+    nodes = {group_id: {"group_id": group_id, "group_name": group_name, "children": []}
+             for group_id, group_name, _ in groups}
+    roots = []
+    for group_id, _, parent_group_id in groups:
+        parent = nodes.get(parent_group_id)
+        (parent["children"] if parent is not None else roots).append(nodes[group_id])
+    return roots
\ No newline at end of file
@@ -3,14 +3,18 @@ from flask import Flask
 from flask_cors import CORS  # Add CORS
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
-from models import db
+from database import init_db
+from instrumentation import init_instrumentation
+from jobs import init_jobs
 
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
-    db.init_app(app)  # Bind db to app
+    init_db(app)  # Bind db to app with the pool settings
     CORS(app)  # Allow frontend requests
+    init_instrumentation(app)  # No-op unless INSTRUMENTATION is set
+    init_jobs(app)  # Background mapping and ingest runs, see jobs.py
     
     # Register routes
     from routes import init_routes
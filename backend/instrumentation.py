@@ -0,0 +1,259 @@
+# backend/instrumentation.py
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, abort, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+import matching
+from models import db
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PARTS = ('db', 'similarity', 'json')
+
+_lock = threading.Lock()
+_local = threading.local()  # .stats holds {part: [calls, seconds]} for the request on this thread
+_active_threads = set()
+_requests = Counter()  # (endpoint, method, status) -> requests
+_durations = defaultdict(lambda: [[0] * len(DURATION_BUCKETS), 0.0, 0])  # endpoint -> [buckets, sum, count]
+_parts = defaultdict(lambda: [0, 0.0])  # (endpoint, part) -> [calls, seconds]
+_similarity = defaultdict(lambda: [0, 0, 0.0])  # function -> [calls, pairs, seconds]
+
+
+def _record(part, seconds):
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        entry = stats[part]
+        entry[0] += 1
+        entry[1] += seconds
+
+def _timed_similarity(function, func, pairs):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            _record('similarity', seconds)
+            with _lock:
+                entry = _similarity[function]
+                entry[0] += 1
+                entry[1] += pairs(*args)
+                entry[2] += seconds
+    return wrapper
+
+def instrument_similarity():
+    """Count and time every fuzz.ratio and cdist call made through matching"""
+    matching._ratio = _timed_similarity('fuzz_ratio', matching.fuzz.ratio, lambda *args: 1)
+    matching._cdist = _timed_similarity(
+        'cdist', matching.process.cdist, lambda queries, choices, *args: len(queries) * len(choices)
+    )
+
+def _instrument_sql(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record('db', time.perf_counter() - conn.info['query_start'].pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            _record('db', time.perf_counter() - starts.pop())
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider with serialization time recorded against the request"""
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _record('json', time.perf_counter() - start)
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving a request; collapsed() is flamegraph input"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None):
+        """Start a fresh profile, stopping by itself after seconds when given"""
+        if self.running:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        deadline = time.monotonic() + seconds if seconds else None
+        self._thread = threading.Thread(target=self._run, args=(deadline,), name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, deadline):
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            frames = sys._current_frames()
+            for thread_id in list(_active_threads):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _labels(**labels):
+    return '{' + ','.join(
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels.items()
+    ) + '}'
+
+def prometheus_text(profiler):
+    """All counters in the Prometheus text exposition format"""
+    with _lock:
+        requests, durations = dict(_requests), {k: (list(v[0]), v[1], v[2]) for k, v in _durations.items()}
+        parts, similarity = {k: list(v) for k, v in _parts.items()}, {k: list(v) for k, v in _similarity.items()}
+    lines = [
+        '# HELP http_requests_total Requests served, by endpoint, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for (endpoint, method, status), count in sorted(requests.items()):
+        lines.append(f"http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+    lines += [
+        '# HELP http_request_duration_seconds Time from before_request to after_request.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for endpoint, (buckets, total, count) in sorted(durations.items()):
+        for bound, bucket in zip(DURATION_BUCKETS, buckets):
+            lines.append(f"http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {bucket}")
+        lines.append(f"http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {count}")
+        lines.append(f"http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {total}")
+        lines.append(f"http_request_duration_seconds_count{_labels(endpoint=endpoint)} {count}")
+    lines += [
+        '# HELP request_part_calls_total SQL statements, similarity calls and JSON encodes made by requests.',
+        '# TYPE request_part_calls_total counter',
+    ]
+    lines += [f"request_part_calls_total{_labels(endpoint=endpoint, part=part)} {calls}"
+              for (endpoint, part), (calls, _) in sorted(parts.items())]
+    lines += [
+        '# HELP request_part_seconds_total Time requests spent in SQL, similarity scoring and JSON encoding.',
+        '# TYPE request_part_seconds_total counter',
+    ]
+    lines += [f"request_part_seconds_total{_labels(endpoint=endpoint, part=part)} {seconds}"
+              for (endpoint, part), (_, seconds) in sorted(parts.items())]
+    lines += [
+        '# HELP similarity_calls_total Similarity function calls in this process, inside requests or not.',
+        '# TYPE similarity_calls_total counter',
+    ]
+    lines += [f"similarity_calls_total{_labels(function=function)} {calls}"
+              for function, (calls, _, _) in sorted(similarity.items())]
+    lines += ['# HELP similarity_pairs_total Name pairs scored.', '# TYPE similarity_pairs_total counter']
+    lines += [f"similarity_pairs_total{_labels(function=function)} {pairs}"
+              for function, (_, pairs, _) in sorted(similarity.items())]
+    lines += ['# HELP similarity_seconds_total Time spent scoring.', '# TYPE similarity_seconds_total counter']
+    lines += [f"similarity_seconds_total{_labels(function=function)} {seconds}"
+              for function, (_, _, seconds) in sorted(similarity.items())]
+    lines += [
+        '# HELP profiler_samples_total Sampling profiler ticks since it was last started.',
+        '# TYPE profiler_samples_total counter',
+        f"profiler_samples_total {profiler.samples}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+def init_instrumentation(app):
+    """Opt-in timers, /metrics and Server-Timing. With INSTRUMENTATION off nothing is registered."""
+    if not app.config.get('INSTRUMENTATION'):
+        return
+    instrument_similarity()
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_sql(engine)
+    app.json = TimedJSONProvider(app)
+    profiler = SamplingProfiler(app.config.get('PROFILE_INTERVAL', 0.005))
+    if app.config.get('PROFILE_SAMPLING'):
+        profiler.start()
+
+    @app.before_request
+    def start_timer():
+        _local.stats = {part: [0, 0.0] for part in PARTS}
+        _local.start = time.perf_counter()
+        _active_threads.add(threading.get_ident())
+
+    @app.after_request
+    def record_request(response):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - _local.start
+        endpoint = request.endpoint or 'unmatched'
+        with _lock:
+            _requests[(endpoint, request.method, response.status_code)] += 1
+            histogram = _durations[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += elapsed
+            histogram[2] += 1
+            for part, (calls, seconds) in stats.items():
+                entry = _parts[(endpoint, part)]
+                entry[0] += calls
+                entry[1] += seconds
+        response.headers['Server-Timing'] = ', '.join(
+            [f"app;dur={elapsed * 1000:.2f}"] +
+            [f'{part};dur={seconds * 1000:.2f};desc="{calls} calls"' for part, (calls, seconds) in stats.items()]
+        )
+        return response
+
+    @app.teardown_request
+    def clear_timer(exc):
+        _local.stats = None
+        _active_threads.discard(threading.get_ident())
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(prometheus_text(profiler), mimetype='text/plain; version=0.0.4')
+
+    @app.route('/metrics/profile', methods=['GET', 'POST'])
+    def profile():
+        # POST {"enabled": true} starts a fresh profile for PROFILE_MAX_SECONDS, {"enabled": false} stops it;
+        # GET returns collapsed stacks. Both need the token, since stacks name internal functions and files
+        token = app.config.get('PROFILE_TOKEN')
+        if not token:
+            abort(403, description="Set PROFILE_TOKEN to use the profiler from the API")
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            abort(403, description="Authorization must be Bearer <PROFILE_TOKEN>")
+        if request.method == 'POST':
+            if (request.json or {}).get('enabled'):
+                profiler.start(app.config.get('PROFILE_MAX_SECONDS', 60))
+            else:
+                profiler.stop()
+            return {"status": "success", "running": profiler.running, "samples": profiler.samples}
+        return Response(profiler.collapsed(), mimetype='text/plain')
\ No newline at end of file
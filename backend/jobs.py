@@ -0,0 +1,274 @@
+# backend/jobs.py
+import _thread
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Job
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+HEARTBEAT_SECONDS = 2
+STALE_SECONDS = 120  # A running job without a heartbeat for this long lost its process
+CLAIM_LOCK_KEY = 720_001  # pg_advisory_xact_lock key serializing claims across processes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _map_payers(progress, full=False, cluster=False, batch=False):
+    from map_payers import map_payers
+    map_payers(batch=batch, full=full, cluster=cluster, progress=progress)
+
+def _load_data(progress, excel_file, bulk=False):
+    import load_data
+    (load_data.bulk_main if bulk else load_data.main)(excel_file, progress=progress)
+
+# kind -> (function, {param: type}); functions run in the job's own process
+JOB_KINDS = {
+    'map_payers': (_map_payers, {'full': bool, 'cluster': bool, 'batch': bool}),
+    'load_data': (_load_data, {'file': str, 'bulk': bool}),
+}
+
+
+def validate_params(kind, params, ingest_dir):
+    """Keyword arguments for a job from request params, raising ValueError on anything unexpected"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(JOB_KINDS)}")
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    allowed = JOB_KINDS[kind][1]
+    for name, value in params.items():
+        if name not in allowed or not isinstance(value, allowed[name]):
+            raise ValueError(f"Unexpected param {name!r} for {kind}")
+    params = dict(params)
+    if kind == 'load_data':
+        # Only workbooks already in the ingest directory can be loaded
+        name = params.pop('file', 'Payers.xlsx')
+        if os.path.basename(name) != name or not os.path.isfile(os.path.join(ingest_dir, name)):
+            raise ValueError(f"No file {name!r} in the ingest directory")
+        params['excel_file'] = os.path.abspath(os.path.join(ingest_dir, name))
+    return params
+
+def submit_job(kind, params):
+    """Queue a job and start it if this process runs jobs and none is running"""
+    job = Job(kind=kind, status=JOB_QUEUED, params=json.dumps(params))
+    db.session.add(job)
+    db.session.commit()
+    runner = JobRunner.current()
+    if runner is not None:
+        runner.dispatch()
+    return job
+
+def cancel_job(job):
+    """Cancel a queued job outright; a running one stops at its next heartbeat"""
+    if job.status == JOB_QUEUED:
+        db.session.execute(update(Job).where(Job.job_id == job.job_id, Job.status == JOB_QUEUED).values(
+            status=JOB_CANCELLED, finished_at=datetime.utcnow()
+        ))
+    if job.status in (JOB_QUEUED, JOB_RUNNING):
+        db.session.execute(update(Job).where(Job.job_id == job.job_id).values(cancel_requested=True))
+    db.session.commit()
+    db.session.refresh(job)
+
+def _finish(job_id, status, message=None, **values):
+    db.session.execute(update(Job).where(Job.job_id == job_id, Job.status == JOB_RUNNING).values(
+        status=status, message=message, finished_at=datetime.utcnow(), **values
+    ))
+    db.session.commit()
+
+def claim_next():
+    """Mark the oldest queued job running and return its id, or None while another job runs.
+
+    Jobs write the same tables, so one runs at a time across every process;
+    on PostgreSQL an advisory lock makes the check-and-claim atomic. Running
+    jobs whose heartbeat stopped are failed first so they cannot block the queue.
+    """
+    now = datetime.utcnow()
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY})
+    db.session.execute(update(Job).where(
+        Job.status == JOB_RUNNING, Job.updated_at < now - timedelta(seconds=STALE_SECONDS)
+    ).values(status=JOB_FAILED, message="Job process stopped sending heartbeats", finished_at=now))
+    job_id = None
+    if not db.session.query(Job.job_id).filter(Job.status == JOB_RUNNING).first():
+        job_id = db.session.query(Job.job_id).filter(Job.status == JOB_QUEUED).order_by(Job.job_id).limit(1).scalar()
+        if job_id is not None:
+            db.session.execute(update(Job).where(Job.job_id == job_id).values(
+                status=JOB_RUNNING, started_at=now, updated_at=now
+            ))
+    db.session.commit()
+    return job_id
+
+
+class JobProgress:
+    """Progress callback handed to a job.
+
+    Calls only record the numbers, so jobs can report every row. A heartbeat
+    thread writes them to the job's row every HEARTBEAT_SECONDS on its own
+    connection, and interrupts the job's main thread once cancel is requested.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.processed = 0
+        self.total = None
+        self.phase = None
+        self._engine = db.engine
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f'job-{job_id}-heartbeat', daemon=True)
+
+    def __call__(self, processed, total=None, phase=None):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        if phase is not None:
+            self.phase = phase
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def flush(self):
+        """Write progress and the heartbeat, returning whether cancel was requested"""
+        with self._engine.begin() as conn:
+            conn.execute(update(Job).where(Job.job_id == self.job_id).values(
+                rows_processed=self.processed, rows_total=self.total, phase=self.phase, updated_at=datetime.utcnow()
+            ))
+            return conn.execute(select(Job.cancel_requested).where(Job.job_id == self.job_id)).scalar()
+
+    def _beat(self):
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                cancel = self.flush()
+            except SQLAlchemyError:
+                continue  # Progress is best effort, the next beat retries
+            if cancel:
+                _thread.interrupt_main()
+                return
+
+def run_job(job_id):
+    """Body of a job's process: run it with a fresh script app and record how it ended"""
+    sys.path.append(os.path.join(ROOT, 'scripts'))  # Job functions import the scripts by name, as they import each other
+    from database import script_app
+
+    with script_app().app_context():
+        job = db.session.get(Job, job_id)
+        function = JOB_KINDS[job.kind][0]
+        params = json.loads(job.params or '{}')
+        db.session.commit()
+        status, message = JOB_SUCCEEDED, None
+        progress = JobProgress(job_id)
+        try:
+            with progress:
+                function(progress, **params)
+        except KeyboardInterrupt:
+            status = JOB_CANCELLED
+        except Exception as e:
+            status, message = JOB_FAILED, f"{type(e).__name__}: {e}"
+        db.session.rollback()
+        _finish(job_id, status, message, rows_processed=progress.processed, rows_total=progress.total, phase=progress.phase)
+
+
+class JobRunner:
+    """Starts claimed jobs in child processes and notices when they end.
+
+    Jobs run in their own process so CPU-bound matching never holds the GIL of
+    a Flask worker. Processes are spawned, not forked, since the server is
+    threaded. Queued jobs are picked up on submit, when a job ends, and by a
+    poll every JOB_POLL_SECONDS, so no broker is needed.
+    """
+
+    def __init__(self, app, poll_seconds):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self._processes = {}
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context('spawn')
+
+    @staticmethod
+    def current():
+        return current_app.extensions.get('job_runner')
+
+    def start(self):
+        threading.Thread(target=self.poll, name='job-poller', daemon=True).start()
+
+    def poll(self):
+        """Dispatch queued jobs every poll_seconds, forever"""
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.dispatch()
+            except SQLAlchemyError as e:
+                self.app.logger.warning("Job dispatch failed: %s", e)
+
+    def dispatch(self):
+        with self._lock, self.app.app_context():
+            if self._processes:
+                return
+            job_id = claim_next()
+            if job_id is None:
+                return
+            process = self._context.Process(target=run_job, args=(job_id,), name=f'job-{job_id}')
+            process.start()
+            self._processes[job_id] = process
+        threading.Thread(target=self._watch, args=(job_id, process), name=f'job-{job_id}-watch', daemon=True).start()
+
+    def _watch(self, job_id, process):
+        process.join()
+        with self._lock:
+            self._processes.pop(job_id, None)
+        with self.app.app_context():
+            # Still running means the process died before recording its end
+            cancelled = db.session.query(Job.cancel_requested).filter(Job.job_id == job_id).scalar()
+            _finish(job_id, JOB_CANCELLED if cancelled else JOB_FAILED,
+                    None if cancelled else f"Job process exited with code {process.exitcode}")
+        self.dispatch()
+
+
+def init_jobs(app):
+    """Run queued jobs from this process when JOB_RUNNER is on"""
+    if not app.config.get('JOB_RUNNER', False):
+        return
+    runner = JobRunner(app, app.config.get('JOB_POLL_SECONDS', 5))
+    app.extensions['job_runner'] = runner
+    runner.start()
+
+def job_json(job):
+    """A job's state with rows/sec and ETA derived from its last heartbeat"""
+    rate = eta = None
+    if job.started_at and job.rows_processed:
+        elapsed = ((job.finished_at or job.updated_at or job.started_at) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rate = job.rows_processed / elapsed
+            if job.rows_total and job.status == JOB_RUNNING:
+                eta = max(job.rows_total - job.rows_processed, 0) / rate
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "status": job.status,
+        "phase": job.phase,
+        "params": json.loads(job.params or '{}'),
+        "rows_processed": job.rows_processed,
+        "rows_total": job.rows_total,
+        "rows_per_sec": round(rate, 1) if rate is not None else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "cancel_requested": job.cancel_requested,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
\ No newline at end of file
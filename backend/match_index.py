@@ -0,0 +1,429 @@
+# backend/match_index.py
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_left
+from collections import namedtuple
+from collections.abc import Mapping
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func
+from changes import CHANGE_DETAIL
+from matching import OTHER_BUCKET, MatchEngine, build_postings, char_counts
+from models import db, ChangeLog, Payer, PayerDetail, PayerGroup, ReviewCandidate
+from normalization import generate_pretty_name, normalize_name
+
+FORMAT_VERSION = 5
+MAGIC = b'PAYRIDX\0'
+HEADER = struct.Struct('<8sIIqqq')  # magic, format version, char buckets, payers cache version, payer count, trigram count
+ALIGN = 8
+COUNT_DTYPE = np.uint16  # Per-character counts; payer names are at most 255 characters
+# Stored as an offsets array plus one UTF-8 blob each; a missing group_id or group_name is stored as ''
+STRING_COLUMNS = ('payer_id', 'payer_name', 'match_name', 'normalized_name', 'pretty_name', 'group_id', 'group_name')
+
+# The trigram postings follow the columns: the sorted trigrams as a string column, then each trigram's
+# positions as one int32 array sliced by an offsets array
+PayerEntry = namedtuple('PayerEntry', 'payer_id payer_name normalized_name pretty_name group_id group_name')
+
+ALIAS_FORMAT_VERSION = 1
+ALIAS_MAGIC = b'PAYRALS\0'
+ALIAS_HEADER = struct.Struct('<8sqqqqq')  # magic, format version, aliases cache version, change_log seq, alias count, raw name count
+# Sorted normalized names, the payer_id each resolves to, then the raw detail names under each, sliced by an offsets array
+ALIAS_REFRESH_LIMIT = 10000  # Changed details a refresh re-votes; past this the file is rebuilt
+CHUNK_SIZE = 1000
+
+
+class StringColumn:
+    """Read-only sequence of strings decoded on access from an offsets array and a UTF-8 buffer"""
+
+    def __init__(self, offsets, data):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return str(self._data[self._offsets[idx]:self._offsets[idx + 1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def tolist(self):
+        offsets, data = self._offsets.tolist(), bytes(self._data)
+        return [str(data[start:end], 'utf-8') for start, end in zip(offsets, offsets[1:])]
+
+
+class SortedView:
+    """A column read in the order of a permutation array, for bisecting"""
+
+    def __init__(self, column, order):
+        self._column = column
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, idx):
+        return self._column[int(self._order[idx])]
+
+
+class Postings:
+    """Read-only {trigram: positions} over the sorted trigram column and the offsets into one positions array"""
+
+    def __init__(self, grams, offsets, positions):
+        self._grams = grams
+        self._offsets = offsets
+        self._positions = positions
+
+    def get(self, gram, default=None):
+        idx = bisect_left(self._grams, gram)
+        if idx < len(self._grams) and self._grams[idx] == gram:
+            return self._positions[self._offsets[idx]:self._offsets[idx + 1]]
+        return default
+
+
+class MappedFile:
+    """Arrays and string columns read in order from a file mapped read-only, each padded to ALIGN bytes"""
+
+    def _map_file(self, path, header):
+        self.path = path
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offset = header.size
+        return header.unpack_from(self._map)
+
+    def _strings(self, count):
+        offsets = self._array(np.int64, count + 1)
+        size = int(offsets[-1])
+        column = StringColumn(offsets, memoryview(self._map)[self._offset:self._offset + size])
+        self._offset += size + (-size % ALIGN)
+        return column
+
+    def _array(self, dtype, count):
+        array = np.frombuffer(self._map, dtype=dtype, count=count, offset=self._offset)
+        self._offset += array.nbytes + (-array.nbytes % ALIGN)
+        return array
+
+
+class MatchIndex(MappedFile, Mapping):
+    """Canonical payers by payer_id, read from an index file mapped read-only.
+
+    Names live in the mapped file rather than as Python objects, so loading
+    costs a header read, and every process mapping the same file shares one
+    page-cache copy. Payers are sorted by payer_id, and a stored permutation
+    sorts them by normalized name, so both lookups bisect.
+    """
+
+    def __init__(self, path):
+        magic, format_version, buckets, self.version, count, gram_count = self._map_file(path, HEADER)
+        if magic != MAGIC or format_version != FORMAT_VERSION or buckets != OTHER_BUCKET + 1:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} payer index")
+        self.lengths = self._array(np.int32, count)
+        self.counts = self._array(COUNT_DTYPE, count * buckets).reshape(count, buckets)
+        self.name_order = self._array(np.int32, count)
+        self.columns = {}
+        for name in STRING_COLUMNS:
+            self.columns[name] = self._strings(count)
+        grams = self._strings(gram_count)
+        gram_offsets = self._array(np.int64, gram_count + 1)
+        postings = Postings(grams, gram_offsets, self._array(np.int32, int(gram_offsets[-1])))
+        self.payer_ids = self.columns['payer_id']
+        self._by_name = SortedView(self.columns['normalized_name'], self.name_order)
+        self.engine = MatchEngine.from_arrays(
+            self.payer_ids, self.columns['match_name'], self.lengths, self.counts, postings
+        )
+
+    def position(self, payer_id):
+        idx = bisect_left(self.payer_ids, payer_id)
+        return idx if idx < len(self.payer_ids) and self.payer_ids[idx] == payer_id else None
+
+    def position_by_name(self, normalized_name):
+        """Position of the payer with this normalized name, the lowest payer_id on ties"""
+        if not normalized_name:
+            return None
+        idx = bisect_left(self._by_name, normalized_name)
+        if idx < len(self._by_name) and self._by_name[idx] == normalized_name:
+            return int(self.name_order[idx])
+        return None
+
+    def entry(self, idx):
+        columns = self.columns
+        return PayerEntry(
+            columns['payer_id'][idx], columns['payer_name'][idx], columns['normalized_name'][idx],
+            columns['pretty_name'][idx], columns['group_id'][idx] or None, columns['group_name'][idx] or None
+        )
+
+    def __getitem__(self, payer_id):
+        idx = self.position(payer_id)
+        if idx is None:
+            raise KeyError(payer_id)
+        return self.entry(idx)
+
+    def __contains__(self, payer_id):
+        return self.position(payer_id) is not None
+
+    def __iter__(self):
+        return iter(self.payer_ids)
+
+    def __len__(self):
+        return len(self.payer_ids)
+
+
+class AliasIndex(MappedFile):
+    """The normalized names payer details carry, each with the payer_id it resolves to, read from a file mapped read-only.
+
+    Names are sorted, so lookups bisect. The raw detail names under each
+    normalized name are kept too, so refresh_aliases can re-vote just the
+    names whose details changed after the change_log seq the file was written at.
+    """
+
+    def __init__(self, path):
+        magic, format_version, self.version, self.change_seq, count, raw_count = self._map_file(path, ALIAS_HEADER)
+        if magic != ALIAS_MAGIC or format_version != ALIAS_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {ALIAS_FORMAT_VERSION} alias index")
+        self.names = self._strings(count)
+        self.payer_ids = self._strings(count)
+        self.raw_offsets = self._array(np.int64, count + 1)
+        self.raw_names = self._strings(raw_count)
+
+    def payer_id(self, normalized_name):
+        """payer_id the payer details with this normalized name resolve to, None when no detail carries it"""
+        if not normalized_name:
+            return None
+        idx = bisect_left(self.names, normalized_name)
+        if idx < len(self.names) and self.names[idx] == normalized_name:
+            return self.payer_ids[idx]
+        return None
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _write_array(handle, array):
+    handle.write(array.tobytes())
+    handle.write(b'\0' * (-array.nbytes % ALIGN))
+
+def _write_strings(handle, values):
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+    _write_array(handle, offsets)
+    _write_array(handle, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+
+def _replace(path, write):
+    """Write a file through write(handle) next to path and swap it in atomically"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            write(handle)
+        # Processes still mapping the old file keep reading it until they reopen
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def write_index(path, version, rows):
+    """Write (payer_id, payer_name, pretty_name, group_id, group_name) rows as an index file, replacing path atomically"""
+    rows = sorted(rows, key=lambda row: row[0])
+    count = len(rows)
+    match_names = [(payer_name or '').lower() for _, payer_name, _, _, _ in rows]
+    normalized_names = [normalize_name(payer_name) for _, payer_name, _, _, _ in rows]
+    counts = np.zeros((count, OTHER_BUCKET + 1), dtype=COUNT_DTYPE)
+    for idx, name in enumerate(match_names):
+        counts[idx] = np.minimum(char_counts(name), np.iinfo(COUNT_DTYPE).max)
+    # Stable, so payers sharing a normalized name stay in payer_id order
+    name_order = np.array(sorted(range(count), key=normalized_names.__getitem__), dtype=np.int32)
+    postings = build_postings(match_names)
+    grams = sorted(postings)
+    gram_offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+    gram_offsets[1:] = np.cumsum([len(postings[gram]) for gram in grams])
+    columns = {
+        'payer_id': [payer_id for payer_id, _, _, _, _ in rows],
+        'payer_name': [payer_name or '' for _, payer_name, _, _, _ in rows],
+        'match_name': match_names,
+        'normalized_name': normalized_names,
+        'pretty_name': [pretty_name or generate_pretty_name(payer_name) for _, payer_name, pretty_name, _, _ in rows],
+        'group_id': [group_id or '' for _, _, _, group_id, _ in rows],
+        'group_name': [group_name or '' for _, _, _, _, group_name in rows],
+    }
+
+    def write(handle):
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, OTHER_BUCKET + 1, version, count, len(grams)))
+        _write_array(handle, np.fromiter(map(len, match_names), dtype=np.int32, count=count))
+        _write_array(handle, counts)
+        _write_array(handle, name_order)
+        for name in STRING_COLUMNS:
+            _write_strings(handle, columns[name])
+        _write_strings(handle, grams)
+        _write_array(handle, gram_offsets)
+        _write_array(handle, np.concatenate([np.zeros(0, dtype=np.int32)] +
+                                            [np.asarray(postings[gram], dtype=np.int32) for gram in grams]))
+
+    _replace(path, write)
+
+def write_aliases(path, version, change_seq, aliases):
+    """Write {normalized name: (payer_id, raw detail names)} as an alias file, replacing path atomically"""
+    names = sorted(aliases)
+    raw_names = [sorted(aliases[name][1]) for name in names]
+    raw_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    raw_offsets[1:] = np.cumsum(np.fromiter(map(len, raw_names), dtype=np.int64, count=len(names)))
+
+    def write(handle):
+        handle.write(ALIAS_HEADER.pack(ALIAS_MAGIC, ALIAS_FORMAT_VERSION, version, change_seq, len(names),
+                                       int(raw_offsets[-1])))
+        _write_strings(handle, names)
+        _write_strings(handle, [aliases[name][0] for name in names])
+        _write_array(handle, raw_offsets)
+        _write_strings(handle, [raw for raws in raw_names for raw in raws])
+
+    _replace(path, write)
+
+def _database_file(kind):
+    """File of this kind for the configured database, under MATCH_INDEX_DIR or the temp directory"""
+    directory = current_app.config.get('MATCH_INDEX_DIR') or tempfile.gettempdir()
+    database = hashlib.sha1(db.engine.url.render_as_string(hide_password=True).encode()).hexdigest()[:12]
+    return os.path.join(directory, f'payer-{kind}-{database}.bin')
+
+def index_path():
+    return _database_file('index')
+
+def alias_path():
+    return _database_file('aliases')
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def alias_vote_query():
+    """(payer_name, payer_id, hand-mapped, detail count) per raw detail name and payer"""
+    from candidates import BAND_MANUAL  # candidates reads payers through payer_cache, which opens the match index
+    manual = func.max(case((ReviewCandidate.band == BAND_MANUAL, 1), else_=0))
+    return db.session.query(PayerDetail.payer_name, PayerDetail.payer_id, manual, func.count()).outerjoin(
+        ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id
+    ).filter(PayerDetail.payer_id.isnot(None)).group_by(PayerDetail.payer_name, PayerDetail.payer_id)
+
+def changed_details_query(change_seq):
+    """Distinct detail_ids change_log has logged after change_seq"""
+    return db.session.query(ChangeLog.detail_id).filter(
+        ChangeLog.entity == CHANGE_DETAIL, ChangeLog.seq > change_seq
+    ).distinct()
+
+def alias_votes(raw_names=None):
+    """{normalized name: ({payer_id: (hand-mapped, detail count)}, raw names)} over payer details, or those with raw_names"""
+    query = alias_vote_query()
+    queries = [query] if raw_names is None else [
+        query.filter(PayerDetail.payer_name.in_(chunk)) for chunk in _chunks(raw_names)
+    ]
+    votes = {}
+    for rows in queries:
+        for payer_name, payer_id, hand_mapped, count in rows:
+            name = normalize_name(payer_name)
+            if name:
+                by_payer, raws = votes.setdefault(name, ({}, set()))
+                voted = by_payer.get(payer_id, (0, 0))
+                by_payer[payer_id] = (max(voted[0], hand_mapped), voted[1] + count)
+                raws.add(payer_name)
+    return votes
+
+def elect(votes):
+    """{normalized name: (payer_id, raw names)}: hand-mapped details decide, then the payer most details point to"""
+    # Ties go to the lowest payer_id, as position_by_name does
+    return {
+        name: (max(sorted(by_payer), key=by_payer.__getitem__), raws) for name, (by_payer, raws) in votes.items()
+    }
+
+def last_change_seq():
+    return db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+
+def build_aliases(path, version):
+    change_seq = last_change_seq()  # Read first, so a write racing the vote is re-voted by the next refresh
+    write_aliases(path, version, change_seq, elect(alias_votes()))
+
+def refresh_aliases(path, version, current):
+    """Rewrite the alias file at path from current, re-voting only the names of details changed since it was written.
+
+    Returns False, leaving the file alone, when that is more than
+    ALIAS_REFRESH_LIMIT details or some were deleted, since a deleted
+    detail's name is gone; build_aliases starts over then. A detail renamed
+    in place keeps voting under its old name until the next build, but
+    nothing renames details: loads insert them and mappings change payer_id only.
+    """
+    change_seq = last_change_seq()
+    detail_ids = [detail_id for detail_id, in changed_details_query(current.change_seq).limit(ALIAS_REFRESH_LIMIT + 1)]
+    if len(detail_ids) > ALIAS_REFRESH_LIMIT:
+        return False
+    changed = set()
+    for chunk in _chunks(detail_ids):
+        found = db.session.query(PayerDetail.payer_name).filter(PayerDetail.detail_id.in_(chunk)).all()
+        if len(found) < len(chunk):
+            return False
+        changed.update(payer_name for payer_name, in found)
+    names = current.names.tolist()
+    payer_ids = current.payer_ids.tolist()
+    raw_names = current.raw_names.tolist()
+    offsets = current.raw_offsets.tolist()
+    aliases = {
+        name: (payer_id, raw_names[offsets[idx]:offsets[idx + 1]])
+        for idx, (name, payer_id) in enumerate(zip(names, payer_ids))
+    }
+    affected = {normalize_name(payer_name) for payer_name in changed} - {''}
+    revote = set(changed)
+    for name in affected & aliases.keys():
+        revote.update(aliases.pop(name)[1])
+    aliases.update(elect(alias_votes(revote)))
+    write_aliases(path, version, change_seq, aliases)
+    return True
+
+def payer_rows_query():
+    """(payer_id, payer_name, pretty_name, group_id, group_name) of every canonical payer, as write_index takes them"""
+    return db.session.query(
+        Payer.payer_id, Payer.payer_name, Payer.pretty_name, Payer.group_id, PayerGroup.group_name
+    ).outerjoin(PayerGroup, PayerGroup.group_id == Payer.group_id)
+
+def build_index(path, version):
+    write_index(path, version, payer_rows_query().all())
+
+def open_index(version):
+    """MatchIndex for the given payers cache version, rebuilding the file first when it is missing or stale.
+
+    The payer count is checked too, since a recreated database starts its
+    versions over and could otherwise match a file left by the old one.
+    """
+    path = index_path()
+    try:
+        index = MatchIndex(path)
+        if index.version == version and len(index) == db.session.query(func.count(Payer.payer_id)).scalar():
+            return index
+    except (OSError, ValueError):
+        pass
+    build_index(path, version)
+    return MatchIndex(path)
+
+def open_aliases(version):
+    """AliasIndex for the given aliases cache version, refreshing or rebuilding the file first when it is stale.
+
+    A file written past the last change_log seq belongs to a recreated
+    database, and is rebuilt.
+    """
+    path = alias_path()
+    try:
+        current = AliasIndex(path)
+    except (OSError, ValueError):
+        current = None
+    if current is not None and current.change_seq <= last_change_seq():
+        if current.version == version:
+            return current
+        if refresh_aliases(path, version, current):
+            return AliasIndex(path)
+    build_aliases(path, version)
+    return AliasIndex(path)
\ No newline at end of file
@@ -0,0 +1,356 @@
+# backend/matching.py
+import bisect
+from array import array
+from collections import defaultdict
+
+import numpy as np
+from fuzzywuzzy import fuzz
+from rapidfuzz import process
+from rapidfuzz.distance import Indel
+from normalization import normalize_name
+
+AUTO_MATCH_THRESHOLD = 85
+REVIEW_THRESHOLD = 70
+TOP_K = 20
+CHUNK_SIZE = 1000
+UNMAPPED = -1  # _first_match result for a detail flagged for review
+
+# Characters outside the alphabet share the last bucket, which keeps the bound an over-estimate
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789 ,.-&/'
+CHAR_INDEX = {c: i for i, c in enumerate(ALPHABET)}
+OTHER_BUCKET = len(ALPHABET)
+
+# Every similarity call goes through these, instrumentation.instrument_similarity rebinds them to count and time
+_ratio = fuzz.ratio
+_cdist = process.cdist
+
+
+def get_similarity_score(name1, name2):
+    return _ratio(name1.lower(), name2.lower())
+
+def trigrams(text):
+    padded = f'  {text} '
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+def build_postings(names):
+    """{trigram: array of positions} over the normalized names, positions ascending"""
+    postings = defaultdict(lambda: array('q'))
+    for idx, name in enumerate(names):
+        for gram in set(trigrams(normalize_name(name))):
+            postings[gram].append(idx)
+    return postings
+
+def char_counts(text):
+    counts = np.zeros(OTHER_BUCKET + 1, dtype=np.int32)
+    for c in text:
+        counts[CHAR_INDEX.get(c, OTHER_BUCKET)] += 1
+    return counts
+
+
+class MatchEngine:
+    """Candidate generation and scoring over a growing list of canonical names.
+
+    fuzz.ratio is 2 * LCS / (len(a) + len(b)), and the LCS can never exceed the
+    characters two names share, so every entry gets a cheap upper bound on its
+    score. Only entries whose bound clears the threshold are blocked in, the
+    trigram index ranks them, and fuzz.ratio runs on as few as needed to return
+    exactly what a full scan would.
+    """
+
+    def __init__(self, names=(), top_k=TOP_K):
+        self.top_k = top_k
+        self.keys = []
+        self.names = []
+        self._lengths = np.zeros(64, dtype=np.int32)
+        self._counts = np.zeros((64, OTHER_BUCKET + 1), dtype=np.int32)
+        # array rather than list, so numpy reads posting lists through the buffer protocol without converting
+        self._postings = defaultdict(lambda: array('q'))
+        for key, name in names:
+            self.add(key, name)
+
+    @classmethod
+    def from_arrays(cls, keys, names, lengths, counts, postings=None, top_k=TOP_K):
+        """Engine over prebuilt lowercased names, char counts and trigram postings, e.g. a memory-mapped match_index.
+
+        The arrays are used as they are, without copying; such an engine is
+        read-only. postings maps a trigram to its ascending positions, and is
+        built from names when not given.
+        """
+        engine = cls(top_k=top_k)
+        engine.keys, engine.names, engine._lengths, engine._counts = keys, names, lengths, counts
+        engine._postings = build_postings(names) if postings is None else postings
+        return engine
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, name):
+        """Index a canonical name and return its position"""
+        idx = len(self.keys)
+        if idx == len(self._lengths):
+            self._lengths = np.concatenate([self._lengths, np.zeros_like(self._lengths)])
+            self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+        lowered = (name or '').lower()
+        self.keys.append(key)
+        self.names.append(lowered)
+        self._lengths[idx] = len(lowered)
+        self._counts[idx] = char_counts(lowered)
+        for gram in set(trigrams(normalize_name(name))):
+            self._postings[gram].append(idx)
+        return idx
+
+    def bounds(self, name, stop=None):
+        """Upper bound of the fuzz.ratio score against every entry before stop"""
+        stop = len(self.keys) if stop is None else stop
+        lowered = (name or '').lower()
+        common = np.minimum(self._counts[:stop], char_counts(lowered)).sum(axis=1)
+        lensum = self._lengths[:stop] + len(lowered)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            upper = np.where(lensum > 0, 200.0 * common / np.maximum(lensum, 1), 100.0)
+        return np.ceil(upper - 1e-9).astype(np.int32)
+
+    def candidates(self, name, limit=None):
+        """Top-K entry positions sharing the most trigrams with the normalized name, earlier entries first on ties"""
+        postings = [self._postings.get(gram, ()) for gram in set(trigrams(normalize_name(name)))]
+        postings = [positions for positions in postings if len(positions)]
+        if not postings:
+            return []
+        # One bincount over the posting lists instead of a Counter update per position
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        k = min(limit or self.top_k, np.count_nonzero(shared))
+        top = np.argpartition(-shared, k - 1)[:k]
+        return top[np.lexsort((top, -shared[top]))].tolist()
+
+    def score(self, name, idx):
+        return _ratio((name or '').lower(), self.names[idx])
+
+    def scan(self, name, min_score=REVIEW_THRESHOLD, stop=None):
+        """Yield (position, score) in insertion order for entries scoring above min_score"""
+        for idx in np.flatnonzero(self.bounds(name, stop) > min_score):
+            score = self.score(name, idx)
+            if score > min_score:
+                yield int(idx), score
+
+    def best_match(self, name, min_score=REVIEW_THRESHOLD):
+        """Return (key, score) of the highest scoring entry above min_score, else (None, 0).
+
+        Ties go to the earliest entry, the same as a full scan in insertion order.
+        """
+        if not self.keys:
+            return None, 0
+        upper = self.bounds(name)
+        blocked = upper > min_score
+        best_idx, best_score = None, min_score
+        scored = set()
+
+        def consider(idx):
+            nonlocal best_idx, best_score
+            scored.add(idx)
+            score = self.score(name, idx)
+            if score > best_score or (score == best_score and best_idx is not None and idx < best_idx):
+                best_idx, best_score = idx, score
+
+        # Seed with the trigram candidates so most of the bound check below prunes
+        for idx in self.candidates(name):
+            if blocked[idx]:
+                consider(idx)
+
+        remaining = np.flatnonzero(blocked & (upper >= best_score))
+        for idx in remaining[np.argsort(-upper[remaining], kind='stable')]:
+            if upper[idx] < best_score:
+                break
+            if upper[idx] == best_score and idx > best_idx:
+                continue
+            if idx not in scored:
+                consider(int(idx))
+
+        if best_idx is None:
+            return None, 0
+        return self.keys[best_idx], best_score
+
+    def best_matches(self, names, min_score=REVIEW_THRESHOLD):
+        return [self.best_match(name, min_score) for name in names]
+
+
+def brute_force_best_match(name, payer_names, min_score=REVIEW_THRESHOLD):
+    """Reference full scan used to check MatchEngine.best_match"""
+    best_id, best_score = None, min_score
+    for payer_id, canonical_name in payer_names.items():
+        score = get_similarity_score(name, canonical_name)
+        if score > best_score:
+            best_id, best_score = payer_id, score
+    return (best_id, best_score) if best_id is not None else (None, 0)
+
+
+def _seed_groups(seed):
+    """Start a greedy pass from groups an earlier pass created, given as (payer_id, payer_name, state)"""
+    payer_groups, group_keys, group_states, first_group_for_id = {}, [], [], {}
+    for payer_id, payer_name, state in seed:
+        key = (payer_id, payer_name)
+        payer_groups[key] = []
+        first_group_for_id.setdefault(payer_id, len(group_keys))
+        group_keys.append(key)
+        group_states.append(state)
+    return payer_groups, group_keys, group_states, first_group_for_id
+
+def _first_match(engine, detail, group_states, id_idx, limit=None):
+    """Position of the group greedy_group puts detail in among the first limit groups, UNMAPPED, or None for a new group"""
+    if limit is not None and id_idx is not None and id_idx >= limit:
+        id_idx = None
+    for idx, name_score in engine.scan(detail.payer_name, REVIEW_THRESHOLD, stop=limit if id_idx is None else id_idx):
+        if name_score > AUTO_MATCH_THRESHOLD and (detail.state or None) == group_states[idx]:
+            return idx
+        elif name_score <= AUTO_MATCH_THRESHOLD:
+            return UNMAPPED
+    return id_idx
+
+def greedy_group(details, engine=None, seed=()):
+    """Group details the way map_payers does: first existing group that matches wins.
+
+    A detail joins the first group whose canonical payer_id it shares or whose
+    name scores above AUTO_MATCH_THRESHOLD in the same state, and is flagged for
+    review when the first group scoring above REVIEW_THRESHOLD does not qualify.
+    Groups in seed come first and start empty. Returns (payer_groups, unmapped)
+    keyed by (payer_id, payer_name).
+    """
+    engine = engine if engine is not None else MatchEngine()
+    payer_groups, group_keys, group_states, first_group_for_id = _seed_groups(seed)
+    for key in group_keys:
+        engine.add(key, key[1])
+    unmapped = []
+
+    for detail in details:
+        idx = _first_match(engine, detail, group_states, first_group_for_id.get(detail.payer_id))
+        if idx == UNMAPPED:
+            unmapped.append(detail)
+        elif idx is not None:
+            payer_groups[group_keys[idx]].append(detail)
+        else:
+            key = (detail.payer_id, detail.payer_name)
+            payer_groups[key] = [detail]
+            first_group_for_id.setdefault(detail.payer_id, len(group_keys))
+            group_keys.append(key)
+            group_states.append(detail.state)
+            engine.add(key, detail.payer_name)
+
+    return payer_groups, unmapped
+
+def rematch(details, seed, founders):
+    """Repeat greedy_group's decision for details it placed in an earlier pass, after they were edited.
+
+    founders holds the founding detail_id of each seed group, in seed order.
+    Each detail sees only the groups founded before it, as in a full pass, and
+    joining a group never changes what later details match. Returns
+    (payer_groups, unmapped) over the seed keys, or None when a detail would now
+    found a group of its own, which only a full pass can place.
+    """
+    engine = MatchEngine()
+    payer_groups, group_keys, group_states, first_group_for_id = _seed_groups(seed)
+    for key in group_keys:
+        engine.add(key, key[1])
+    unmapped = []
+
+    for detail in details:
+        limit = bisect.bisect_left(founders, detail.detail_id)
+        idx = _first_match(engine, detail, group_states, first_group_for_id.get(detail.payer_id), limit)
+        if idx is None:
+            return None
+        if idx == UNMAPPED:
+            unmapped.append(detail)
+        else:
+            payer_groups[group_keys[idx]].append(detail)
+    return payer_groups, unmapped
+
+def score_matrix(queries, choices, workers=-1):
+    """fuzz.ratio of every lowercased query against every lowercased choice as a uint8 matrix.
+
+    RapidFuzz returns integer Indel distances, which are turned into the same
+    rounded percentages fuzz.ratio reports. Cells landing on a .5 boundary are
+    re-scored with fuzz.ratio so float noise can never flip the rounding.
+    """
+    distances = _cdist(queries, choices, scorer=Indel.distance, dtype=np.int32, workers=workers)
+    lensum = np.fromiter(map(len, queries), dtype=np.int32, count=len(queries))[:, None] + \
+        np.fromiter(map(len, choices), dtype=np.int32, count=len(choices))[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exact = np.where(lensum > 0, 100.0 * (lensum - distances) / np.maximum(lensum, 1), 100.0)
+    scores = np.rint(exact)
+    for i, j in zip(*np.nonzero(np.abs(exact - np.floor(exact) - 0.5) < 1e-6)):
+        scores[i, j] = _ratio(queries[i], choices[j])
+    return scores.astype(np.uint8)
+
+def batch_greedy_group(details, workers=-1, chunk_size=CHUNK_SIZE, seed=()):
+    """greedy_group driven by score matrices from RapidFuzz process.cdist.
+
+    Details are scored chunk_size rows at a time, which bounds memory, against
+    the groups that existed before the chunk plus the chunk's own names (the
+    only names that can become new groups within it). The first-match decisions
+    are then read off each row in the same order greedy_group makes them.
+    """
+    payer_groups, group_keys, group_states, first_group_for_id = _seed_groups(seed)
+    group_names = [(payer_name or '').lower() for _, payer_name in group_keys]
+    unmapped = []
+
+    for start in range(0, len(details), chunk_size):
+        chunk = details[start:start + chunk_size]
+        names = [(detail.payer_name or '').lower() for detail in chunk]
+        local = {}
+        local_columns = [local.setdefault(name, len(local)) for name in names]
+        prior = len(group_keys)
+        scores = score_matrix(names, group_names + list(local), workers)
+        group_columns = np.zeros(prior + len(chunk), dtype=np.int64)
+        group_columns[:prior] = np.arange(prior)
+
+        for offset, detail in enumerate(chunk):
+            row = scores[offset]
+            id_idx = first_group_for_id.get(detail.payer_id)
+            stop = len(group_keys) if id_idx is None else id_idx
+            group_scores = row[group_columns[:stop]]
+            matched = False
+            for idx in np.flatnonzero(group_scores > REVIEW_THRESHOLD):
+                key = group_keys[idx]
+                name_score = group_scores[idx]
+                if name_score > AUTO_MATCH_THRESHOLD and (detail.state or None) == group_states[idx]:
+                    payer_groups[key].append(detail)
+                    matched = True
+                    break
+                elif name_score <= AUTO_MATCH_THRESHOLD:
+                    unmapped.append(detail)
+                    matched = True
+                    break
+
+            if not matched and id_idx is not None:
+                payer_groups[group_keys[id_idx]].append(detail)
+                matched = True
+
+            if not matched:
+                key = (detail.payer_id, detail.payer_name)
+                payer_groups[key] = [detail]
+                first_group_for_id.setdefault(detail.payer_id, len(group_keys))
+                group_columns[len(group_keys)] = prior + local_columns[offset]
+                group_keys.append(key)
+                group_states.append(detail.state)
+                group_names.append(names[offset])
+
+    return payer_groups, unmapped
+
+def brute_force_greedy_group(details):
+    """Reference full scan used to check greedy_group"""
+    payer_groups = {}
+    unmapped = []
+    for detail in details:
+        matched = False
+        for key in payer_groups:
+            canonical_id, canonical_name = key
+            name_score = get_similarity_score(detail.payer_name, canonical_name)
+            if (detail.payer_id == canonical_id) or \
+               (name_score > AUTO_MATCH_THRESHOLD and (detail.state or None) == payer_groups[key][0].state):
+                payer_groups[key].append(detail)
+                matched = True
+                break
+            elif name_score > REVIEW_THRESHOLD and name_score <= AUTO_MATCH_THRESHOLD:
+                unmapped.append(detail)
+                matched = True
+                break
+        if not matched:
+            payer_groups[(detail.payer_id, detail.payer_name)] = [detail]
+    return payer_groups, unmapped
@@ -0,0 +1,41 @@
+"""Add jobs for background mapping and ingest runs
+
+Revision ID: 0b7e4f92a6c3
+Revises: f3c8a2d61b95
+Create Date: 2025-04-07 15:51:12.640297
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e4f92a6c3'
+down_revision = 'f3c8a2d61b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('job_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('params', sa.Text(), nullable=True),
+    sa.Column('phase', sa.String(length=50), nullable=True),
+    sa.Column('rows_processed', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('rows_total', sa.Integer(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), nullable=False, server_default=sa.false()),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('job_id')
+    )
+    op.create_index('ix_jobs_status', 'jobs', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status', table_name='jobs')
+    op.drop_table('jobs')
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""Add mapping_runs.last_change_seq so incremental mapping re-matches edited details
+
+Revision ID: 4b8e2d7c1f06
+Revises: 9a4c6e2b81f5
+Create Date: 2025-04-14 10:21:37.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2d7c1f06'
+down_revision = '9a4c6e2b81f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Runs before this one left it NULL, so the next map_payers run is a full one
+    op.add_column('mapping_runs', sa.Column('last_change_seq', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('mapping_runs', 'last_change_seq')
\ No newline at end of file
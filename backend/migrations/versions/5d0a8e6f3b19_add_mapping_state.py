@@ -0,0 +1,40 @@
+"""Add mapping_groups and mapping_runs for incremental mapping
+
+Revision ID: 5d0a8e6f3b19
+Revises: b41e7d93c2a5
+Create Date: 2025-03-26 14:05:52.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0a8e6f3b19'
+down_revision = 'b41e7d93c2a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mapping_groups',
+    sa.Column('position', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('payer_id', sa.String(length=50), nullable=False),
+    sa.Column('payer_name', sa.String(length=255), nullable=False),
+    sa.Column('state', sa.String(length=2), nullable=True),
+    sa.Column('founder_detail_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('position')
+    )
+    op.create_table('mapping_runs',
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('mode', sa.String(length=20), nullable=False),
+    sa.Column('last_detail_id', sa.Integer(), nullable=False),
+    sa.Column('details_matched', sa.Integer(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('run_id')
+    )
+
+
+def downgrade():
+    op.drop_table('mapping_runs')
+    op.drop_table('mapping_groups')
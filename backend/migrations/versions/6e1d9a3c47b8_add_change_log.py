@@ -0,0 +1,39 @@
+"""Add change_log for the /api/changes delta feed
+
+Revision ID: 6e1d9a3c47b8
+Revises: 0b7e4f92a6c3
+Create Date: 2025-04-09 10:37:24.581906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1d9a3c47b8'
+down_revision = '0b7e4f92a6c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('seq', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('entity', sa.String(length=10), nullable=False),
+    sa.Column('detail_id', sa.Integer(), nullable=True),
+    sa.Column('payer_id', sa.String(length=50), nullable=True),
+    sa.Column('group_id', sa.String(length=50), nullable=True),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+    # Existing rows go in as the first changes, so replaying from since=0 builds a full replica
+    op.execute("INSERT INTO change_log (entity, group_id, changed_at) "
+               "SELECT 'group', group_id, CURRENT_TIMESTAMP FROM payer_groups ORDER BY group_id")
+    op.execute("INSERT INTO change_log (entity, payer_id, changed_at) "
+               "SELECT 'payer', payer_id, CURRENT_TIMESTAMP FROM payers ORDER BY payer_id")
+    op.execute("INSERT INTO change_log (entity, detail_id, changed_at) "
+               "SELECT 'detail', detail_id, CURRENT_TIMESTAMP FROM payer_details ORDER BY detail_id")
+
+
+def downgrade():
+    op.drop_table('change_log')
\ No newline at end of file
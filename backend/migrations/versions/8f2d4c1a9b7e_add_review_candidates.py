@@ -0,0 +1,34 @@
+"""Add review_candidates index table
+
+Revision ID: 8f2d4c1a9b7e
+Revises: 3c961213a92c
+Create Date: 2025-03-22 10:12:41.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2d4c1a9b7e'
+down_revision = '3c961213a92c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('review_candidates',
+    sa.Column('detail_id', sa.Integer(), nullable=False),
+    sa.Column('best_payer_id', sa.String(length=50), nullable=True),
+    sa.Column('score', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('band', sa.String(length=20), nullable=False),
+    sa.ForeignKeyConstraint(['detail_id'], ['payer_details.detail_id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['best_payer_id'], ['payers.payer_id'], ),
+    sa.PrimaryKeyConstraint('detail_id')
+    )
+    op.create_index('ix_review_candidates_band_detail', 'review_candidates', ['band', 'detail_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_review_candidates_band_detail', table_name='review_candidates')
+    op.drop_table('review_candidates')
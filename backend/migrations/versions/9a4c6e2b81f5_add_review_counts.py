@@ -0,0 +1,34 @@
+"""Add review_counts, the review queue summary by source, state and band
+
+Revision ID: 9a4c6e2b81f5
+Revises: 6e1d9a3c47b8
+Create Date: 2025-04-11 09:52:13.204817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4c6e2b81f5'
+down_revision = '6e1d9a3c47b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('review_counts',
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('state', sa.String(length=2), nullable=False),
+    sa.Column('band', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('source', 'state', 'band')
+    )
+    op.execute("INSERT INTO review_counts (source, state, band, count) "
+               "SELECT COALESCE(d.source, ''), COALESCE(d.state, ''), c.band, COUNT(*) "
+               "FROM review_candidates c JOIN payer_details d ON d.detail_id = c.detail_id "
+               "GROUP BY COALESCE(d.source, ''), COALESCE(d.state, ''), c.band")
+
+
+def downgrade():
+    op.drop_table('review_counts')
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""Align column widths and constraints with models.py and index the hot query paths
+
+Revision ID: a94f3d6b2e71
+Revises: e2b58c1d7f40
+Create Date: 2025-04-02 14:08:51.402233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a94f3d6b2e71'
+down_revision = 'e2b58c1d7f40'
+branch_labels = None
+depends_on = None
+
+
+# Spelled-out state names seen in exports, mapped to the codes payer_details.state holds from here on
+STATE_CODES = {
+    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA', 'COLORADO': 'CO',
+    'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'DISTRICT OF COLUMBIA': 'DC', 'FLORIDA': 'FL', 'GEORGIA': 'GA',
+    'HAWAII': 'HI', 'IDAHO': 'ID', 'ILLINOIS': 'IL', 'INDIANA': 'IN', 'IOWA': 'IA', 'KANSAS': 'KS',
+    'KENTUCKY': 'KY', 'LOUISIANA': 'LA', 'MAINE': 'ME', 'MARYLAND': 'MD', 'MASSACHUSETTS': 'MA',
+    'MICHIGAN': 'MI', 'MINNESOTA': 'MN', 'MISSISSIPPI': 'MS', 'MISSOURI': 'MO', 'MONTANA': 'MT',
+    'NEBRASKA': 'NE', 'NEVADA': 'NV', 'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ', 'NEW MEXICO': 'NM',
+    'NEW YORK': 'NY', 'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH', 'OKLAHOMA': 'OK',
+    'OREGON': 'OR', 'PENNSYLVANIA': 'PA', 'PUERTO RICO': 'PR', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC',
+    'SOUTH DAKOTA': 'SD', 'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT', 'VIRGINIA': 'VA',
+    'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
+}
+
+
+def normalize_states():
+    """Trim and upper-case payer_details.state, map state names to codes, and refuse to narrow anything else"""
+    bind = op.get_bind()
+    bind.execute(sa.text(
+        "UPDATE payer_details SET state = UPPER(REGEXP_REPLACE(TRIM(state), '\\s+', ' ', 'g')) "
+        "WHERE state <> UPPER(REGEXP_REPLACE(TRIM(state), '\\s+', ' ', 'g'))"
+    ))
+    names = sa.values(sa.column('name', sa.String), sa.column('code', sa.String), name='names').data(
+        list(STATE_CODES.items())
+    )
+    details = sa.table('payer_details', sa.column('state', sa.String))
+    bind.execute(details.update().where(details.c.state == names.c.name).values(state=names.c.code))
+    invalid = bind.execute(sa.text(
+        "SELECT state, COUNT(*) FROM payer_details WHERE LENGTH(state) > 2 GROUP BY state ORDER BY 2 DESC LIMIT 10"
+    )).all()
+    if invalid:
+        listed = ', '.join(f"{state!r} ({count} rows)" for state, count in invalid)
+        raise RuntimeError(f"payer_details.state has values that are not state codes or names: {listed}. "
+                           "Correct or clear them, then run the upgrade again.")
+
+def qualify_duplicate_names():
+    """Append its payer_id to every payer but the first sharing a (payer_name, group_id), as the loaders' qualified_name does"""
+    bind = op.get_bind()
+    renamed = bind.execute(sa.text("""
+        UPDATE payers p
+        SET payer_name = LEFT(p.payer_name, 252 - LENGTH(p.payer_id)) || ' (' || p.payer_id || ')'
+        FROM (
+            SELECT payer_id, ROW_NUMBER() OVER (PARTITION BY payer_name, group_id ORDER BY payer_id) AS n
+            FROM payers
+        ) d
+        WHERE d.payer_id = p.payer_id AND d.n > 1
+    """)).rowcount
+    if renamed:
+        print(f"Appended the payer_id to {renamed} payer names another payer in their group holds")
+        # The payer cache and match index key on this version
+        bind.execute(sa.text("UPDATE cache_versions SET version = version + 1 WHERE name = 'payers'"))
+    duplicates = bind.execute(sa.text(
+        "SELECT payer_name, group_id, COUNT(*) FROM payers GROUP BY payer_name, group_id HAVING COUNT(*) > 1 "
+        "ORDER BY 3 DESC LIMIT 10"
+    )).all()
+    if duplicates:
+        listed = ', '.join(f"{name!r} in {group_id!r} ({count} payers)" for name, group_id, count in duplicates)
+        raise RuntimeError(f"payers still has names held more than once in a group: {listed}. "
+                           "Rename or merge them, then run the upgrade again.")
+
+def create_trigram_indexes():
+    """Trigram GIN indexes for MATCH_BACKEND=pg_trgm, only where the pg_trgm extension can be installed"""
+    bind = op.get_bind()
+    bind.execute(sa.text("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            END IF;
+        EXCEPTION WHEN insufficient_privilege THEN
+            NULL;
+        END $$
+    """))
+    if not bind.execute(sa.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        print("pg_trgm is not available, skipping the trigram indexes")
+        return
+    op.create_index('ix_payers_payer_name_trgm', 'payers', ['payer_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'payer_name': 'gin_trgm_ops'})
+    op.create_index('ix_payer_details_payer_name_trgm', 'payer_details', ['payer_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'payer_name': 'gin_trgm_ops'})
+
+
+def upgrade():
+
+    op.alter_column('payer_groups', 'group_name', existing_type=sa.String(length=100), type_=sa.String(length=255), existing_nullable=False)
+    op.create_unique_constraint('payer_groups_group_name_key', 'payer_groups', ['group_name'])
+
+    op.alter_column('payers', 'payer_name', existing_type=sa.String(length=100), type_=sa.String(length=255), existing_nullable=False)
+    op.alter_column('payers', 'pretty_name', existing_type=sa.String(length=100), type_=sa.String(length=255), existing_nullable=True)
+    op.alter_column('payers', 'group_id', existing_type=sa.String(length=50), nullable=False)
+    qualify_duplicate_names()
+    op.create_unique_constraint('uq_payer_name_group', 'payers', ['payer_name', 'group_id'])
+    op.create_index(op.f('ix_payers_group_id'), 'payers', ['group_id'], unique=False)
+
+    op.alter_column('payer_details', 'payer_name', existing_type=sa.String(length=100), type_=sa.String(length=255), nullable=False)
+    op.alter_column('payer_details', 'payer_id', existing_type=sa.String(length=50), nullable=False)
+    op.alter_column('payer_details', 'source', existing_type=sa.String(length=50), type_=sa.String(length=255), existing_nullable=True)
+    normalize_states()
+    op.alter_column('payer_details', 'state', existing_type=sa.String(length=50), type_=sa.String(length=2), existing_nullable=True)
+    op.create_index(op.f('ix_payer_details_payer_id'), 'payer_details', ['payer_id'], unique=False)
+    op.create_index('ix_payer_details_source_state', 'payer_details', ['source', 'state'], unique=False)
+    create_trigram_indexes()
+
+
+def downgrade():
+    op.drop_index('ix_payer_details_payer_name_trgm', table_name='payer_details', if_exists=True)
+    op.drop_index('ix_payer_details_source_state', table_name='payer_details')
+    op.drop_index(op.f('ix_payer_details_payer_id'), table_name='payer_details')
+    op.alter_column('payer_details', 'state', existing_type=sa.String(length=2), type_=sa.String(length=50), existing_nullable=True)
+    op.alter_column('payer_details', 'source', existing_type=sa.String(length=255), type_=sa.String(length=50), existing_nullable=True)
+    op.alter_column('payer_details', 'payer_id', existing_type=sa.String(length=50), nullable=True)
+    op.alter_column('payer_details', 'payer_name', existing_type=sa.String(length=255), type_=sa.String(length=100), nullable=True)
+
+    op.drop_index('ix_payers_payer_name_trgm', table_name='payers', if_exists=True)
+    op.drop_index(op.f('ix_payers_group_id'), table_name='payers')
+    op.drop_constraint('uq_payer_name_group', 'payers', type_='unique')
+    op.alter_column('payers', 'group_id', existing_type=sa.String(length=50), nullable=True)
+    op.alter_column('payers', 'pretty_name', existing_type=sa.String(length=255), type_=sa.String(length=100), existing_nullable=True)
+    op.alter_column('payers', 'payer_name', existing_type=sa.String(length=255), type_=sa.String(length=100), existing_nullable=False)
+
+    op.drop_constraint('payer_groups_group_name_key', 'payer_groups', type_='unique')
+    op.alter_column('payer_groups', 'group_name', existing_type=sa.String(length=255), type_=sa.String(length=100), existing_nullable=False)
\ No newline at end of file
@@ -0,0 +1,26 @@
+"""Add payer_details.source_row for idempotent bulk loads
+
+Revision ID: b41e7d93c2a5
+Revises: 8f2d4c1a9b7e
+Create Date: 2025-03-24 09:41:03.227814
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41e7d93c2a5'
+down_revision = '8f2d4c1a9b7e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payer_details', sa.Column('source_row', sa.String(length=300), nullable=True))
+    op.create_unique_constraint('uq_payer_details_source_row', 'payer_details', ['source_row'])
+
+
+def downgrade():
+    op.drop_constraint('uq_payer_details_source_row', 'payer_details', type_='unique')
+    op.drop_column('payer_details', 'source_row')
@@ -0,0 +1,28 @@
+"""Add payer_groups.parent_group_id for the stored hierarchy
+
+Revision ID: c7a19e2f4d83
+Revises: 5d0a8e6f3b19
+Create Date: 2025-03-28 11:23:17.640952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a19e2f4d83'
+down_revision = '5d0a8e6f3b19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payer_groups', sa.Column('parent_group_id', sa.String(length=50), nullable=True))
+    op.create_index(op.f('ix_payer_groups_parent_group_id'), 'payer_groups', ['parent_group_id'], unique=False)
+    op.create_foreign_key('fk_payer_groups_parent_group_id', 'payer_groups', 'payer_groups', ['parent_group_id'], ['group_id'])
+
+
+def downgrade():
+    op.drop_constraint('fk_payer_groups_parent_group_id', 'payer_groups', type_='foreignkey')
+    op.drop_index(op.f('ix_payer_groups_parent_group_id'), table_name='payer_groups')
+    op.drop_column('payer_groups', 'parent_group_id')
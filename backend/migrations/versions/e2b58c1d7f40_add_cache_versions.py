@@ -0,0 +1,29 @@
+"""Add cache_versions for invalidating in-process caches
+
+Revision ID: e2b58c1d7f40
+Revises: c7a19e2f4d83
+Create Date: 2025-03-31 09:42:05.118374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b58c1d7f40'
+down_revision = 'c7a19e2f4d83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions = op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(cache_versions, [{'name': 'payers', 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('cache_versions')
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""Add cluster_members for union-find payer clustering
+
+Revision ID: f3c8a2d61b95
+Revises: a94f3d6b2e71
+Create Date: 2025-04-05 11:26:37.904152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a2d61b95'
+down_revision = 'a94f3d6b2e71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cluster_members',
+    sa.Column('detail_id', sa.Integer(), nullable=False),
+    sa.Column('cluster_id', sa.String(length=50), nullable=False),
+    sa.Column('source_payer_id', sa.String(length=50), nullable=True),
+    sa.ForeignKeyConstraint(['detail_id'], ['payer_details.detail_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('detail_id')
+    )
+    op.create_index('ix_cluster_members_cluster_id', 'cluster_members', ['cluster_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cluster_members_cluster_id', table_name='cluster_members')
+    op.drop_table('cluster_members')
\ No newline at end of file
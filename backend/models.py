@@ -1,20 +1,49 @@
 # backend/models.py
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, text
 
 db = SQLAlchemy()
 
+# pg_trgm is optional: created when the server offers it and the role may, the trigram GIN indexes
+# below are built only once it is installed, and other dialects skip both. MATCH_BACKEND=pg_trgm needs it.
+CREATE_PG_TRGM = DDL("""
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        END IF;
+    EXCEPTION WHEN insufficient_privilege THEN
+        NULL;
+    END $$
+""")
+event.listen(db.metadata, 'before_create', CREATE_PG_TRGM.execute_if(dialect='postgresql'))
+
+def has_pg_trgm(connection):
+    return connection.dialect.name == 'postgresql' and \
+        bool(connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar())
+
+def trigram_index(name, column):
+    return db.Index(name, column, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(
+        dialect='postgresql', callable_=lambda ddl, target, bind, **kw: bind is not None and has_pg_trgm(bind)
+    )
+
 class PayerGroup(db.Model):
     __tablename__ = 'payer_groups'
     group_id = db.Column(db.String(50), primary_key=True)  # Alphanumeric ID (e.g., "DD")
     group_name = db.Column(db.String(255), nullable=False, unique=True)  # Name of the group (e.g., "Delta Dental")
+    parent_group_id = db.Column(db.String(50), db.ForeignKey('payer_groups.group_id'), nullable=True, index=True)  # Inferred parent, see hierarchy.py
 
 class Payer(db.Model):
     __tablename__ = 'payers'
     payer_id = db.Column(db.String(50), primary_key=True)  # Alphanumeric ID (e.g., "86027")
     payer_name = db.Column(db.String(255), nullable=False)  # Name of the payer (e.g., "Delta Dental of Arizona")
     pretty_name = db.Column(db.String(255), nullable=True)  # Standardized display name (e.g., "Delta Dental AZ")
-    group_id = db.Column(db.String(50), db.ForeignKey('payer_groups.group_id'), nullable=False)
-    __table_args__ = (db.UniqueConstraint('payer_name', 'group_id', name='uq_payer_name_group'),)
+    group_id = db.Column(db.String(50), db.ForeignKey('payer_groups.group_id'), nullable=False, index=True)
+    __table_args__ = (
+        db.UniqueConstraint('payer_name', 'group_id', name='uq_payer_name_group'),
+        trigram_index('ix_payers_payer_name_trgm', 'payer_name'),
+    )
 
 class PayerDetail(db.Model):
     __tablename__ = 'payer_details'
@@ -22,4 +51,79 @@ class PayerDetail(db.Model):
     payer_id = db.Column(db.String(50), db.ForeignKey('payers.payer_id'), nullable=False, index=True)
     payer_name = db.Column(db.String(255), nullable=False)  # Payer name from raw data
     state = db.Column(db.String(2))  # State abbreviation (e.g., "AZ")
-    source = db.Column(db.String(255))  # Source of the data (e.g., "Vyne", "Availity")
\ No newline at end of file
+    source = db.Column(db.String(255))  # Source of the data (e.g., "Vyne", "Availity")
+    source_row = db.Column(db.String(300), nullable=True)  # File hash, sheet and row a bulk load read it from (e.g., "3f2a9c1e0b7d4a85:Vyne:12")
+    __table_args__ = (
+        db.UniqueConstraint('source_row', name='uq_payer_details_source_row'),
+        db.Index('ix_payer_details_source_state', 'source', 'state'),
+        trigram_index('ix_payer_details_payer_name_trgm', 'payer_name'),
+    )
+
+class ReviewCandidate(db.Model):
+    __tablename__ = 'review_candidates'
+    detail_id = db.Column(db.Integer, db.ForeignKey('payer_details.detail_id', ondelete='CASCADE'), primary_key=True)
+    best_payer_id = db.Column(db.String(50), db.ForeignKey('payers.payer_id'), nullable=True)  # Closest canonical payer
+    score = db.Column(db.Integer, nullable=False, default=0)  # Similarity score of the best match (0-100)
+    band = db.Column(db.String(20), nullable=False)  # "auto_match", "review", "unmapped" or "manual"
+    __table_args__ = (db.Index('ix_review_candidates_band_detail', 'band', 'detail_id'),)
+
+class ReviewCount(db.Model):
+    __tablename__ = 'review_counts'
+    source = db.Column(db.String(255), primary_key=True)  # Detail source, '' when it has none
+    state = db.Column(db.String(2), primary_key=True)  # Detail state, '' when it has none
+    band = db.Column(db.String(20), primary_key=True)  # Review candidate band, see review_counts.py
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class MappingGroup(db.Model):
+    __tablename__ = 'mapping_groups'
+    position = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Order the greedy pass created the group in
+    payer_id = db.Column(db.String(50), nullable=False)  # Canonical payer the group maps to
+    payer_name = db.Column(db.String(255), nullable=False)  # Canonical name new details are scored against
+    state = db.Column(db.String(2))  # State of the detail that founded the group
+    founder_detail_id = db.Column(db.Integer, nullable=False)
+
+class ClusterMember(db.Model):
+    __tablename__ = 'cluster_members'
+    detail_id = db.Column(db.Integer, db.ForeignKey('payer_details.detail_id', ondelete='CASCADE'), primary_key=True)
+    cluster_id = db.Column(db.String(50), nullable=False, index=True)  # Representative payer_id of the detail's cluster
+    source_payer_id = db.Column(db.String(50), nullable=True)  # payer_id the detail was loaded with, before mapping rewrote it
+
+class MappingRun(db.Model):
+    __tablename__ = 'mapping_runs'
+    run_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    mode = db.Column(db.String(20), nullable=False)  # "full" or "incremental"
+    last_detail_id = db.Column(db.Integer, nullable=False)  # High-water mark: details up to here have been matched
+    last_change_seq = db.Column(db.BigInteger, nullable=True)  # change_log seq past the run's own writes, later detail edits are re-matched
+    details_matched = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True)  # Cached dataset (e.g., "payers")
+    version = db.Column(db.Integer, nullable=False, default=0)  # Bumped by every write that changes the dataset
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(20), nullable=False)  # "map_payers" or "load_data", see jobs.JOB_KINDS
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, succeeded, failed, cancelled
+    params = db.Column(db.Text, nullable=True)  # JSON keyword arguments for the job
+    phase = db.Column(db.String(50), nullable=True)  # What a running job is doing (e.g., "mapping")
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    rows_total = db.Column(db.Integer, nullable=True)  # Known once the job has counted its work
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    message = db.Column(db.Text, nullable=True)  # Why a job failed
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)  # Heartbeat of a running job
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)  # Commit order, see changes.py
+    entity = db.Column(db.String(10), nullable=False)  # "detail", "payer" or "group"
+    detail_id = db.Column(db.Integer, nullable=True)  # Key of the changed row, set for its entity only
+    payer_id = db.Column(db.String(50), nullable=True)
+    group_id = db.Column(db.String(50), nullable=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
\ No newline at end of file
@@ -0,0 +1,59 @@
+# backend/normalization.py
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+# Suffixes dropped from display and match names, removed in this order
+SUFFIXES = ['Inc', 'Corporation', 'LLC', 'Administrators', 'Services', 'Plans']
+PARENTHESIZED_PATTERN = re.compile(r'\s*\([^)]*\)')
+SUFFIX_PATTERNS = [re.compile(rf'\s+{suffix}$', re.IGNORECASE) for suffix in SUFFIXES]
+
+# payer_details.state holds two-letter codes; spelled-out names in exports are mapped to them
+STATE_CODES = {
+    'ALABAMA': 'AL', 'ALASKA': 'AK', 'ARIZONA': 'AZ', 'ARKANSAS': 'AR', 'CALIFORNIA': 'CA', 'COLORADO': 'CO',
+    'CONNECTICUT': 'CT', 'DELAWARE': 'DE', 'DISTRICT OF COLUMBIA': 'DC', 'FLORIDA': 'FL', 'GEORGIA': 'GA',
+    'HAWAII': 'HI', 'IDAHO': 'ID', 'ILLINOIS': 'IL', 'INDIANA': 'IN', 'IOWA': 'IA', 'KANSAS': 'KS',
+    'KENTUCKY': 'KY', 'LOUISIANA': 'LA', 'MAINE': 'ME', 'MARYLAND': 'MD', 'MASSACHUSETTS': 'MA',
+    'MICHIGAN': 'MI', 'MINNESOTA': 'MN', 'MISSISSIPPI': 'MS', 'MISSOURI': 'MO', 'MONTANA': 'MT',
+    'NEBRASKA': 'NE', 'NEVADA': 'NV', 'NEW HAMPSHIRE': 'NH', 'NEW JERSEY': 'NJ', 'NEW MEXICO': 'NM',
+    'NEW YORK': 'NY', 'NORTH CAROLINA': 'NC', 'NORTH DAKOTA': 'ND', 'OHIO': 'OH', 'OKLAHOMA': 'OK',
+    'OREGON': 'OR', 'PENNSYLVANIA': 'PA', 'PUERTO RICO': 'PR', 'RHODE ISLAND': 'RI', 'SOUTH CAROLINA': 'SC',
+    'SOUTH DAKOTA': 'SD', 'TENNESSEE': 'TN', 'TEXAS': 'TX', 'UTAH': 'UT', 'VERMONT': 'VT', 'VIRGINIA': 'VA',
+    'WASHINGTON': 'WA', 'WEST VIRGINIA': 'WV', 'WISCONSIN': 'WI', 'WYOMING': 'WY',
+}
+
+
+def strip_name(name):
+    """Payer name without parenthesized notes or corporate suffixes"""
+    name = PARENTHESIZED_PATTERN.sub('', name or '')
+    for pattern in SUFFIX_PATTERNS:
+        name = pattern.sub('', name)
+    return name
+
+def _capitalize(stripped):
+    words = stripped.split()
+    return ''.join(word.capitalize() for word in words[:2]) if len(words) > 1 else stripped.capitalize()
+
+@lru_cache(maxsize=65536)
+def normalize_name(name):
+    """Lowercase a payer name without parenthesized notes or corporate suffixes"""
+    return ' '.join(strip_name(name).lower().split())
+
+def normalize_state(state):
+    """Upper-case two-letter code for a state code or name, blank as given, None when it is neither"""
+    if not state or not state.strip():
+        return state
+    state = ' '.join(state.upper().split())
+    return state if len(state) <= 2 else STATE_CODES.get(state)
+
+def generate_pretty_name(payer_name):
+    return _capitalize(strip_name(payer_name))
+
+def pretty_names(names):
+    """generate_pretty_name over a Series, computed once per unique name with pandas string methods"""
+    unique = pd.Series(pd.unique(names), dtype=object)
+    stripped = unique.fillna('').astype(str).str.replace(PARENTHESIZED_PATTERN, '', regex=True)
+    for pattern in SUFFIX_PATTERNS:
+        stripped = stripped.str.replace(pattern, '', regex=True)
+    return names.map(dict(zip(unique, stripped.map(_capitalize))))
\ No newline at end of file
@@ -0,0 +1,121 @@
+# backend/pagination.py
+import base64
+from bisect import bisect_right
+import json
+import time
+from flask import abort, request
+from sqlalchemy import text
+from models import db
+
+COUNT_CACHE_SECONDS = 30
+CURSOR_TYPES = (str, int, float)  # A cursor holds one listing key, never a list or object
+ESTIMATE_COUNT = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)")
+
+_count_cache = {}
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def parse_cursor(token, kind=CURSOR_TYPES):
+    """The key a cursor token holds, raising ValueError unless it is a single key of type kind"""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise ValueError("Invalid cursor")
+    return value
+
+def decode_cursor(token, kind=CURSOR_TYPES):
+    try:
+        return parse_cursor(token, kind)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+def request_page_args(default_per_page):
+    """page_args of the current request, a 400 when they are not valid"""
+    try:
+        return page_args(request.args, default_per_page)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+def paginate(query, key_column, key_of, default_per_page):
+    """Page a query by ?cursor= (keyset on key_column) or the older ?page= offsets.
+
+    Returns (rows, meta). next_cursor is set whenever a full page came back, so
+    page-based clients can switch to cursors at any point.
+    """
+    per_page, cursor, page = request_page_args(default_per_page)
+    query = query.order_by(key_column)
+    if cursor:
+        rows = query.filter(key_column > decode_cursor(cursor, key_column.type.python_type)).limit(per_page).all()
+    else:
+        rows = query.offset((page - 1) * per_page).limit(per_page).all()
+    return rows, page_meta(rows, key_of, page, per_page)
+
+def paginate_sorted(keys, default_per_page):
+    """paginate over an in-memory sorted list of keys, see payer_cache"""
+    per_page, cursor, page = request_page_args(default_per_page)
+    kind = type(keys[0]) if keys else CURSOR_TYPES
+    return slice_sorted(keys, per_page, decode_cursor(cursor, kind) if cursor else None, page)
+
+def slice_sorted(keys, per_page, cursor, page):
+    """One page of sorted keys after a decoded cursor, else by page number, with its meta"""
+    start = bisect_right(keys, cursor) if cursor is not None else (page - 1) * per_page
+    rows = keys[start:start + per_page]
+    return rows, page_meta(rows, lambda key: key, page, per_page)
+
+def page_args(args, default_per_page):
+    """(per_page, cursor token, page) from query args, page None when paging by cursor.
+
+    Raises ValueError when per_page or page is not a positive integer.
+    """
+    per_page = _positive_int(args, 'per_page', default_per_page)
+    cursor = args.get('cursor')
+    page = None if cursor else _positive_int(args, 'page', 1)
+    return per_page, cursor, page
+
+def _positive_int(args, name, default):
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+def page_meta(rows, key_of, page, per_page):
+    next_cursor = encode_cursor(key_of(rows[-1])) if rows and len(rows) == per_page else None
+    return {"page": page, "per_page": per_page, "next_cursor": next_cursor}
+
+def total_count(name, query, table=None):
+    """Row count for a listing: exact with ?exact_total=true, otherwise estimated and cached.
+
+    Unfiltered PostgreSQL tables use the planner's pg_class.reltuples estimate;
+    everything else is counted once and reused for COUNT_CACHE_SECONDS.
+    """
+    if wants_exact_total(request.args):
+        return query.count()
+    count = cached_count(name)
+    if count is not None:
+        return count
+    if table is not None and db.engine.dialect.name == 'postgresql':
+        count = db.session.execute(ESTIMATE_COUNT, {"table": table}).scalar()
+    if count is None or count <= 0:
+        count = query.count()
+    return cache_count(name, count)
+
+def wants_exact_total(args):
+    return args.get('exact_total', '').lower() in ('1', 'true', 'yes')
+
+def cached_count(name):
+    cached = _count_cache.get(name)
+    return cached[0] if cached and cached[1] > time.monotonic() else None
+
+def cache_count(name, count):
+    _count_cache[name] = (count, time.monotonic() + COUNT_CACHE_SECONDS)
+    return count
+
+def invalidate_count(name):
+    _count_cache.pop(name, None)
\ No newline at end of file
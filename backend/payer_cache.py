@@ -0,0 +1,78 @@
+# backend/payer_cache.py
+import threading
+from collections import namedtuple
+from flask import g, has_request_context
+from sqlalchemy import update
+from match_index import open_aliases, open_index
+from models import db, CacheVersion
+
+PAYERS = 'payers'
+ALIASES = 'aliases'  # Moves when payer details are added or change payer, see match_index.AliasIndex
+
+PayerSnapshot = namedtuple('PayerSnapshot', 'version by_id ids engine')
+
+_snapshot = PayerSnapshot(None, {}, [], None)
+_aliases = None
+_lock = threading.Lock()
+_aliases_lock = threading.Lock()
+
+
+def current_version(name=PAYERS):
+    return db.session.query(CacheVersion.version).filter(CacheVersion.name == name).scalar() or 0
+
+def bump_version(name=PAYERS):
+    """Invalidate every process's cached copy once the caller's transaction commits"""
+    updated = db.session.execute(
+        update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+def load_snapshot(version):
+    index = open_index(version)
+    return PayerSnapshot(version, index, index.payer_ids, index.engine)
+
+def payer_snapshot():
+    """Canonical payers with derived names and their MatchEngine, reloaded only when the payers version row has moved.
+
+    Reloading maps the shared match_index file, which is rebuilt first if no
+    process has written one for this version yet.
+
+    The version is read before the table, so a write racing the reload can
+    only cause one extra reload, never a stale snapshot tagged as current.
+    Within a request the version is checked once.
+    """
+    global _snapshot
+    if has_request_context() and 'payer_snapshot' in g:
+        return g.payer_snapshot
+    version = current_version()
+    snapshot = _snapshot
+    if snapshot.version != version:
+        with _lock:
+            if _snapshot.version != version:
+                _snapshot = load_snapshot(version)
+            snapshot = _snapshot
+    if has_request_context():
+        g.payer_snapshot = snapshot
+    return snapshot
+
+def detail_aliases():
+    """AliasIndex of the names payer details carry, remapped only when the aliases version row has moved.
+
+    Kept apart from payer_snapshot, so mapping a detail leaves the payers
+    snapshot warm. The shared file is caught up from change_log by the first
+    process to see the new version, see match_index.open_aliases.
+    """
+    global _aliases
+    if has_request_context() and 'detail_aliases' in g:
+        return g.detail_aliases
+    version = current_version(ALIASES)
+    aliases = _aliases
+    if aliases is None or aliases.version != version:
+        with _aliases_lock:
+            if _aliases is None or _aliases.version != version:
+                _aliases = open_aliases(version)
+            aliases = _aliases
+    if has_request_context():
+        g.detail_aliases = aliases
+    return aliases
@@ -0,0 +1,131 @@
+# backend/resolver.py
+import threading
+from functools import lru_cache
+from flask import current_app
+from candidates import BAND_AUTO_MATCH, BAND_REVIEW, BAND_UNMAPPED
+from match_index import MatchIndex
+from matching import AUTO_MATCH_THRESHOLD, REVIEW_THRESHOLD
+from normalization import normalize_name
+from payer_cache import detail_aliases, payer_snapshot
+
+MATCH_PAYER_ID = 'payer_id'
+MATCH_NAME = 'name'
+MATCH_ALIAS = 'alias'
+MATCH_FUZZY = 'fuzzy'
+MAX_RESOLVE_ITEMS = 10000
+RESOLVE_FIELDS = ('payer_name', 'payer_id', 'state', 'source')
+
+_resolver = None
+_lock = threading.Lock()
+_worker_index = None
+
+
+class Resolver:
+    """Resolves raw remittance payer references against one payer snapshot and one AliasIndex.
+
+    A payer_id that is a canonical payer wins, then a canonical payer with the
+    same normalized name, then the payer details with that name are mapped to,
+    then the closest name from the snapshot's MatchEngine. Results are kept in an LRU cache that lives as long as the
+    snapshot and aliases, so a payers change or a new mapping starts a fresh cache.
+    """
+
+    def __init__(self, snapshot, aliases, cache_size):
+        self.snapshot = snapshot
+        self.aliases = aliases
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, payer_id, payer_name):
+        """(position, confidence, match) for a reference, position None when nothing scores above REVIEW_THRESHOLD"""
+        return self.exact(payer_id, payer_name) or self.fuzzy(payer_name)
+
+    def exact(self, payer_id, payer_name):
+        """(position, 100, match) for a canonical payer_id, normalized name or detail name alias, else None"""
+        index = self.snapshot.by_id
+        if payer_id:
+            position = index.position(payer_id)
+            if position is not None:
+                return position, 100, MATCH_PAYER_ID
+        if payer_name:
+            name = normalize_name(payer_name)
+            position = index.position_by_name(name)
+            if position is not None:
+                return position, 100, MATCH_NAME
+            payer_id = self.aliases.payer_id(name)
+            position = index.position(payer_id) if payer_id is not None else None
+            if position is not None:
+                return position, 100, MATCH_ALIAS
+        return None
+
+    def fuzzy(self, payer_name):
+        if not payer_name:
+            return None, 0, None
+        return self.fuzzy_found(*self.snapshot.engine.best_match(payer_name, REVIEW_THRESHOLD))
+
+    def fuzzy_found(self, key, score):
+        """(position, confidence, match) for a best_match result"""
+        position = self.snapshot.by_id.position(key) if key is not None else None
+        return (position, score, MATCH_FUZZY) if position is not None else (None, 0, None)
+
+    def resolve(self, payer_id=None, payer_name=None, state=None, source=None):
+        """Canonical payer and confidence for a reference as it appears on an ERA.
+
+        state and source are accepted so remittance records can be posted
+        as they are; canonical payers carry neither, so they do not change
+        the result.
+        """
+        return self.result(*self.lookup(*reference_key(payer_id, payer_name)))
+
+    def result(self, position, confidence, match):
+        if position is None:
+            return {"payer_id": None, "payer_name": None, "pretty_name": None, "group_id": None, "group_name": None,
+                    "confidence": 0, "match": None, "band": BAND_UNMAPPED}
+        payer = self.snapshot.by_id.entry(position)
+        return {
+            "payer_id": payer.payer_id,
+            "payer_name": payer.payer_name,
+            "pretty_name": payer.pretty_name,
+            "group_id": payer.group_id,
+            "group_name": payer.group_name,
+            "confidence": confidence,
+            "match": match,
+            "band": BAND_AUTO_MATCH if confidence > AUTO_MATCH_THRESHOLD else BAND_REVIEW,
+        }
+
+
+def resolver():
+    """Resolver for the current payer snapshot and aliases, replaced with an empty cache when either reloads"""
+    global _resolver
+    snapshot, aliases = payer_snapshot(), detail_aliases()
+    current = _resolver
+    if current is None or current.snapshot is not snapshot or current.aliases is not aliases:
+        with _lock:
+            if _resolver is None or _resolver.snapshot is not snapshot or _resolver.aliases is not aliases:
+                _resolver = Resolver(snapshot, aliases, current_app.config.get('RESOLVE_CACHE_SIZE', 65536))
+            current = _resolver
+    return current
+
+def reference_key(payer_id, payer_name):
+    return (payer_id or '').strip(), (payer_name or '').strip()
+
+def best_matches(path, version, names):
+    """Process pool task: (version, [(payer_id, score)]) of the best match per name in the index file at path.
+
+    Each worker maps the file once and keeps it until a task asks for another
+    version; the version read back lets the caller spot a file replaced since.
+    """
+    global _worker_index
+    if _worker_index is None or _worker_index.path != path or _worker_index.version != version:
+        _worker_index = MatchIndex(path)
+    engine = _worker_index.engine
+    return _worker_index.version, [engine.best_match(name, REVIEW_THRESHOLD) for name in names]
+
+def check_reference(item):
+    """Error message for a reference that is not an object of string fields naming a payer_id or payer_name"""
+    if not isinstance(item, dict):
+        return "Reference must be an object"
+    for field in RESOLVE_FIELDS:
+        if item.get(field) is not None and not isinstance(item[field], str):
+            return f"{field} must be a string"
+    if not (item.get('payer_id') or '').strip() and not (item.get('payer_name') or '').strip():
+        return "payer_id or payer_name is required"
+    return None
\ No newline at end of file
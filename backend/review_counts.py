@@ -0,0 +1,133 @@
+# backend/review_counts.py
+from collections import Counter
+from sqlalchemy import delete, event, func, inspect, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from changes import lock_changes
+from models import db, PayerDetail, ReviewCandidate, ReviewCount
+
+BATCH_SIZE = 1000
+COUNTS_LOCK_KEY = 720_003  # pg_advisory_xact_lock key serializing review_counts writers until they commit
+
+
+def _lock(connection):
+    # Every writer bumps the same few counter rows, waiting here up front keeps them from deadlocking on those.
+    # The change lock comes first, so a transaction holding this one never waits for it behind a change writer
+    # that is waiting here
+    lock_changes(connection)
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': COUNTS_LOCK_KEY})
+
+def _key(source, state, band):
+    return source or '', state or '', band
+
+def count_keys(detail_ids, connection=None):
+    """Counter of (source, state, band) over the given details' review candidates as the database has them now.
+
+    On PostgreSQL this takes the change lock and then the counts lock until
+    commit, so no other writer can move these details between this read and
+    the adjustment that follows.
+    """
+    connection = connection or db.session.connection()
+    _lock(connection)
+    counts = Counter()
+    detail_ids = sorted(detail_ids)
+    for start in range(0, len(detail_ids), BATCH_SIZE):
+        rows = connection.execute(select(PayerDetail.source, PayerDetail.state, ReviewCandidate.band).join(
+            ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id
+        ).where(ReviewCandidate.detail_id.in_(detail_ids[start:start + BATCH_SIZE])))
+        counts.update(_key(*row) for row in rows)
+    return counts
+
+def adjust_counts(before, after, connection=None):
+    """Move review_counts from the before to the after count_keys of the same details, in the caller's transaction"""
+    deltas = Counter(after)
+    deltas.subtract(before)
+    # Sorted, so concurrent writers lock counter rows in the same order
+    rows = [{'source': source, 'state': state, 'band': band, 'count': delta}
+            for (source, state, band), delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    connection = connection or db.session.connection()
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(ReviewCount.__table__)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['source', 'state', 'band'],
+        set_={'count': ReviewCount.__table__.c.count + statement.excluded['count']}
+    ), rows)
+
+def rebuild_review_counts():
+    """Recount review_counts from review_candidates, returning how many (source, state, band) rows changed"""
+    current = {(row.source, row.state, row.band): row.count
+               for row in db.session.query(ReviewCount).filter(ReviewCount.count != 0)}
+    counted = select(
+        func.coalesce(PayerDetail.source, ''), func.coalesce(PayerDetail.state, ''), ReviewCandidate.band, func.count()
+    ).join(ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id).group_by(
+        func.coalesce(PayerDetail.source, ''), func.coalesce(PayerDetail.state, ''), ReviewCandidate.band
+    )
+    db.session.execute(delete(ReviewCount))
+    db.session.execute(insert(ReviewCount).from_select(['source', 'state', 'band', 'count'], counted))
+    rebuilt = {(row.source, row.state, row.band): row.count for row in db.session.query(ReviewCount)}
+    return sum(1 for key in current.keys() | rebuilt.keys() if current.get(key) != rebuilt.get(key))
+
+def queue_counts(bands):
+    """(source, state, band, count) rows of the given bands, None for a missing source or state"""
+    rows = db.session.query(ReviewCount).filter(ReviewCount.band.in_(bands), ReviewCount.count > 0).order_by(
+        ReviewCount.source, ReviewCount.state, ReviewCount.band
+    )
+    return [(row.source or None, row.state or None, row.band, row.count) for row in rows]
+
+def queue_summary(bands):
+    """Totals by band, source and state plus every (source, state, band) count, for the review dashboard"""
+    counts = queue_counts(bands)
+    by_band, by_source, by_state = Counter(), Counter(), Counter()
+    for source, state, band, count in counts:
+        by_band[band] += count
+        by_source[source] += count
+        by_state[state] += count
+    return {
+        "total": sum(by_band.values()),
+        "by_band": {band: by_band[band] for band in bands},
+        "by_source": [{"source": source, "count": count} for source, count in by_source.items()],
+        "by_state": [{"state": state, "count": count} for state, count in by_state.items()],
+        "counts": [{"source": source, "state": state, "band": band, "count": count}
+                   for source, state, band, count in counts],
+    }
+
+def queue_total(bands):
+    return db.session.query(func.coalesce(func.sum(ReviewCount.count), 0)).filter(ReviewCount.band.in_(bands)).scalar()
+
+
+def _affected(session):
+    """detail_ids whose (source, state, band) key this flush can move"""
+    detail_ids = set()
+    deleted = session.deleted
+    for obj in list(session.new) + list(session.dirty) + list(deleted):
+        if isinstance(obj, ReviewCandidate):
+            if obj in session.new or obj in deleted or inspect(obj).attrs.band.history.has_changes():
+                detail_ids.add(obj.detail_id)
+        elif isinstance(obj, PayerDetail) and obj.detail_id is not None:
+            if obj in deleted or any(inspect(obj).attrs[name].history.has_changes() for name in ('source', 'state')):
+                detail_ids.add(obj.detail_id)
+    detail_ids.discard(None)
+    return detail_ids
+
+def _count_before_flush(session, flush_context, instances):
+    detail_ids = _affected(session)
+    if detail_ids:
+        session.info['review_counts'] = flush_context, detail_ids, count_keys(detail_ids, session.connection())
+
+def _count_after_flush(session, flush_context):
+    # Rows inserted by this flush have their detail_ids only now, and had nothing to count before
+    counted_flush, detail_ids, before = session.info.pop('review_counts', (None, set(), Counter()))
+    if counted_flush is not flush_context:  # Left by a flush that failed
+        detail_ids, before = set(), Counter()
+    detail_ids |= _affected(session)
+    if detail_ids:
+        connection = session.connection()
+        adjust_counts(before, count_keys(detail_ids, connection), connection)
+
+def track_review_counts():
+    """Keep review_counts in step with every ORM write to review candidates and detail sources or states; idempotent"""
+    if not event.contains(db.session, 'after_flush', _count_after_flush):
+        event.listen(db.session, 'before_flush', _count_before_flush)
+        event.listen(db.session, 'after_flush', _count_after_flush)
\ No newline at end of file
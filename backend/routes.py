@@ -1,20 +1,16 @@
 # backend/routes.py
-from flask import jsonify, request
-from fuzzywuzzy import fuzz
-from models import db, PayerDetail, Payer, PayerGroup
-from sqlalchemy import or_, not_
-import re
-
-def get_similarity_score(name1, name2):
-    return fuzz.ratio(name1.lower(), name2.lower())
-
-def generate_pretty_name(payer_name):
-    name = re.sub(r'\s*\([^)]*\)', '', payer_name)
-    suffixes = ['Inc', 'Corporation', 'LLC', 'Administrators', 'Services', 'Plans']
-    for suffix in suffixes:
-        name = re.sub(rf'\s+{suffix}$', '', name, flags=re.IGNORECASE)
-    words = name.split()
-    return ''.join(word.capitalize() for word in words[:2]) if len(words) > 1 else name.capitalize()
+from flask import abort, jsonify, request
+from models import db, Job, PayerDetail, Payer, PayerGroup, ReviewCandidate
+from batch_mapping import MAX_BATCH_ITEMS, apply_batch
+from candidates import REVIEW_BANDS, mark_manual
+from changes import CHANGE_DETAIL, FEED_COLUMNS, MAX_CHANGES, change_feed, feed_row, record_changes
+from export import EXPORTS, stream_export
+from hierarchy import build_tree, rebuild_group_hierarchy
+from jobs import JOB_KINDS, cancel_job, job_json, submit_job, validate_params
+from pagination import invalidate_count, paginate, paginate_sorted, total_count
+from payer_cache import ALIASES, PAYERS, bump_version, payer_snapshot
+from resolver import MAX_RESOLVE_ITEMS, RESOLVE_FIELDS, check_reference, resolver
+from review_counts import queue_summary, queue_total
 
 def init_routes(app):
     @app.route('/')
@@ -23,143 +19,100 @@ def init_routes(app):
 
     @app.route('/api/unmapped', methods=['GET'])
     def get_unmapped():
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 100))
-        offset = (page - 1) * per_page
+        # Served from the precomputed review_candidates index, see candidates.py
+        queue = db.session.query(PayerDetail, ReviewCandidate).join(
+            ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id
+        ).filter(ReviewCandidate.band.in_(REVIEW_BANDS))
         
-        details = db.session.query(PayerDetail).offset(offset).limit(per_page).all()
-        unmapped = []
-        payer_names = {p.payer_id: p.payer_name for p in db.session.query(Payer).all()}
-        
-        for detail in details:
-            matched = False
-            for payer_id, canonical_name in payer_names.items():
-                name_score = get_similarity_score(detail.payer_name, canonical_name)
-                if name_score > 70 and name_score <= 85:
-                    unmapped.append({
-                        "detail_id": detail.detail_id,
-                        "payer_name": detail.payer_name,
-                        "payer_id": detail.payer_id,
-                        "source": detail.source,
-                        "state": detail.state
-                    })
-                    matched = True
-                    break
-            if not matched and detail.payer_id not in payer_names:
-                unmapped.append({
-                    "detail_id": detail.detail_id,
-                    "payer_name": detail.payer_name,
-                    "payer_id": detail.payer_id,
-                    "source": detail.source,
-                    "state": detail.state
-                })
-
-        total_unmapped = db.session.query(PayerDetail).filter(
-            or_(
-                PayerDetail.payer_id.in_(
-                    db.session.query(PayerDetail.payer_id).filter(
-                        PayerDetail.payer_name.in_([
-                            d.payer_name for d in details if any(
-                                70 < get_similarity_score(d.payer_name, pn) <= 85
-                                for pn in payer_names.values()
-                            )
-                        ])
-                    )
-                ),
-                not_(PayerDetail.payer_id.in_(payer_names.keys()))
-            )
-        ).count()
+        rows, meta = paginate(queue, PayerDetail.detail_id, lambda row: row[0].detail_id, 100)
+        total_unmapped = queue_total(REVIEW_BANDS)  # Exact, kept by review_counts.py
 
         return jsonify({
-            "unmapped": unmapped,
+            "unmapped": [{
+                "detail_id": detail.detail_id,
+                "payer_name": detail.payer_name,
+                "payer_id": detail.payer_id,
+                "source": detail.source,
+                "state": detail.state,
+                "suggested_payer_id": candidate.best_payer_id,
+                "score": candidate.score,
+                "band": candidate.band
+            } for detail, candidate in rows],
             "total": total_unmapped,
-            "page": page,
-            "per_page": per_page
+            **meta
         })
 
+    @app.route('/api/unmapped/summary', methods=['GET'])
+    def unmapped_summary():
+        # Review queue sizes by band, source and state for the dashboard, read from review_counts
+        return jsonify(queue_summary(REVIEW_BANDS))
+
     @app.route('/api/map_payer', methods=['POST'])
     def map_payer():
         data = request.json
         detail = PayerDetail.query.get(data['detail_id'])
+        if detail.payer_id == data['payer_id']:
+            record_changes(CHANGE_DETAIL, [detail.detail_id])  # Confirming a mapping makes it manual, which aliases vote on
         detail.payer_id = data['payer_id']
+        mark_manual(detail, data['payer_id'])
+        bump_version(ALIASES)  # Resolves read the names of mapped details from the alias index
         db.session.commit()
         return {"status": "success"}
 
+    @app.route('/api/map_payers/batch', methods=['POST'])
+    def map_payers_batch():
+        # {"mappings": [{detail_id, payer_id}], "rules": [{payer_name, source, payer_id}]} in one transaction
+        data = request.json or {}
+        mappings, rules = data.get('mappings', []), data.get('rules', [])
+        if not isinstance(mappings, list) or not isinstance(rules, list):
+            abort(400, description="mappings and rules must be lists")
+        if len(mappings) + len(rules) > MAX_BATCH_ITEMS:
+            abort(400, description=f"At most {MAX_BATCH_ITEMS} mappings and rules per request")
+
+        mapping_results, rule_results, mapped = apply_batch(mappings, rules)
+        db.session.commit()
+        return {"status": "success", "mapped": mapped, "mappings": mapping_results, "rules": rule_results}
+
     @app.route('/api/update_pretty_name', methods=['POST'])
     def update_pretty_name():
         data = request.json
         payer = Payer.query.get(data['payer_id'])
         payer.pretty_name = data['pretty_name']
+        bump_version(PAYERS)
         db.session.commit()
         return {"status": "success"}
 
     @app.route('/api/payers', methods=['GET'])
     def get_payers():
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 10))
-        offset = (page - 1) * per_page
-        
-        payers = db.session.query(Payer).offset(offset).limit(per_page).all()
-        total = db.session.query(Payer).count()
+        # Served from the in-process payer cache, pretty names are derived once per reload
+        snapshot = payer_snapshot()
+        payer_ids, meta = paginate_sorted(snapshot.ids, 10)
+        payers = [snapshot.by_id[payer_id] for payer_id in payer_ids]
         
         return jsonify({
             "payers": [{
                 "payer_id": p.payer_id,
                 "payer_name": p.payer_name,
-                "pretty_name": p.pretty_name if p.pretty_name else generate_pretty_name(p.payer_name),
+                "pretty_name": p.pretty_name,
                 "group_id": p.group_id
             } for p in payers],
-            "total": total,
-            "page": page,
-            "per_page": per_page
+            "total": len(snapshot.ids),
+            **meta
         })
 
     @app.route('/api/groups', methods=['GET'])
     def get_groups():
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 1000))
-        offset = (page - 1) * per_page
-        
-        groups = db.session.query(PayerGroup).offset(offset).limit(per_page).all()
-        total = db.session.query(PayerGroup).count()
-        
-        def infer_hierarchy(group, all_groups, processed=None):
-            if processed is None:
-                processed = set()
-            if group.group_id in processed:
-                return None  # Avoid infinite recursion
-            processed.add(group.group_id)
-            
-            children = []
-            for other in all_groups:
-                if other.group_id != group.group_id:
-                    similarity = fuzz.ratio(group.group_name.lower(), other.group_name.lower())
-                    if similarity > 80 and other.group_name.startswith(group.group_name):
-                        child = infer_hierarchy(other, all_groups, processed)
-                        if child:
-                            children.append(child)
-            return {
-                "group_id": group.group_id,
-                "group_name": group.group_name,
-                "children": children
-            }
-        
-        # Find top-level groups (not children of others)
-        top_level = []
-        for g in groups:
-            is_child = False
-            for other in groups:
-                if g.group_id != other.group_id and fuzz.ratio(g.group_name.lower(), other.group_name.lower()) > 80 and g.group_name.startswith(other.group_name):
-                    is_child = True
-                    break
-            if not is_child:
-                top_level.append(infer_hierarchy(g, groups))
+        # Parents are stored by rebuild_group_hierarchy, so nesting needs no scoring
+        rows, meta = paginate(
+            db.session.query(PayerGroup.group_id, PayerGroup.group_name, PayerGroup.parent_group_id),
+            PayerGroup.group_id, lambda row: row[0], 1000
+        )
+        total = total_count('groups', db.session.query(PayerGroup), table='payer_groups')
         
         return jsonify({
-            "groups": top_level,
+            "groups": build_tree(rows),
             "total": total,
-            "page": page,
-            "per_page": per_page
+            **meta
         })
 
     @app.route('/api/update_group', methods=['POST'])
@@ -172,7 +125,83 @@ def init_routes(app):
         if not group:
             group = PayerGroup(group_id=group_id, group_name=group_id)
             db.session.add(group)
+            rebuild_group_hierarchy()
         
         payer.group_id = group_id
+        bump_version(PAYERS)
         db.session.commit()
-        return {"status": "success"}
\ No newline at end of file
+        invalidate_count('groups')
+        return {"status": "success"}
+
+    @app.route('/api/export/payers', methods=['GET'])
+    def export_payers():
+        # Whole table in one streamed response, ?format=ndjson|csv
+        return stream_export('payers', *EXPORTS['payers'])
+
+    @app.route('/api/export/details', methods=['GET'])
+    def export_details():
+        # Every detail with its mapping and review band, ?format=ndjson|csv
+        return stream_export('details', *EXPORTS['details'])
+
+    @app.route('/api/resolve', methods=['POST'])
+    def resolve():
+        # {payer_name, payer_id, state, source} as on a remittance -> canonical payer and confidence
+        data = request.json
+        error = check_reference(data)
+        if error:
+            abort(400, description=error)
+        return resolver().resolve(**{field: data.get(field) for field in RESOLVE_FIELDS})
+
+    @app.route('/api/resolve/batch', methods=['POST'])
+    def resolve_batch():
+        # {"references": [...]}, results come back in request order; invalid items get an "error"
+        references = (request.json or {}).get('references')
+        if not isinstance(references, list):
+            abort(400, description="references must be a list")
+        if len(references) > MAX_RESOLVE_ITEMS:
+            abort(400, description=f"At most {MAX_RESOLVE_ITEMS} references per request")
+        current = resolver()
+        results = []
+        for item in references:
+            error = check_reference(item)
+            results.append({"error": error} if error else current.resolve(**{field: item.get(field) for field in RESOLVE_FIELDS}))
+        return jsonify({"results": results})
+
+    @app.route('/api/changes', methods=['GET'])
+    def get_changes():
+        # Rows changed after ?since=<seq>, oldest first with their current state; resume from the last seq seen
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', MAX_CHANGES))
+        except ValueError:
+            abort(400, description="since and limit must be integers")
+        if since < 0 or not 0 < limit <= MAX_CHANGES:
+            abort(400, description=f"since must be >= 0 and limit between 1 and {MAX_CHANGES}")
+        return stream_export('changes', change_feed(since, limit), FEED_COLUMNS, feed_row)
+
+    @app.route('/api/jobs', methods=['POST'])
+    def start_job():
+        # {"kind": "map_payers" | "load_data", "params": {...}}, runs in a background process
+        data = request.json or {}
+        try:
+            params = validate_params(data.get('kind'), data.get('params', {}), app.config['INGEST_DIR'])
+        except ValueError as e:
+            abort(400, description=str(e))
+        job = submit_job(data['kind'], params)
+        return job_json(job), 202
+
+    @app.route('/api/jobs', methods=['GET'])
+    def list_jobs():
+        jobs = db.session.query(Job).order_by(Job.job_id.desc()).limit(50).all()
+        return jsonify({"jobs": [job_json(job) for job in jobs], "kinds": list(JOB_KINDS)})
+
+    @app.route('/api/jobs/<int:job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = db.session.get(Job, job_id) or abort(404)
+        return job_json(job)
+
+    @app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+    def stop_job(job_id):
+        job = db.session.get(Job, job_id) or abort(404)
+        cancel_job(job)
+        return job_json(job)
\ No newline at end of file
@@ -0,0 +1,56 @@
+# backend/trigram.py
+from sqlalchemy import text
+from matching import REVIEW_THRESHOLD, TOP_K, get_similarity_score
+from models import db
+
+MATCH_BACKEND_ENGINE = 'engine'
+MATCH_BACKEND_TRIGRAM = 'pg_trgm'
+TRIGRAM_THRESHOLD = 0.3
+
+# One lateral lookup per name; the % operator lets each one use the payers.payer_name GIN index
+TOP_CANDIDATES_SQL = """
+    SELECT q.position, c.payer_id, c.payer_name
+    FROM unnest(CAST(:positions AS integer[]), CAST(:names AS text[])) AS q(position, name)
+    CROSS JOIN LATERAL (
+        SELECT p.payer_id, p.payer_name FROM payers p
+        WHERE p.payer_name % q.name {restrict}
+        ORDER BY similarity(p.payer_name, q.name) DESC, p.payer_id
+        LIMIT :limit
+    ) c
+"""
+
+
+class TrigramMatcher:
+    """Candidate search pushed into PostgreSQL with pg_trgm, re-scored with fuzz.ratio in Python.
+
+    Only payers sharing enough trigrams to pass the % operator come back, so
+    this can miss matches the in-process MatchEngine finds; lower threshold
+    to trade speed for recall. Ties go to the lowest payer_id.
+    """
+
+    def __init__(self, payer_ids=None, top_k=TOP_K, threshold=TRIGRAM_THRESHOLD):
+        self.payer_ids = list(payer_ids) if payer_ids is not None else None
+        self.top_k = top_k
+        self.threshold = threshold
+
+    def best_matches(self, names, min_score=REVIEW_THRESHOLD):
+        """(payer_id, score) for each name, (None, 0) when nothing scores above min_score"""
+        names = [name or '' for name in names]
+        params = {'positions': list(range(len(names))), 'names': names, 'limit': self.top_k}
+        restrict = ''
+        if self.payer_ids is not None:
+            restrict = 'AND p.payer_id = ANY(CAST(:payer_ids AS text[]))'
+            params['payer_ids'] = self.payer_ids
+        db.session.execute(
+            text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+            {'threshold': str(self.threshold)}
+        )
+        best = [(None, min_score)] * len(names)
+        for position, payer_id, payer_name in db.session.execute(
+            text(TOP_CANDIDATES_SQL.format(restrict=restrict)), params
+        ):
+            score = get_similarity_score(names[position], payer_name)
+            best_id, best_score = best[position]
+            if score > best_score or (score == best_score and best_id is not None and payer_id < best_id):
+                best[position] = (payer_id, score)
+        return [(payer_id, score) if payer_id is not None else (None, 0) for payer_id, score in best]
\ No newline at end of file
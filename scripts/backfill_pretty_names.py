@@ -0,0 +1,66 @@
+# scripts/backfill_pretty_names.py
+import argparse
+import time
+import pandas as pd
+from sqlalchemy import String, column, or_, update, values
+
+import bootstrap
+
+from models import db, Payer
+from database import script_app
+from changes import CHANGE_PAYER, lock_changes, record_changes
+from normalization import pretty_names
+from payer_cache import PAYERS, bump_version
+
+app = script_app()
+
+BATCH_SIZE = 1000
+
+
+def backfill_pretty_names(include_copies=False, batch_size=BATCH_SIZE):
+    """Fill empty pretty names with generated ones in batched UPDATE ... FROM (VALUES ...) statements.
+
+    With include_copies, rows whose pretty_name is a verbatim copy of payer_name
+    (what older loads stored, but also a name someone set on purpose) are
+    regenerated too.
+    """
+    with app.app_context():
+        start = time.perf_counter()
+        needs_name = [Payer.pretty_name.is_(None), Payer.pretty_name == '']
+        if include_copies:
+            needs_name.append(Payer.pretty_name == Payer.payer_name)
+        last_id = ''
+        updated = 0
+        while True:
+            rows = db.session.query(Payer.payer_id, Payer.payer_name).filter(
+                Payer.payer_id > last_id, or_(*needs_name)
+            ).order_by(Payer.payer_id).limit(batch_size).all()
+            if not rows:
+                break
+            batch = pd.DataFrame(rows, columns=['payer_id', 'payer_name'])
+            batch['pretty_name'] = pretty_names(batch['payer_name'])
+            pretty = values(
+                column('payer_id', String), column('pretty_name', String), name='pretty'
+            ).data(list(batch[['payer_id', 'pretty_name']].itertuples(index=False, name=None)))
+            lock_changes()
+            db.session.execute(
+                update(Payer.__table__).where(Payer.__table__.c.payer_id == pretty.c.payer_id).values(
+                    pretty_name=pretty.c.pretty_name
+                )
+            )
+            record_changes(CHANGE_PAYER, [payer_id for payer_id, _ in rows])
+            bump_version(PAYERS)
+            db.session.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+            print(f"Updated {updated} pretty names")
+        print(f"Backfilled {updated} pretty names in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill payers.pretty_name from generated display names")
+    parser.add_argument('--include-copies', action='store_true',
+                        help="Also regenerate pretty names that copy payer_name verbatim")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Payers per UPDATE")
+    args = parser.parse_args()
+
+    backfill_pretty_names(args.include_copies, args.batch_size)
\ No newline at end of file
@@ -0,0 +1,153 @@
+# scripts/benchmark.py
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from sqlalchemy.engine import make_url
+
+import bootstrap
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+# Kept across runs so each can be compared with the last; git-ignored
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark_results')
+ENDPOINTS = ['/api/unmapped', '/api/payers', '/api/groups']
+
+
+def timed(label, step, results):
+    """Run step() with its progress prints swallowed and record its wall time in seconds"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        step()
+    results[label] = round(time.perf_counter() - start, 4)
+    print(f"  {label}: {results[label]:.2f}s")
+
+def time_endpoints(app, repeat):
+    """Median and p95 milliseconds per endpoint, first page and the page after it, through the test client"""
+    client = app.test_client()
+    results = {}
+    for endpoint in ENDPOINTS:
+        first = client.get(endpoint).get_json()
+        urls = {endpoint: endpoint}
+        if first.get('next_cursor'):
+            urls[f"{endpoint}?cursor"] = f"{endpoint}?cursor={first['next_cursor']}"
+        for label, url in urls.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = client.get(url)
+                samples.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{url} returned {response.status_code}")
+            samples.sort()
+            results[label] = {
+                'median_ms': round(statistics.median(samples), 3),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            }
+            print(f"  GET {label}: median {results[label]['median_ms']:.1f}ms, p95 {results[label]['p95_ms']:.1f}ms")
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_size(label, details, loader, repeat, workdir):
+    from app import app
+    from models import db, PayerDetail, PayerGroup
+    import load_data
+    import map_payers
+    from synthetic_data import synthetic_rows, write_workbook
+
+    database = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    print(f"== {label}: {details} details on {database}")
+    payers, rows = synthetic_rows(details)
+    os.makedirs(os.path.join(workdir, 'GoLassie DB'), exist_ok=True)
+    write_workbook(os.path.join(workdir, 'GoLassie DB', 'Payers.xlsx'), rows)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(PayerGroup(group_id='UNKNOWN', group_name='UNKNOWN'))
+        db.session.commit()
+
+    timings = {}
+    cwd = os.getcwd()
+    os.chdir(workdir)  # load_data reads GoLassie DB/Payers.xlsx relative to the working directory
+    try:
+        if loader == 'bulk':
+            timed('load_data.bulk_main', load_data.bulk_main, timings)
+        else:
+            timed('load_data.main', load_data.main, timings)
+        timed('map_payers', map_payers.map_payers, timings)
+    finally:
+        os.chdir(cwd)
+
+    with app.app_context():
+        loaded = db.session.query(PayerDetail).count()
+    return {
+        'size': label,
+        'details': details,
+        'details_loaded': loaded,
+        'database': database,
+        'loader': loader,
+        'steps_s': timings,
+        'endpoints': time_endpoints(app, repeat),
+    }
+
+def compare(previous, run):
+    """Print how each timing moved since the previous run in the results file"""
+    before = {(r['size'], r['database'], r['loader']): r for r in previous['results']}
+    print(f"Compared with commit {previous['commit']}:")
+    for result in run['results']:
+        old = before.get((result['size'], result['database'], result['loader']))
+        if old is None:
+            continue
+        changes = [(step, old['steps_s'].get(step), seconds, 's') for step, seconds in result['steps_s'].items()]
+        changes += [(f"GET {url}", old['endpoints'].get(url, {}).get('median_ms'), timing['median_ms'], 'ms')
+                    for url, timing in result['endpoints'].items()]
+        for label, old_value, new_value, unit in changes:
+            if old_value:
+                print(f"  {result['size']} {label}: {old_value:.2f}{unit} -> {new_value:.2f}{unit} "
+                      f"({(new_value - old_value) / old_value:+.0%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Time loading, mapping and the list endpoints on synthetic data")
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['1k'])
+    parser.add_argument('--database-url', default=None,
+                        help="Scratch database to benchmark against, its tables are dropped (default: a throwaway SQLite file)")
+    parser.add_argument('--loader', choices=['main', 'bulk'], default='main',
+                        help="load_data.main (row by row) or bulk_main (COPY, PostgreSQL only)")
+    parser.add_argument('--repeat', type=int, default=20, help="Requests per endpoint")
+    parser.add_argument('--output', default=os.path.join(RESULTS_DIR, 'results.jsonl'),
+                        help="JSON Lines file each run is appended to (default: benchmark_results/results.jsonl)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Must be set before backend.app builds the engine
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+        run = {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'results': [run_size(size, SIZES[size], args.loader, args.repeat, workdir) for size in args.sizes],
+        }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            lines = [line for line in f if line.strip()]
+        if lines:
+            compare(json.loads(lines[-1]), run)
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"Appended results for commit {run['commit']} to {args.output}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
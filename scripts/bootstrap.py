@@ -0,0 +1,13 @@
+# scripts/bootstrap.py
+"""Imported by every script before anything from backend/.
+
+Puts backend/ on sys.path, so its modules import by the same bare names the
+app uses, and scripts import each other the same way from scripts/.
+"""
+import os
+import sys
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
\ No newline at end of file
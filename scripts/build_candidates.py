@@ -0,0 +1,43 @@
+# scripts/build_candidates.py
+import argparse
+import time
+
+import bootstrap
+
+from database import script_app
+from candidates import BAND_AUTO_MATCH, REVIEW_BANDS, refresh_candidates
+from models import db
+from review_counts import queue_total, rebuild_review_counts
+
+app = script_app()
+
+def build_candidates(backend=None):
+    """Rebuild the review_candidates index for every payer detail"""
+    if backend:
+        app.config['MATCH_BACKEND'] = backend
+    with app.app_context():
+        print(f"Building review candidates with the {app.config['MATCH_BACKEND']} backend...")
+        start = time.perf_counter()
+        refreshed = refresh_candidates()
+        elapsed = time.perf_counter() - start
+        print(f"Indexed {refreshed} payer details in {elapsed:.2f}s ({refreshed / max(elapsed, 1e-9):.0f} details/sec)")
+        print(f"Auto-matched: {queue_total([BAND_AUTO_MATCH])}, in review queue: {queue_total(REVIEW_BANDS)}")
+
+def recount():
+    """Rebuild review_counts from review_candidates, e.g. after editing either table by hand"""
+    with app.app_context():
+        changed = rebuild_review_counts()
+        db.session.commit()
+        print(f"Rebuilt review counts, {changed} (source, state, band) counts were off")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the review candidates index")
+    parser.add_argument('--backend', choices=['engine', 'pg_trgm'],
+                        help="Override MATCH_BACKEND, e.g. to time pg_trgm against the in-process engine")
+    parser.add_argument('--recount', action='store_true', help="Only rebuild the review queue summary counts")
+    args = parser.parse_args()
+
+    if args.recount:
+        recount()
+    else:
+        build_candidates(args.backend)
\ No newline at end of file
@@ -0,0 +1,18 @@
+# scripts/build_group_hierarchy.py
+import bootstrap
+
+from database import script_app
+from models import db
+from hierarchy import rebuild_group_hierarchy
+
+app = script_app()
+
+def build_group_hierarchy():
+    """Recompute the stored parent of every payer group"""
+    with app.app_context():
+        changed = rebuild_group_hierarchy()
+        db.session.commit()
+        print(f"Updated the parent of {changed} groups")
+
+if __name__ == "__main__":
+    build_group_hierarchy()
\ No newline at end of file
@@ -0,0 +1,70 @@
+# scripts/check_load_keys.py
+import argparse
+import os
+import sys
+import tempfile
+
+from openpyxl import Workbook
+
+import bootstrap
+
+from models import db
+from database import script_app
+from load_data import create_staging, merge_staging, stage_workbook
+
+app = script_app()
+SHEETS = ['Vyne', 'DentalXchange']
+
+
+def write_workbook(path, export, rows):
+    """A workbook with the usual sheet names, its payer ids and names unique to this export"""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for sheet in SHEETS:
+        worksheet = workbook.create_sheet(sheet)
+        worksheet.append(['Payer ID', 'Payer Name', 'State'])
+        for row in range(rows):
+            worksheet.append([f'CHK{export}{sheet[0]}{row}', f'Check Payer {export} {sheet} {row}', 'AZ'])
+    workbook.save(path)
+
+def load(cursor, path):
+    """Stage and merge one workbook as bulk_main does, returning (rows staged, details inserted)"""
+    cursor.execute("TRUNCATE staging_payers, staging_payer_details")
+    first_seen = {}
+    staged = sum(stage_workbook(cursor, path, first_seen).values())
+    _, inserted = merge_staging(cursor, first_seen)
+    return staged, inserted
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that bulk loads key rows by file as well as sheet and row "
+                                                 "(PostgreSQL only, rolled back)")
+    parser.add_argument('--rows', type=int, default=50, help="Rows per sheet in each generated workbook")
+    args = parser.parse_args()
+
+    failures = []
+    with app.app_context(), tempfile.TemporaryDirectory() as directory:
+        first, second = os.path.join(directory, 'first.xlsx'), os.path.join(directory, 'second.xlsx')
+        write_workbook(first, 'A', args.rows)
+        write_workbook(second, 'B', args.rows)
+        cursor = db.session.connection().connection.cursor()
+        try:
+            create_staging(cursor)
+            for label, path, expect_all in [('first export', first, True), ('second export, same sheets', second, True),
+                                            ('first export again', first, False)]:
+                staged, inserted = load(cursor, path)
+                expected = staged if expect_all else 0
+                print(f"{label}: staged {staged} rows, inserted {inserted}")
+                if inserted != expected:
+                    failures.append(f"{label} inserted {inserted} details, expected {expected}")
+        finally:
+            db.session.rollback()
+
+    if failures:
+        for failure in failures:
+            print(f" - {failure}")
+        print("Load key check failed")
+        sys.exit(1)
+    print("Load key check passed")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,22 @@
+# scripts/compact_changes.py
+import time
+
+import bootstrap
+
+from database import script_app
+from models import db, ChangeLog
+from changes import compact_changes
+
+app = script_app()
+
+def main():
+    """Drop change log entries superseded by a later change to the same row"""
+    with app.app_context():
+        start = time.perf_counter()
+        deleted = compact_changes()
+        db.session.commit()
+        remaining = db.session.query(ChangeLog).count()
+        print(f"Deleted {deleted} superseded changes, {remaining} left in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,26 +1,12 @@
 # scripts/db_init.py
-import os
-import sys
-from dotenv import load_dotenv
-from flask import Flask
-
-# Add the root directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bootstrap
 
 # Import db from models.py
-from backend.models import db
-
-# Load environment variables
-load_dotenv()
+from models import db
+from database import script_app
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
-    f"@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
-)
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False  # Suppress warning
-db.init_app(app)
+# Same configuration and pool settings as the app, see backend/config.py
+app = script_app()
 
 # Create tables
 def init_db():
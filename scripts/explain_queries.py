@@ -0,0 +1,72 @@
+# scripts/explain_queries.py
+import argparse
+from sqlalchemy import func, text
+
+import bootstrap
+
+from models import db, has_pg_trgm, CacheVersion, ChangeLog, Payer, PayerDetail, ReviewCandidate, ReviewCount
+from database import script_app
+from candidates import REVIEW_BANDS
+from match_index import alias_vote_query, changed_details_query, payer_rows_query
+from payer_cache import ALIASES, PAYERS
+
+app = script_app()
+
+
+def hot_queries(sample_name, sample_source, sample_state, sample_group, cursor, change_seq):
+    """The statements behind /api/unmapped, /api/payers, /api/resolve and batch mapping rules, as (label, query)"""
+    unmapped = db.session.query(PayerDetail, ReviewCandidate).join(
+        ReviewCandidate, ReviewCandidate.detail_id == PayerDetail.detail_id
+    ).filter(ReviewCandidate.band.in_(REVIEW_BANDS)).order_by(PayerDetail.detail_id)
+    queries = [
+        ("/api/unmapped first page", unmapped.limit(100)),
+        ("/api/unmapped cursor page", unmapped.filter(PayerDetail.detail_id > cursor).limit(100)),
+        ("/api/unmapped total", db.session.query(func.sum(ReviewCount.count)).filter(
+            ReviewCount.band.in_(REVIEW_BANDS))),
+        ("/api/unmapped/summary", db.session.query(ReviewCount).filter(
+            ReviewCount.band.in_(REVIEW_BANDS), ReviewCount.count > 0)),
+        ("/api/payers cache version check", db.session.query(CacheVersion.version).filter(
+            CacheVersion.name == PAYERS)),
+        ("/api/payers match index rebuild", payer_rows_query()),
+        ("/api/resolve aliases version check", db.session.query(CacheVersion.version).filter(
+            CacheVersion.name == ALIASES)),
+        ("/api/resolve aliases rebuild (every detail)", alias_vote_query()),
+        ("/api/resolve aliases refresh: details changed since", changed_details_query(change_seq)),
+        ("/api/resolve aliases refresh: re-vote names", alias_vote_query().filter(
+            PayerDetail.payer_name.in_([sample_name]))),
+        ("Payers in a group", db.session.query(Payer).filter(Payer.group_id == sample_group)),
+        ("Details by source and state", db.session.query(PayerDetail).filter(
+            PayerDetail.source == sample_source, PayerDetail.state == sample_state)),
+        ("Batch rule match (name and source)", db.session.query(PayerDetail.detail_id).filter(
+            PayerDetail.payer_name == sample_name, PayerDetail.source == sample_source)),
+    ]
+    if has_pg_trgm(db.session.connection()):
+        queries.append(("Similar payer names (pg_trgm)", db.session.query(Payer.payer_id).filter(
+            Payer.payer_name.op('%')(sample_name)
+        ).order_by(func.similarity(Payer.payer_name, sample_name).desc()).limit(20)))
+    return queries
+
+def explain_queries(analyze=False):
+    """Print PostgreSQL plans for the hot paths, run before and after a migration to compare"""
+    with app.app_context():
+        sample = db.session.query(PayerDetail.payer_name, PayerDetail.source, PayerDetail.state).filter(
+            PayerDetail.state.isnot(None)
+        ).first() or ('Delta Dental', 'Vyne', 'AZ')
+        sample_group = db.session.query(Payer.group_id).limit(1).scalar() or 'UNKNOWN'
+        cursor = (db.session.query(func.max(PayerDetail.detail_id)).scalar() or 0) // 2
+        change_seq = (db.session.query(func.max(ChangeLog.seq)).scalar() or 0) - 100  # A refresh after 100 writes
+        options = 'ANALYZE, BUFFERS' if analyze else 'COSTS'
+        for label, query in hot_queries(*sample, sample_group, cursor, change_seq):
+            statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            print(f"== {label}")
+            for (line,) in db.session.execute(text(f"EXPLAIN ({options}) {statement}")):
+                print(f"   {line}")
+            print()
+        db.session.rollback()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN the serving and matching hot paths (PostgreSQL only)")
+    parser.add_argument('--analyze', action='store_true', help="Run the statements and report actual timings")
+    args = parser.parse_args()
+
+    explain_queries(args.analyze)
\ No newline at end of file
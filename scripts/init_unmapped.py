@@ -1,14 +1,13 @@
 # scripts/init_unmapped.py
-import os
-import sys
 import pandas as pd
 
 
-# Add the root directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bootstrap
 
-from backend.models import db, Payer
-from backend.app import app
+from models import db, Payer
+from database import script_app
+
+app = script_app()
 
 with app.app_context():
     unmapped = Payer(
@@ -1,16 +1,25 @@
+import argparse
+import csv
+import hashlib
+import io
 import os
-import sys
+import time
 import pandas as pd
 from dotenv import load_dotenv
-from flask import Flask
+from openpyxl import load_workbook
+from sqlalchemy import func, select, text
 
-# Add the root directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bootstrap
 
-from backend.models import db, PayerDetail, Payer, PayerGroup
-from backend.app import app
+from models import db, PayerDetail, Payer, PayerGroup
+from database import script_app
+from candidates import refresh_candidates, refresh_for_payers
+from changes import CHANGE_DETAIL, CHANGE_GROUP, CHANGE_PAYER, lock_changes, record_changes, record_changes_from
+from normalization import generate_pretty_name, normalize_state, pretty_names
+from payer_cache import ALIASES, PAYERS, bump_version
 
 load_dotenv()
+app = script_app()
 
 COLUMN_MAPPING = {
     'Payer ID': 'payer_id',
@@ -29,6 +38,13 @@ COLUMN_MAPPING = {
 
 IGNORE_SHEETS = ['Legend', 'Legend (1)', 'OpenDental']
 
+# Rows per streamed batch, and the strings read_excel(na_values=['NA', '']) treats as missing (pandas' default NA list)
+BATCH_ROWS = 5000
+NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+}
+
 def normalize_columns(df):
     """Normalize column names based on mapping"""
     if df.columns.duplicated().any():
@@ -62,38 +78,179 @@ def safe_extract(row, column, default=''):
     except (KeyError, IndexError):
         return default
 
-def main():
+def _header(cells):
+    """Column names as read_excel builds them (unnamed and repeated headers), then mapped"""
+    names, seen = [], {}
+    for position, cell in enumerate(cells):
+        name = f"Unnamed: {position}" if cell is None else cell
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(COLUMN_MAPPING.get(name.strip() if isinstance(name, str) else name, name))
+    return names
+
+def normalize_batch(rows, index, columns, previous=None):
+    """normalize_columns/handle_merged_cells for one streamed batch of rows.
+
+    Columns that map to the same name are coalesced (first non-empty value wins),
+    standing in for read_excel dropping all-empty columns, which a stream cannot
+    know in advance. previous is the last row of the prior batch, so forward
+    fill carries across batch boundaries.
+    """
+    width = len(columns)
+    rows = [tuple(row[:width]) + (None,) * (width - len(row)) for row in rows]
+    df = pd.DataFrame(rows, columns=range(width), index=index, dtype=object)
+    df = df.mask(df.isin(NA_STRINGS))
+    df.dropna(how='all', inplace=True)
+    
+    merged = {}
+    for position, name in enumerate(columns):
+        merged[name] = df[position] if name not in merged else merged[name].fillna(df[position])
+    df = pd.DataFrame(merged, index=df.index)
+    for col in ['payer_name', 'payer_id']:
+        if col not in df.columns:
+            df[col] = ''
+    df = df.fillna({'payer_name': '', 'payer_id': '', 'state': '', 'source': ''})
+    
+    if previous is not None and not df.empty:
+        df = handle_merged_cells(pd.concat([previous, df])).iloc[1:]
+    return handle_merged_cells(df)
+
+def iter_row_batches(rows, columns, batch_size=BATCH_ROWS):
+    """Group raw row tuples into normalized DataFrame batches"""
+    previous = None
+    batch, index = [], []
+    for position, row in enumerate(rows):
+        batch.append(row)
+        index.append(position)
+        if len(batch) >= batch_size:
+            frame = normalize_batch(batch, index, columns, previous)
+            if not frame.empty:
+                previous = frame.iloc[-1:]
+                yield frame
+            batch, index = [], []
+    if batch:
+        frame = normalize_batch(batch, index, columns, previous)
+        if not frame.empty:
+            yield frame
+
+def iter_sheet_batches(excel_file, batch_size=BATCH_ROWS, sheet_names=None):
+    """Yield (sheet_name, normalized DataFrame) batches from one read-only pass over the workbook"""
+    workbook = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            sheet_name = worksheet.title
+            if sheet_names is not None and sheet_name not in sheet_names:
+                continue
+            if sheet_name in IGNORE_SHEETS:
+                print(f"Skipping sheet: {sheet_name}")
+                continue
+            
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header or all(cell is None for cell in header):
+                print(f"Skipping empty sheet: {sheet_name}")
+                continue
+            for frame in iter_row_batches(rows, _header(header), batch_size):
+                yield sheet_name, frame
+    finally:
+        workbook.close()
+
+def count_sheet_rows(excel_file):
+    """Data rows across the workbook's loaded sheets, from each sheet's recorded dimensions where it has them"""
+    workbook = load_workbook(excel_file, read_only=True)
+    try:
+        total = 0
+        for worksheet in workbook.worksheets:
+            if worksheet.title in IGNORE_SHEETS:
+                continue
+            rows = worksheet.max_row
+            if rows is None:
+                rows = sum(1 for _ in worksheet.iter_rows(values_only=True))
+            total += max(rows - 1, 0)
+        return total
+    finally:
+        workbook.close()
+
+def iter_csv_batches(csv_file, batch_size=BATCH_ROWS):
+    """Yield (source, normalized DataFrame) batches from a CSV export, named after the file"""
+    source = os.path.splitext(os.path.basename(csv_file))[0]
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        rows = csv.reader(f)
+        header = next(rows, None)
+        if not header:
+            print(f"Skipping empty file: {csv_file}")
+            return
+        for frame in iter_row_batches(rows, _header([cell or None for cell in header]), batch_size):
+            yield source, frame
+
+def _text_column(df, column):
+    """Vectorized safe_extract: first duplicate column, NaN as '', values as str"""
+    values = df[column]
+    if isinstance(values, pd.DataFrame):
+        values = values.iloc[:, 0]
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+def file_key(path):
+    """Short content hash of a workbook or CSV file, the part of source_row telling one export from another"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def normalize_sheet(sheet_data, sheet_name, key=''):
+    """Vectorized equivalent of the per-row extraction in main(), key being the file_key of the file read"""
+    frame = pd.DataFrame({
+        'payer_id': _text_column(sheet_data, 'payer_id'),
+        'payer_name': _text_column(sheet_data, 'payer_name'),
+        'state': _text_column(sheet_data, 'state').map(normalize_state) if 'state' in sheet_data.columns else None,
+        'source': sheet_name,
+    }, index=sheet_data.index)
+    index_labels = pd.Series(sheet_data.index.astype(str), index=sheet_data.index)
+    frame = frame[frame['payer_name'].str.strip() != '']
+    unrecognized = frame['state'].isna().sum() if 'state' in sheet_data.columns else 0
+    if unrecognized:
+        print(f"Warning: {unrecognized} rows in {sheet_name} have an unrecognized state, loading them without one")
+    index_labels = index_labels[frame.index]
+    # Same placeholder main() uses for empty payer_id
+    placeholder = 'ID' + index_labels + f'_{sheet_name}'
+    frame['payer_id'] = frame['payer_id'].where(frame['payer_id'].str.strip() != '', placeholder)
+    # Re-reading the same file gives the same keys, a different export with the same sheets does not
+    frame['source_row'] = f'{key}:{sheet_name}:' + index_labels
+    return frame
+
+def qualified_name(payer_name, payer_id):
+    """Name for a new payer whose name another UNKNOWN payer holds, with its payer_id appended (e.g., "Delta Dental (CDKY1)")"""
+    suffix = f" ({payer_id})"
+    return payer_name[:255 - len(suffix)] + suffix
+
+def main(excel_file=os.path.join('GoLassie DB', 'Payers.xlsx'), progress=None):
     """Main function to orchestrate the data loading process"""
+    progress = progress or (lambda *args, **kwargs: None)
     with app.app_context():
         try:
             print("Loading Excel file...")
-            excel_file = os.path.join('GoLassie DB', 'Payers.xlsx')
             rows_processed = 0
+            rows_total = count_sheet_rows(excel_file)
+            progress(0, rows_total, phase='loading')
+            new_payer_ids = []
+            last_detail_id = db.session.query(func.max(PayerDetail.detail_id)).scalar() or 0
             
-            for sheet_name in pd.ExcelFile(excel_file).sheet_names:
-                if sheet_name in IGNORE_SHEETS:
-                    print(f"Skipping sheet: {sheet_name}")
-                    continue
-                
-                print(f"Loading sheet: {sheet_name}")
-                sheet_data = pd.read_excel(
-                    excel_file, 
-                    sheet_name=sheet_name,
-                    header=0,
-                    na_values=['NA', ''],
-                    keep_default_na=True
-                )
-                
-                sheet_data.dropna(how='all', inplace=True)
-                sheet_data.dropna(axis=1, how='all', inplace=True)
-                
-                sheet_data = normalize_columns(sheet_data)
-                print(f"Columns after normalization for {sheet_name}: {list(sheet_data.columns)}")
-                
-                sheet_data = handle_merged_cells(sheet_data)
+            current_sheet = None
+            for sheet_name, sheet_data in iter_sheet_batches(excel_file):
+                if sheet_name != current_sheet:
+                    current_sheet = sheet_name
+                    print(f"Loading sheet: {sheet_name}")
+                    print(f"Columns after normalization for {sheet_name}: {list(sheet_data.columns)}")
+                names = _text_column(sheet_data, 'payer_name')
+                pretty_by_name = dict(zip(names, pretty_names(names)))
                 
                 for index, row in sheet_data.iterrows():
                     rows_processed += 1
+                    progress(rows_processed, phase='loading')
                     
                     if rows_processed % 100 == 0:
                         print(f"Processed {rows_processed} rows total. Currently on sheet: {sheet_name}")
@@ -101,13 +258,16 @@ def main():
                     try:
                         payer_name = str(safe_extract(row, 'payer_name'))
                         payer_id = str(safe_extract(row, 'payer_id'))
-                        state = str(safe_extract(row, 'state')) if 'state' in row else None
+                        state = normalize_state(str(safe_extract(row, 'state'))) if 'state' in row else None
                         source = sheet_name
                         
                         if not payer_name.strip():
                             print(f"Skipping row {index + 1} in {sheet_name} due to empty payer_name")
                             continue
                         
+                        if 'state' in row and state is None:
+                            print(f"Unrecognized state in row {index + 1} in {sheet_name}, loading it without one")
+                        
                         # Use placeholder for empty payer_id
                         if not payer_id.strip():
                             payer_id = f"ID{index}_{sheet_name}"
@@ -115,13 +275,18 @@ def main():
                         # Check if payer_id already exists in payers
                         existing_payer = db.session.query(Payer).filter_by(payer_id=payer_id).first()
                         if not existing_payer:
+                            # uq_payer_name_group allows one payer per name in a group, the detail keeps its payer_id
+                            name_held = db.session.query(Payer.payer_id).filter_by(
+                                payer_name=payer_name, group_id="UNKNOWN"
+                            ).first() is not None
                             payer = Payer(
                                 payer_id=payer_id,
-                                payer_name=payer_name,
-                                pretty_name=payer_name,
+                                payer_name=qualified_name(payer_name, payer_id) if name_held else payer_name,
+                                pretty_name=pretty_by_name.get(payer_name) or generate_pretty_name(payer_name),
                                 group_id="UNKNOWN"
                             )
                             db.session.add(payer)
+                            new_payer_ids.append(payer_id)
                         
                         payer_detail = PayerDetail(
                             payer_id=payer_id,
@@ -144,13 +309,19 @@ def main():
                         print(f"Error processing row {index + 1} in {sheet_name}: {e}")
                         continue
             
-            # Final commit
-            try:
-                db.session.commit()
-                print(f"Total rows processed: {rows_processed}")
-            except Exception as e:
-                print(f"Error in final commit: {e}")
-                db.session.rollback()
+            # Final commit, new details change the aliases as new payers change the match index
+            if new_payer_ids:
+                bump_version(PAYERS)
+            if rows_processed:
+                bump_version(ALIASES)
+            db.session.commit()
+            print(f"Total rows processed: {rows_processed}")
+            
+            # Refresh the review candidate index for what this load added
+            print("Refreshing review candidates...")
+            progress(rows_processed, phase='refreshing candidates')
+            refresh_for_payers(new_payer_ids)
+            refresh_candidates(after_id=last_detail_id)
             
             print("Data loading complete!")
             
@@ -158,6 +329,140 @@ def main():
             print(f"Error in data loading process: {e}")
             db.session.rollback()
             print("Changes rolled back due to error.")
+            raise  # A job running the load is recorded as failed
+
+def copy_frame(cursor, table, frame, columns):
+    """Stream a DataFrame into a table with COPY FROM STDIN"""
+    buffer = io.StringIO()
+    frame.to_csv(buffer, columns=columns, header=False, index=False, na_rep='\\N', quoting=csv.QUOTE_MINIMAL)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+STAGING_DETAIL_COLUMNS = ['unit', 'row_index', 'payer_id', 'payer_name', 'state', 'source', 'source_row']
+
+def create_staging(cursor):
+    """Temp tables the bulk loaders COPY into, dropped when the load commits"""
+    cursor.execute("""
+        CREATE TEMP TABLE staging_payers (payer_id text, payer_name text, pretty_name text) ON COMMIT DROP;
+        CREATE TEMP TABLE staging_payer_details (
+            unit integer, row_index bigint, payer_id text, payer_name text, state text, source text, source_row text
+        ) ON COMMIT DROP;
+    """)
+
+def dedupe_payers(frame, first_seen):
+    """Keep the earliest (unit, row) name per payer_id, as main() keeps the first row it sees"""
+    for payer_id, payer_name, unit, row_index in frame.drop_duplicates('payer_id')[
+        ['payer_id', 'payer_name', 'unit', 'row_index']
+    ].itertuples(index=False):
+        current = first_seen.get(payer_id)
+        if current is None or (unit, row_index) < current[0]:
+            first_seen[payer_id] = ((unit, row_index), payer_name)
+
+def merge_staging(cursor, first_seen):
+    """Merge staged rows into payers/payer_details, returning (new payer ids, details inserted)"""
+    lock_changes()
+    payers = pd.DataFrame(
+        [(payer_id, payer_name) for payer_id, (_, payer_name) in first_seen.items()],
+        columns=['payer_id', 'payer_name']
+    )
+    payers['pretty_name'] = pretty_names(payers['payer_name'])
+    copy_frame(cursor, 'staging_payers', payers, ['payer_id', 'payer_name', 'pretty_name'])
+    new_group_ids = [row[0] for row in db.session.execute(text(
+        "INSERT INTO payer_groups (group_id, group_name) VALUES ('UNKNOWN', 'UNKNOWN') "
+        "ON CONFLICT DO NOTHING RETURNING group_id"
+    ))]
+    new_payer_ids = [row[0] for row in db.session.execute(text("""
+        INSERT INTO payers (payer_id, payer_name, pretty_name, group_id)
+        SELECT payer_id, payer_name, pretty_name, 'UNKNOWN' FROM staging_payers
+        ON CONFLICT DO NOTHING
+        RETURNING payer_id
+    """))]
+    # Ids skipped by uq_payer_name_group get their id appended to their name, see qualified_name
+    new_payer_ids += [row[0] for row in db.session.execute(text("""
+        INSERT INTO payers (payer_id, payer_name, pretty_name, group_id)
+        SELECT s.payer_id, left(s.payer_name, 252 - length(s.payer_id)) || ' (' || s.payer_id || ')', s.pretty_name, 'UNKNOWN'
+        FROM staging_payers s
+        WHERE NOT EXISTS (SELECT 1 FROM payers p WHERE p.payer_id = s.payer_id)
+        ON CONFLICT DO NOTHING
+        RETURNING payer_id
+    """))]
+    last_detail_id = db.session.query(func.max(PayerDetail.detail_id)).scalar() or 0
+    inserted = db.session.execute(text("""
+        INSERT INTO payer_details (payer_id, payer_name, state, source, source_row)
+        SELECT s.payer_id, s.payer_name, s.state, s.source, s.source_row
+        FROM staging_payer_details s
+        JOIN payers p ON p.payer_id = s.payer_id
+        ORDER BY s.unit, s.row_index
+        ON CONFLICT (source_row) DO NOTHING
+    """)).rowcount
+    record_changes(CHANGE_GROUP, new_group_ids)
+    record_changes(CHANGE_PAYER, new_payer_ids)
+    record_changes_from(CHANGE_DETAIL, select(PayerDetail.detail_id).where(PayerDetail.detail_id > last_detail_id))
+    return new_payer_ids, inserted
+
+def stage_workbook(cursor, excel_file, first_seen, progress=None):
+    """COPY every sheet of the workbook into the staging tables, returning {sheet_name: rows staged}"""
+    progress = progress or (lambda *args, **kwargs: None)
+    key = file_key(excel_file)
+    sheet_rows = {}
+    for sheet_name, frame in iter_sheet_batches(excel_file):
+        frame = normalize_sheet(frame, sheet_name, key)
+        sheet_rows.setdefault(sheet_name, 0)
+        frame['unit'] = list(sheet_rows).index(sheet_name)
+        frame['row_index'] = frame.index
+        sheet_rows[sheet_name] += len(frame)
+        progress(sum(sheet_rows.values()), phase='staging')
+        
+        dedupe_payers(frame, first_seen)
+        copy_frame(cursor, 'staging_payer_details', frame, STAGING_DETAIL_COLUMNS)
+    return sheet_rows
+
+def bulk_main(excel_file=os.path.join('GoLassie DB', 'Payers.xlsx'), progress=None):
+    """Load the workbook through COPY into staging tables and set-based merges (PostgreSQL only)"""
+    progress = progress or (lambda *args, **kwargs: None)
+    with app.app_context():
+        start = time.perf_counter()
+        cursor = db.session.connection().connection.cursor()
+        last_detail_id = db.session.query(func.max(PayerDetail.detail_id)).scalar() or 0
+        try:
+            create_staging(cursor)
+            progress(0, count_sheet_rows(excel_file), phase='staging')
+            first_seen = {}
+            sheet_rows = stage_workbook(cursor, excel_file, first_seen, progress)
+            rows_read = sum(sheet_rows.values())
+            for sheet_name, count in sheet_rows.items():
+                print(f"Staged {count} rows from sheet: {sheet_name}")
+            
+            progress(rows_read, rows_read, phase='merging')
+            new_payer_ids, inserted = merge_staging(cursor, first_seen)
+            if new_payer_ids:
+                bump_version(PAYERS)
+            if inserted:
+                bump_version(ALIASES)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error in bulk load: {e}")
+            db.session.rollback()
+            print("Changes rolled back due to error.")
+            raise
+        
+        elapsed = time.perf_counter() - start
+        print(f"Read {rows_read} rows, inserted {len(new_payer_ids)} payers and {inserted} details "
+              f"({rows_read - inserted} already loaded or skipped)")
+        print(f"Bulk load took {elapsed:.2f}s ({rows_read / max(elapsed, 1e-9):.0f} rows/sec)")
+        
+        print("Refreshing review candidates...")
+        progress(rows_read, phase='refreshing candidates')
+        refresh_for_payers(new_payer_ids)
+        refresh_candidates(after_id=last_detail_id)
+        print("Data loading complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load payer workbooks into the database")
+    parser.add_argument('--bulk', action='store_true', help="COPY into staging tables and merge (PostgreSQL only)")
+    args = parser.parse_args()
+
+    if args.bulk:
+        bulk_main()
+    else:
+        main()
\ No newline at end of file
@@ -1,17 +1,22 @@
 # scripts/map_payers.py
-import os
-import sys
-from fuzzywuzzy import fuzz
+import argparse
+import random
+import time
 
 
-# Add the root directory to the Python path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from backend.app import app
-from backend.models import db, PayerDetail, Payer
+import bootstrap
+from database import script_app
+from sqlalchemy import func, select
+from models import db, ChangeLog, PayerDetail, Payer, MappingGroup, MappingRun
+from candidates import load_payer_names, refresh_candidates, refresh_for_payers
+from clustering import CLUSTER_MODES, affected_details, cluster_details, load_source_ids, save_members
+from normalization import generate_pretty_name
+from payer_cache import ALIASES, PAYERS, bump_version
+from changes import CHANGE_DETAIL
+from matching import CHUNK_SIZE, batch_greedy_group, greedy_group, rematch
 
+app = script_app()
 
-def get_similarity_score(name1, name2):
-    return fuzz.ratio(name1.lower(), name2.lower())
 
 def commit_session(rows_processed):
     """Commit session with rollback on failure."""
@@ -23,64 +28,243 @@ def commit_session(rows_processed):
         db.session.rollback()
         raise
 
-def map_payers():
+def load_seed():
+    """(groups, founding detail_ids) from earlier runs in creation order, or None when a founding detail has changed since"""
+    rows = db.session.query(MappingGroup, PayerDetail).outerjoin(
+        PayerDetail, PayerDetail.detail_id == MappingGroup.founder_detail_id
+    ).order_by(MappingGroup.position).all()
+    for group, founder in rows:
+        if founder is None or (founder.payer_id, founder.payer_name, founder.state) != \
+                (group.payer_id, group.payer_name, group.state):
+            return None
+    return [(group.payer_id, group.payer_name, group.state) for group, _ in rows], \
+        [group.founder_detail_id for group, _ in rows]
+
+def edited_details(last_run):
+    """Details up to last_run's high-water mark written since it started, other than group founders"""
+    edited = select(ChangeLog.detail_id).where(
+        ChangeLog.entity == CHANGE_DETAIL, ChangeLog.seq > last_run.last_change_seq
+    )
+    return db.session.query(PayerDetail).filter(
+        PayerDetail.detail_id <= last_run.last_detail_id,
+        PayerDetail.detail_id.in_(edited),
+        PayerDetail.detail_id.not_in(select(MappingGroup.founder_detail_id))
+    ).order_by(PayerDetail.detail_id).all()
+
+def next_change_seq(start_seq, own_detail_ids):
+    """change_log seq the next run re-matches edits after: past this run's own writes, short of anyone else's since start_seq"""
+    own = set(own_detail_ids)
+    written = db.session.query(ChangeLog.seq, ChangeLog.detail_id).filter(
+        ChangeLog.entity == CHANGE_DETAIL, ChangeLog.seq > start_seq
+    ).order_by(ChangeLog.seq).yield_per(1000)
+    seq = start_seq
+    for seq, detail_id in written:
+        if detail_id not in own:
+            return seq - 1
+    return seq
+
+def save_groups(payer_groups, seed_size):
+    """Persist the groups this run created so the next incremental run can resume from them"""
+    db.session.bulk_insert_mappings(MappingGroup, [{
+        'position': position,
+        'payer_id': payer_id,
+        'payer_name': payer_name,
+        'state': group[0].state,
+        'founder_detail_id': group[0].detail_id,
+    } for position, ((payer_id, payer_name), group) in enumerate(payer_groups.items()) if position >= seed_size])
+
+def counted(details, progress, start=0):
+    """Iterate details, reporting each one to progress as it is grouped"""
+    for processed, detail in enumerate(details, start + 1):
+        yield detail
+        progress(processed)
+
+def cluster_groups(full=False, rebuild_ids=None, progress=None):
+    """Step 1 with union-find clustering: everything, the clusters new details touch, or those of rebuild_ids"""
+    progress = progress or (lambda *args, **kwargs: None)
+    last_run = db.session.query(MappingRun).order_by(MappingRun.run_id.desc()).first()
+    change_seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0
+    intact = None
+    if rebuild_ids:
+        details, intact = affected_details(rebuild_ids)
+        mode, high_water_mark = None, None
+    elif full or last_run is None or last_run.mode not in CLUSTER_MODES:
+        details = db.session.query(PayerDetail).order_by(PayerDetail.detail_id).all()
+        mode, high_water_mark = 'cluster_full', details[-1].detail_id if details else 0
+    else:
+        new_ids = [detail_id for (detail_id,) in db.session.query(PayerDetail.detail_id).filter(
+            PayerDetail.detail_id > last_run.last_detail_id
+        ).order_by(PayerDetail.detail_id)]
+        details, intact = affected_details(new_ids) if new_ids else ([], [])
+        mode, high_water_mark = 'cluster_incremental', new_ids[-1] if new_ids else last_run.last_detail_id
+    print(f"Clustering {len(details)} details ({mode or 'rebuild'})")
+    progress(0, len(details), 'grouping')
+
+    full_run = mode == 'cluster_full'
+    source_ids = load_source_ids(details, full=full_run)
+    payer_groups = cluster_details(details, source_ids, load_payer_names(), intact=intact)
+    save_members(payer_groups, {d.detail_id: source_id for d, source_id in zip(details, source_ids)}, full=full_run)
+    run = None
+    if mode:
+        run = MappingRun(mode=mode, last_detail_id=high_water_mark, last_change_seq=change_seq,
+                         details_matched=len(details))
+        db.session.add(run)
+    return payer_groups, [], run
+
+def map_payers(batch=False, workers=-1, chunk_size=CHUNK_SIZE, full=False, cluster=False, rebuild_ids=None,
+               progress=None):
+    progress = progress or (lambda *args, **kwargs: None)
     with app.app_context():
         print("Starting payer mapping...")
-        details = db.session.query(PayerDetail).all()
-        
-        payer_groups = {}
-        unmapped = []
+        progress(0, phase='grouping')
+        if cluster or rebuild_ids:
+            start = time.perf_counter()
+            payer_groups, unmapped, run = cluster_groups(full, rebuild_ids, progress)
+            print(f"Clustered into {len(payer_groups)} payers in {time.perf_counter() - start:.2f}s")
+            return apply_groups(payer_groups, unmapped, progress, run)
+
+        last_run = db.session.query(MappingRun).order_by(MappingRun.run_id.desc()).first()
+        change_seq = db.session.query(func.max(ChangeLog.seq)).scalar() or 0  # Edits after this are the next run's
+        # Greedy runs resume only from a greedy run, the groups a clustering run leaves are not a seed
+        loaded = None if full or last_run is None or last_run.mode in CLUSTER_MODES else load_seed()
+        resumable = not full and last_run is not None and last_run.mode not in CLUSTER_MODES
+        if resumable and loaded is None:
+            print("A detail that founded a payer group has changed, falling back to a full run")
+        elif loaded is not None and last_run.last_change_seq is None:
+            print("The last run did not record which edits it saw, falling back to a full run")
+            loaded = None
         
-        # Step 1: Group by payer_id and name similarity
-        for detail in details:
-            matched = False
-            for key in payer_groups:
-                canonical_id, canonical_name = key
-                name_score = get_similarity_score(detail.payer_name, canonical_name)
-                
-                # Match if payer_id matches OR name > 85% and state aligns
-                if (detail.payer_id == canonical_id) or \
-                   (name_score > 85 and (detail.state or None) == payer_groups[key][0].state):
-                    payer_groups[key].append(detail)
-                    matched = True
-                    break
-                elif name_score > 70 and name_score <= 85:
-                    # Flag for manual review
-                    unmapped.append(detail)
-                    matched = True
-                    break
-            
-            if not matched:
-                payer_groups[(detail.payer_id, detail.payer_name)] = [detail]
+        # Edited details already matched are re-matched against the groups founded before them, as a full run would
+        edited, rematched = [], ({}, [])
+        if loaded is not None:
+            edited = edited_details(last_run)
+            rematched = rematch(edited, *loaded) if edited else rematched
+            if rematched is None:
+                print("An edited detail would now found a payer group, falling back to a full run")
+                loaded = None
+        if loaded is None:
+            mode, high_water_mark, seed, edited, rematched = 'full', 0, [], [], ({}, [])
+            db.session.query(MappingGroup).delete()
+        else:
+            mode, high_water_mark, seed = 'incremental', last_run.last_detail_id, loaded[0]
         
-        # Step 2: Update tables
-        rows_processed = 0
-        for (payer_id, canonical_name), group in payer_groups.items():
-            payer = db.session.query(Payer).filter_by(payer_id=payer_id).first()
-            if not payer:
-                payer = Payer(
-                    payer_id=payer_id,
-                    payer_name=canonical_name,
-                    pretty_name=canonical_name,
-                    group_id="UNKNOWN"
-                )
-                db.session.add(payer)
-            
-            for detail in group:
-                detail.payer_id = payer_id
-                rows_processed += 1
-                if rows_processed % 100 == 0:
-                    commit_session(rows_processed)
+        # Details are matched in detail_id order, so resuming after the high-water mark
+        # from the saved groups gives the same result as matching everything again
+        details = db.session.query(PayerDetail).filter(
+            PayerDetail.detail_id > high_water_mark
+        ).order_by(PayerDetail.detail_id).all()
+        print(f"{mode.capitalize()} run: matching {len(details)} details and re-matching {len(edited)} edited ones "
+              f"against {len(seed)} existing groups")
+        progress(len(edited), len(details) + len(edited), 'grouping')
         
-        # Step 3: Log unmapped rows
-        if unmapped:
-            print(f"Flagged {len(unmapped)} rows for manual review:")
-            for detail in unmapped[:5]:
-                print(f" - {detail.payer_name}, {detail.payer_id}, {detail.source}")
+        # Step 1: Group by payer_id and name similarity
+        start = time.perf_counter()
+        if batch:
+            payer_groups, unmapped = batch_greedy_group(details, workers=workers, chunk_size=chunk_size, seed=seed)
+        else:
+            payer_groups, unmapped = greedy_group(counted(details, progress, len(edited)), seed=seed)
+        print(f"Grouped {len(details)} rows into {len(payer_groups)} payers in {time.perf_counter() - start:.2f}s")
+        save_groups(payer_groups, len(seed))
+        for key, group in rematched[0].items():
+            payer_groups[key] = group + payer_groups[key]
+        unmapped = rematched[1] + unmapped
+        run = MappingRun(
+            mode=mode,
+            last_detail_id=details[-1].detail_id if details else high_water_mark,
+            last_change_seq=change_seq,
+            details_matched=len(details) + len(edited)
+        )
+        db.session.add(run)
+        apply_groups(payer_groups, unmapped, progress, run)
+
+def apply_groups(payer_groups, unmapped, progress, run=None):
+    """Steps 2-4: point every detail at its group's payer, creating new payers, then refresh review candidates"""
+    # Step 2: Update tables
+    rows_processed = 0
+    # Only details whose payer_id changes are written, rewriting an unchanged one would log it as an edit
+    moved = [[d for d in group if d.payer_id != payer_id] for (payer_id, _), group in payer_groups.items()]
+    rows_total = sum(map(len, moved))
+    new_payer_ids = []
+    changed_detail_ids = [d.detail_id for group in moved for d in group]
+    for ((payer_id, canonical_name), group), group_moved in zip(payer_groups.items(), moved):
+        if not group:
+            continue  # Seeded group with no new details
+        payer = db.session.query(Payer).filter_by(payer_id=payer_id).first()
+        if not payer:
+            payer = Payer(
+                payer_id=payer_id,
+                payer_name=canonical_name,
+                pretty_name=generate_pretty_name(canonical_name),
+                group_id="UNKNOWN"
+            )
+            db.session.add(payer)
+            new_payer_ids.append(payer_id)
         
-        commit_session(rows_processed)
-        print(f"Total rows mapped: {rows_processed}")
-        print("Mapping complete!")
+        for detail in group_moved:
+            detail.payer_id = payer_id
+            rows_processed += 1
+            progress(rows_processed, rows_total, 'mapping')
+            if rows_processed % 100 == 0:
+                commit_session(rows_processed)
+    
+    # Step 3: Log unmapped rows
+    if unmapped:
+        print(f"Flagged {len(unmapped)} rows for manual review:")
+        for detail in unmapped[:5]:
+            print(f" - {detail.payer_name}, {detail.payer_id}, {detail.source}")
+    
+    if new_payer_ids:
+        bump_version(PAYERS)
+    if changed_detail_ids:  # Moved details change the aliases
+        bump_version(ALIASES)
+    commit_session(rows_processed)
+    if run is not None:
+        # The details this run moved are not edits for the next run to re-match
+        run.last_change_seq = next_change_seq(run.last_change_seq, changed_detail_ids)
+        db.session.commit()
+    print(f"Total rows mapped: {rows_processed}")
+    
+    # Step 4: Refresh the review candidate index incrementally
+    progress(rows_processed, rows_total, 'refreshing candidates')
+    refresh_for_payers(new_payer_ids)
+    refreshed = refresh_candidates(changed_detail_ids)
+    print(f"Refreshed {refreshed} review candidates")
+    print("Mapping complete!")
+
+def benchmark(count, workers, chunk_size):
+    """Time the per-pair engine against batched cdist scoring on synthetic details"""
+    from check_matching_parity import synthetic_details
+
+    details = synthetic_details(count, random.Random(7))
+    print(f"Benchmarking {count} synthetic details...")
+    start = time.perf_counter()
+    expected = greedy_group(details)
+    print(f"Before (per-pair scoring): {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    actual = batch_greedy_group(details, workers=workers, chunk_size=chunk_size)
+    print(f"After (cdist, workers={workers}, chunk_size={chunk_size}): {time.perf_counter() - start:.2f}s")
+
+    def summarize(result):
+        payer_groups, unmapped = result
+        return {k: [d.detail_id for d in g] for k, g in payer_groups.items()}, [d.detail_id for d in unmapped]
+
+    print("Results match" if summarize(expected) == summarize(actual) else "WARNING: results differ")
 
 if __name__ == "__main__":
-    map_payers()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Group payer details into canonical payers")
+    parser.add_argument('--full', action='store_true', help="Re-match every detail instead of only new ones")
+    parser.add_argument('--batch', action='store_true', help="Score with RapidFuzz cdist score matrices")
+    parser.add_argument('--workers', type=int, default=-1, help="cdist worker threads (-1 uses every core)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Detail rows scored per matrix")
+    parser.add_argument('--cluster', action='store_true',
+                        help="Cluster with union-find over payer_id and name links instead of first-match grouping")
+    parser.add_argument('--rebuild', type=int, nargs='+', metavar='DETAIL_ID',
+                        help="Re-cluster only the clusters these details are in or now link into")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="Time both modes on N synthetic details and exit")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers, args.chunk_size)
+    else:
+        map_payers(batch=args.batch, workers=args.workers, chunk_size=args.chunk_size, full=args.full,
+                   cluster=args.cluster, rebuild_ids=args.rebuild)
\ No newline at end of file
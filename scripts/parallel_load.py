@@ -0,0 +1,182 @@
+# scripts/parallel_load.py
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl import load_workbook
+from sqlalchemy import func
+
+import bootstrap
+
+from models import db, PayerDetail
+from database import script_app
+from candidates import refresh_candidates, refresh_for_payers
+from payer_cache import ALIASES, PAYERS, bump_version
+from load_data import (
+    BATCH_ROWS, IGNORE_SHEETS, STAGING_DETAIL_COLUMNS, copy_frame, create_staging, dedupe_payers, file_key,
+    iter_csv_batches, iter_sheet_batches, merge_staging, normalize_sheet
+)
+
+app = script_app()
+
+
+def discover_units(path):
+    """List (path, sheet_name, key) work units: one per workbook sheet, one per CSV file (sheet_name None).
+
+    key is the file_key of the unit's file, so rows of different files never share a source_row.
+    """
+    files = [path] if os.path.isfile(path) else [
+        os.path.join(path, name) for name in sorted(os.listdir(path))
+    ]
+    units = []
+    for file_path in files:
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension in ('.xlsx', '.xlsm'):
+            workbook = load_workbook(file_path, read_only=True)
+            sheets = [sheet for sheet in workbook.sheetnames if sheet not in IGNORE_SHEETS]
+            workbook.close()
+            key = file_key(file_path)
+            units.extend((file_path, sheet, key) for sheet in sheets)
+        elif extension == '.csv':
+            units.append((file_path, None, file_key(file_path)))
+    return units
+
+def hand_off(batches, stop, message):
+    """Put message on the bounded queue, waiting while the writer is behind. False once the writer has stopped"""
+    while not stop.is_set():
+        try:
+            batches.put(message, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def drain(batches):
+    while True:
+        try:
+            batches.get_nowait()
+        except queue.Empty:
+            return
+
+def parse_unit(unit, path, sheet_name, key, batches, stop, batch_size):
+    """Worker: parse and normalize one sheet or CSV file, handing batches to the writer until it stops"""
+    start = time.perf_counter()
+    rows = 0
+    try:
+        source_batches = iter_csv_batches(path, batch_size) if sheet_name is None else \
+            iter_sheet_batches(path, batch_size, sheet_names=[sheet_name])
+        for source, frame in source_batches:
+            frame = normalize_sheet(frame, source, key)
+            frame['unit'] = unit
+            frame['row_index'] = frame.index
+            rows += len(frame)
+            if not hand_off(batches, stop, ('batch', unit, frame)):
+                return
+        hand_off(batches, stop, ('done', unit, rows, time.perf_counter() - start))
+    except Exception as e:
+        hand_off(batches, stop, ('error', unit, f"{type(e).__name__}: {e}"))
+
+def parallel_main(path, workers, batch_size=BATCH_ROWS, queue_size=None):
+    """Parse units in a process pool, dedupe payer ids centrally and COPY through a single writer"""
+    units = discover_units(path)
+    if not units:
+        print(f"No workbooks or CSV files found at {path}")
+        return
+    # Sheets of different workbooks in a directory can share a name
+    labels = [f"{os.path.basename(file_path)}:{sheet_name}" if sheet_name and os.path.isdir(path)
+              else sheet_name or os.path.basename(file_path) for file_path, sheet_name, _ in units]
+    print(f"Loading {len(units)} sheets/files with {workers} workers...")
+
+    with app.app_context(), multiprocessing.Manager() as manager:
+        start = time.perf_counter()
+        batches = manager.Queue(maxsize=queue_size or workers * 2)
+        stop = manager.Event()
+        cursor = db.session.connection().connection.cursor()
+        last_detail_id = db.session.query(func.max(PayerDetail.detail_id)).scalar() or 0
+        timings = {unit: {'rows': 0, 'parse': 0.0, 'write': 0.0} for unit in range(len(units))}
+        first_seen = {}
+        failed = []
+        try:
+            create_staging(cursor)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(parse_unit, unit, file_path, sheet_name, key, batches, stop, batch_size)
+                    for unit, (file_path, sheet_name, key) in enumerate(units)
+                ]
+                try:
+                    pending = len(units)
+                    while pending:
+                        try:
+                            message = batches.get(timeout=1)
+                        except queue.Empty:
+                            if all(f.done() for f in futures) and batches.empty():
+                                raise RuntimeError("A worker exited without reporting")
+                            continue
+                        kind, unit = message[0], message[1]
+                        if kind == 'batch':
+                            write_start = time.perf_counter()
+                            frame = message[2]
+                            dedupe_payers(frame, first_seen)
+                            copy_frame(cursor, 'staging_payer_details', frame, STAGING_DETAIL_COLUMNS)
+                            timings[unit]['write'] += time.perf_counter() - write_start
+                        elif kind == 'done':
+                            pending -= 1
+                            timings[unit]['rows'], timings[unit]['parse'] = message[2], message[3]
+                            print(f"Parsed {labels[unit]}: {message[2]} rows in {message[3]:.2f}s")
+                        else:
+                            pending -= 1
+                            failed.append(labels[unit])
+                            print(f"Error parsing {labels[unit]}: {message[2]}")
+                except BaseException:
+                    # Leaving the pool waits for its workers, so release any blocked on the full queue first
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    drain(batches)
+                    raise
+
+            if failed:
+                raise RuntimeError(f"{len(failed)} sheets/files failed to parse")
+            new_payer_ids, inserted = merge_staging(cursor, first_seen)
+            if new_payer_ids:
+                bump_version(PAYERS)
+            if inserted:
+                bump_version(ALIASES)
+            db.session.commit()
+        except KeyboardInterrupt:
+            db.session.rollback()
+            print("Interrupted, changes rolled back.")
+            raise
+        except Exception as e:
+            print(f"Error in parallel load: {e}")
+            db.session.rollback()
+            print("Changes rolled back due to error.")
+            return
+
+        elapsed = time.perf_counter() - start
+        rows_read = sum(t['rows'] for t in timings.values())
+        print(f"{'Sheet/file':<30} {'Rows':>8} {'Parse s':>8} {'Write s':>8}")
+        for unit, timing in timings.items():
+            print(f"{labels[unit][:30]:<30} {timing['rows']:>8} {timing['parse']:>8.2f} {timing['write']:>8.2f}")
+        print(f"Read {rows_read} rows, inserted {len(new_payer_ids)} payers and {inserted} details "
+              f"({rows_read - inserted} already loaded or skipped)")
+        print(f"Parallel load took {elapsed:.2f}s ({rows_read / max(elapsed, 1e-9):.0f} rows/sec)")
+
+        print("Refreshing review candidates...")
+        refresh_for_payers(new_payer_ids)
+        refresh_candidates(after_id=last_detail_id)
+        print("Data loading complete!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load payer workbooks and CSV exports in parallel (PostgreSQL only)")
+    parser.add_argument('path', nargs='?', default=os.path.join('GoLassie DB', 'Payers.xlsx'),
+                        help="Workbook, CSV file or directory of them")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Parser processes")
+    parser.add_argument('--batch-size', type=int, default=BATCH_ROWS, help="Rows per batch handed to the writer")
+    parser.add_argument('--queue-size', type=int, help="Batches buffered before parsers block (default 2 per worker)")
+    args = parser.parse_args()
+
+    parallel_main(args.path, args.workers, args.batch_size, args.queue_size)
\ No newline at end of file
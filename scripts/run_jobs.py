@@ -0,0 +1,17 @@
+# scripts/run_jobs.py
+import bootstrap
+
+from database import script_app
+from jobs import JobRunner
+
+app = script_app()
+
+def main():
+    """Start jobs queued through /api/jobs, as the deployment's one job runner"""
+    runner = JobRunner(app, app.config['JOB_POLL_SECONDS'])
+    print(f"Running queued jobs, checking every {runner.poll_seconds:g}s")
+    runner.dispatch()
+    runner.poll()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# scripts/synthetic_data.py
+import argparse
+import csv
+import os
+import random
+from openpyxl import Workbook
+
+BRANDS = [
+    'Delta Dental', 'Cigna', 'Aetna', 'MetLife', 'Guardian', 'United Concordia', 'Humana', 'Blue Cross Blue Shield',
+    'Principal', 'Ameritas', 'DentaQuest', 'Liberty Dental', 'Careington', 'Renaissance', 'GEHA', 'Sun Life',
+    'UnitedHealthcare', 'Anthem', 'Lincoln Financial', 'Dominion', 'Solstice', 'Avesis', 'Envolve', 'Skygen',
+]
+PRODUCT_LINES = ['Dental', 'Dental Plan', 'Insurance Company', 'Life Insurance', 'Benefit Providers', 'Health Plans']
+STATES = {
+    'AZ': 'Arizona', 'CA': 'California', 'CO': 'Colorado', 'FL': 'Florida', 'GA': 'Georgia', 'IL': 'Illinois',
+    'KY': 'Kentucky', 'MI': 'Michigan', 'NJ': 'New Jersey', 'NY': 'New York', 'OH': 'Ohio', 'PA': 'Pennsylvania',
+    'TX': 'Texas', 'VA': 'Virginia', 'WA': 'Washington', 'WI': 'Wisconsin',
+}
+CORPORATE_SUFFIXES = ['Inc', 'LLC', 'Corporation', 'Services', 'Plans', 'Administrators']
+NOTES = ['ERA', 'Claims', 'PPO', 'DHMO', 'Medicaid', 'Commercial', 'Encounters']
+SOURCES = ['Vyne', 'Availity', 'Change Healthcare', 'Trizetto', 'DentalXChange']
+
+
+def canonical_payers(count, rng):
+    """(payer_id, payer_name, state) for count distinct canonical payers"""
+    payers, seen = [], set()
+    while len(payers) < count:
+        brand, line = rng.choice(BRANDS), rng.choice(PRODUCT_LINES)
+        state = rng.choice(list(STATES)) if rng.random() < 0.6 else None
+        name = f"{brand} {line} of {STATES[state]}" if state else f"{brand} {line}"
+        if name in seen:
+            name = f"{name} {len(payers)}"
+        seen.add(name)
+        payer_id = f"{rng.randrange(10000, 99999)}" if rng.random() < 0.7 else \
+            f"{brand[:2].upper()}{state or 'US'}{len(payers)}"
+        payers.append((f"{payer_id}{len(payers)}", name, state))
+    return payers
+
+def typo(name, rng):
+    """Drop, swap, double or replace one letter"""
+    if len(name) < 5:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    kind = rng.random()
+    if kind < 0.3:
+        return name[:i] + name[i + 1:]
+    if kind < 0.6:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    if kind < 0.8:
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i + 1:]
+
+def raw_name(name, state, rng):
+    """A canonical name as it shows up in ERA exports: suffixes, notes, state tags, typos and odd casing"""
+    if rng.random() < 0.25:
+        name = f"{name} {rng.choice(CORPORATE_SUFFIXES)}"
+    if rng.random() < 0.2:
+        name = f"{name} ({rng.choice(NOTES)})"
+    if state and rng.random() < 0.2:
+        name = f"{name}, {state}" if rng.random() < 0.5 else f"{name} - {state}"
+    if rng.random() < 0.15:
+        name = typo(name, rng)
+    casing = rng.random()
+    if casing < 0.2:
+        name = name.upper()
+    elif casing < 0.25:
+        name = name.lower()
+    return name
+
+def synthetic_rows(details, seed=7, payers=None):
+    """(payers, rows): canonical payers and details rows with payer_id, payer_name, state and source.
+
+    Payer popularity is long-tailed like real clearinghouse data. Some rows
+    carry no payer ID, and some carry a clearinghouse-specific one.
+    """
+    rng = random.Random(seed)
+    payers = canonical_payers(payers or max(50, details // 20), rng)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(payers))]
+    rows = []
+    for payer_id, name, state in rng.choices(payers, weights=weights, k=details):
+        id_kind = rng.random()
+        if id_kind < 0.05:
+            payer_id = ''
+        elif id_kind < 0.15:
+            payer_id = f"{payer_id}{rng.choice('ABC')}"
+        rows.append({
+            'payer_id': payer_id,
+            'payer_name': raw_name(name, state, rng),
+            'state': state if state and rng.random() < 0.8 else '',
+            'source': rng.choice(SOURCES),
+        })
+    return payers, rows
+
+def write_workbook(path, rows):
+    """One sheet per source with the export headers load_data understands"""
+    workbook = Workbook(write_only=True)
+    for source in SOURCES:
+        sheet = workbook.create_sheet(source)
+        sheet.append(['Payer ID', 'Payer Name', 'State'])
+        for row in rows:
+            if row['source'] == source:
+                sheet.append([row['payer_id'] or None, row['payer_name'], row['state'] or None])
+    workbook.save(path)
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Payer ID', 'Payer Name', 'State'])
+        for row in rows:
+            writer.writerow([row['payer_id'], row['payer_name'], row['state']])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate realistic synthetic payer exports")
+    parser.add_argument('output', help="Workbook (.xlsx) or CSV file to write")
+    parser.add_argument('--details', type=int, default=1000, help="Payer detail rows to generate")
+    parser.add_argument('--payers', type=int, help="Canonical payers (default details / 20)")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    payers, rows = synthetic_rows(args.details, args.seed, args.payers)
+    if os.path.splitext(args.output)[1].lower() == '.csv':
+        write_csv(args.output, rows)
+    else:
+        write_workbook(args.output, rows)
+    print(f"Wrote {len(rows)} details for {len(payers)} payers to {args.output}")
\ No newline at end of file